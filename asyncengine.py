@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+""" asyncengine.py
+
+ asyncio download engine, an alternative to the thread pool of opendata-downloader.py
+
+ A thread per concurrent request stops scaling at a few dozen requests. Here a single
+ event loop drives thousands of non-blocking requests over a minimal HTTP/1.1 client
+ with keep-alive connections, the number of requests in flight is capped by a semaphore.
+"""
+
+import asyncio
+import concurrent.futures
+import email.parser
+import http.client
+import ssl
+import time
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+import concurrency
+from partfile import ResumeError
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+RESUMABLE_ERRORS = (ConnectionError, TimeoutError, asyncio.TimeoutError,
+                    http.client.IncompleteRead, ResumeError)
+
+
+class AsyncResponse(object):
+    """Response of an AsyncConnectionPool request, the body is read with await read(n)"""
+
+    def __init__(self, pool, key, reader, writer, status, reason, headers, url, method):
+        self._pool = pool
+        self._key = key
+        self._reader = reader
+        self._writer = writer
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.url = url
+        self._chunked = headers.get("Transfer-Encoding", "").lower() == "chunked"
+        self._willClose = headers.get("Connection", "").lower() == "close"
+        self._chunkLeft = 0
+        self._done = False
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            self._remaining = 0
+        elif self._chunked:
+            self._remaining = None
+        elif headers.get("Content-Length") is not None:
+            self._remaining = int(headers.get("Content-Length"))
+        else:
+            # body is delimited by the server closing the connection
+            self._remaining = None
+            self._willClose = True
+        if self._remaining == 0:
+            self._done = True
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    async def _read(self, amt):
+        # a stalled connection fails like a socket timeout of the thread engine
+        return await asyncio.wait_for(self._reader.read(amt), self._pool.timeout)
+
+    async def _readline(self):
+        return await asyncio.wait_for(self._reader.readline(), self._pool.timeout)
+
+    async def _readChunked(self, amt):
+        if self._chunkLeft == 0:
+            line = await self._readline()
+            size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # skip trailers
+                while (await self._readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                self._done = True
+                return b""
+            self._chunkLeft = size
+        data = await self._read(min(amt, self._chunkLeft))
+        if not data:
+            raise http.client.IncompleteRead(b"")
+        self._chunkLeft -= len(data)
+        if self._chunkLeft == 0:
+            await self._readline()
+        return data
+
+    async def read(self, amt=65536):
+        """Returns up to amt bytes of the body, b'' once the body has been read completely"""
+        if self._done:
+            return b""
+        if self._chunked:
+            return await self._readChunked(amt)
+        if self._remaining is None:
+            data = await self._read(amt)
+            if not data:
+                self._done = True
+            return data
+        data = await self._read(min(amt, self._remaining))
+        if not data:
+            raise http.client.IncompleteRead(b"", self._remaining)
+        self._remaining -= len(data)
+        if self._remaining == 0:
+            self._done = True
+        return data
+
+    def release(self):
+        if self._writer is None:
+            return
+        writer, self._writer = self._writer, None
+        self._pool._release(self._key, self._reader, writer, self._done and not self._willClose)
+
+
+class AsyncConnectionPool(object):
+    """Keep-alive HTTP/1.1 connections for asyncio, limited per host
+
+    Connecting, sending and every read of a response time out after timeout seconds.
+    """
+
+    def __init__(self, maxConnectionsPerHost=100, timeout=60, sslContext=None):
+        self.maxConnectionsPerHost = max(1, maxConnectionsPerHost)
+        self.timeout = timeout
+        self.sslContext = sslContext or ssl.create_default_context()
+        self._idle = {}
+        self._slots = {}
+
+    def _slot(self, key):
+        if key not in self._slots:
+            self._slots[key] = asyncio.BoundedSemaphore(self.maxConnectionsPerHost)
+        return self._slots[key]
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port,
+                                    ssl=self.sslContext if scheme == "https" else None),
+            self.timeout)
+
+    def _release(self, key, reader, writer, reusable):
+        if reusable and not writer.is_closing():
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+        self._slot(key).release()
+
+    async def _sendRequest(self, reader, writer, method, target, host, headers):
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {host}",
+                 "Accept-Encoding: identity", "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await asyncio.wait_for(writer.drain(), self.timeout)
+        statusLine = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not statusLine:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        _, status, reason = (statusLine.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+        headerLines = []
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            headerLines.append(line)
+        headers = email.parser.Parser(_class=http.client.HTTPMessage).parsestr(
+            b"".join(headerLines).decode("latin-1"))
+        return int(status), reason, headers
+
+    async def _request(self, url, headers, method):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+
+        slot = self._slot(key)
+        await slot.acquire()
+        writer = None
+        try:
+            idle = self._idle.get(key)
+            reused = bool(idle)
+            reader, writer = idle.pop() if idle else await self._connect(key)
+            try:
+                status, reason, responseHeaders = await self._sendRequest(
+                    reader, writer, method, target, parts.netloc, headers)
+            except (http.client.RemoteDisconnected, ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused:
+                    raise
+                # the server closed an idle keep-alive connection, retry once on a fresh one
+                reader, writer = await self._connect(key)
+                status, reason, responseHeaders = await self._sendRequest(
+                    reader, writer, method, target, parts.netloc, headers)
+        except BaseException:
+            # also on timeouts and TLS errors, the connection is in an unknown state
+            if writer is not None:
+                writer.close()
+            slot.release()
+            raise
+        return AsyncResponse(self, key, reader, writer, status, reason, responseHeaders, url, method)
+
+    async def urlopen(self, url, headers=None, method="GET"):
+        """Sends a request and returns an AsyncResponse, raises HTTPError for status codes >= 400"""
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._request(url, headers, method)
+            if response.status in REDIRECT_CODES and response.getheader("Location"):
+                location = urljoin(url, response.getheader("Location"))
+                while await response.read():
+                    pass
+                response.release()
+                url = location
+                continue
+            if response.status >= 400:
+                while await response.read():
+                    pass
+                response.release()
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+            return response
+        raise HTTPError(url, response.status, "too many redirects", response.headers, None)
+
+    def close(self):
+        for connections in self._idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self._idle = {}
+
+
+class _AdaptiveGate(object):
+    """Waits for a concurrency.AdaptiveConcurrency limit on the event loop"""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: self.controller.inFlight < self.controller.currentLimit)
+            self.controller.inFlight += 1
+        return time.monotonic()
+
+    async def release(self, token, outcome, nbytes):
+        self.controller.inFlight -= 1
+        self.controller.record(time.monotonic() - token, outcome, nbytes)
+        async with self.condition:
+            self.condition.notify_all()
+
+
+def _checkCancelled(cancelEvent, url):
+    if cancelEvent is not None and cancelEvent.is_set():
+        raise concurrent.futures.CancelledError(url)
+
+
+async def _download(pool, semaphore, gate, loop, url, target, bufferSize, resumeAttempts, cancelEvent):
+    async with semaphore:
+        for attempt in range(resumeAttempts + 1):
+            _checkCancelled(cancelEvent, url)
+            token = await gate.acquire() if gate else None
+            outcome, nbytes = concurrency.IGNORED, 0
+            try:
+                headers = target.requestHeaders()
+                if headers is None:
+                    # complete from an earlier attempt
+                    await loop.run_in_executor(None, target.begin)
+                else:
+                    response = await pool.urlopen(url, headers=headers)
+                    try:
+                        await loop.run_in_executor(None, target.begin, response.status, response.headers)
+                        while True:
+                            chunk = await response.read(bufferSize)
+                            if not chunk:
+                                break
+                            nbytes += len(chunk)
+                            # decompressing is CPU-bound, keep it off the event loop
+                            await loop.run_in_executor(None, target.write, chunk)
+                    finally:
+                        response.release()
+                result = await loop.run_in_executor(None, target.finish)
+                outcome = concurrency.OK
+                return result
+            except RESUMABLE_ERRORS:
+                outcome = concurrency.ERROR
+                target.abort()
+                if attempt == resumeAttempts:
+                    raise
+            except HTTPError as e:
+                outcome = concurrency.classifyHttpStatus(e.code)
+                target.abort()
+                raise
+            except BaseException:
+                target.abort()
+                raise
+            finally:
+                if token is not None:
+                    await gate.release(token, outcome, nbytes)
+
+
+async def _downloadAll(jobs, onResult, maxConcurrency, connectionsPerHost, bufferSize, resumeAttempts,
+                       controller, retryDelay, cancelEvent):
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(maxConcurrency)
+    gate = _AdaptiveGate(controller) if controller else None
+    pool = AsyncConnectionPool(maxConnectionsPerHost=connectionsPerHost or maxConcurrency)
+
+    async def run(job):
+        url, target = job
+        attempts = {}
+        while True:
+            try:
+                result = await _download(pool, semaphore, gate, loop, url, target, bufferSize, resumeAttempts,
+                                         cancelEvent)
+                onResult(job, result, None)
+                return
+            except Exception as e:
+                delay = retryDelay(e, attempts) if retryDelay else None
+                if delay is None:
+                    onResult(job, None, e)
+                    return
+            # waiting for the retry does not hold a slot of the semaphore, a cancellation
+            # is noticed within a second
+            deadline = loop.time() + delay
+            while loop.time() < deadline and not (cancelEvent and cancelEvent.is_set()):
+                await asyncio.sleep(min(1, deadline - loop.time()))
+
+    try:
+        await asyncio.gather(*[run(job) for job in jobs])
+    finally:
+        pool.close()
+
+
+def downloadAll(jobs, onResult, maxConcurrency=1000, connectionsPerHost=None,
+                bufferSize=1024 * 1024, resumeAttempts=3, controller=None, retryDelay=None, cancelEvent=None):
+    """Downloads all (url, target) jobs on an asyncio event loop
+
+    The target receives the response: requestHeaders() returns the headers to send (None if
+    nothing is left to download), begin(status, headers), write(chunk) and finish() are
+    called with the body, abort() after a failed attempt. Interrupted transfers are
+    resumed up to resumeAttempts times. A concurrency.AdaptiveConcurrency controller further
+    limits the requests in flight below maxConcurrency.
+    A failed job is tried again after retryDelay(exception, attempts) seconds, attempts is a
+    dict kept per job for the callback; a return value of None gives up.
+    Once the threading.Event cancelEvent is set, the jobs that have not started fail with
+    concurrent.futures.CancelledError, the target stops running transfers from write().
+    onResult(job, result of target.finish(), exception) is called for every job as it completes.
+    """
+    asyncio.run(_downloadAll(jobs, onResult, maxConcurrency, connectionsPerHost,
+                             bufferSize, resumeAttempts, controller, retryDelay, cancelEvent))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+""" concurrency.py
+
+ Adaptive limit for the number of requests in flight.
+
+ A fixed number of workers is too low on a fast link and too high when the server starts
+ throttling. AdaptiveConcurrency adjusts the limit AIMD-style (additive increase,
+ multiplicative decrease) between minLimit and maxLimit:
+
+ * every successful request adds 1/limit, i.e. the limit grows by one per round of
+   limit requests, as long as the request latency stays within latencyTolerance times
+   the lowest latency seen so far. Until the first decrease every successful request
+   adds 1 (slow start), so the limit doubles per round.
+ * a throttled request (429/503) or a failed request (connection error, timeout, 5xx)
+   multiplies the limit by backoffFactor, at most once per smoothed latency so a burst
+   of failures from one congested round does not collapse the limit to minLimit
+"""
+
+import threading
+import time
+
+OK = "ok"
+THROTTLED = "throttled"
+ERROR = "error"
+IGNORED = "ignored"
+
+
+def classifyHttpStatus(status):
+    if status in (429, 503):
+        return THROTTLED
+    if status >= 500:
+        return ERROR
+    # e.g. 404, says nothing about the load on the server
+    return IGNORED
+
+
+class AdaptiveConcurrency(object):
+
+    def __init__(self, minLimit=1, maxLimit=20, initialLimit=None,
+                 backoffFactor=0.5, latencyTolerance=2.0, smoothing=0.2):
+        self.minLimit = max(1, minLimit)
+        self.maxLimit = max(self.minLimit, maxLimit)
+        self.limit = float(min(self.maxLimit, max(self.minLimit, initialLimit or self.minLimit)))
+        self.backoffFactor = backoffFactor
+        self.latencyTolerance = latencyTolerance
+        self.smoothing = smoothing
+        self.inFlight = 0
+        self.latency = None
+        self.baseLatency = None
+        self.lastDecrease = 0.0
+        self.startTime = time.monotonic()
+        self.counts = {OK: 0, THROTTLED: 0, ERROR: 0, IGNORED: 0}
+        self.bytes = 0
+        self.peakLimit = self.limit
+        self.slowStart = True
+        self._condition = threading.Condition()
+
+    @property
+    def currentLimit(self):
+        return int(self.limit)
+
+    def record(self, latency, outcome, nbytes=0):
+        """Adjusts the limit to the outcome of a finished request"""
+        with self._condition:
+            now = time.monotonic()
+            self.counts[outcome] += 1
+            self.bytes += nbytes
+            if outcome == OK:
+                self.latency = latency if self.latency is None else \
+                    self.smoothing * latency + (1 - self.smoothing) * self.latency
+                self.baseLatency = self.latency if self.baseLatency is None else \
+                    min(self.baseLatency, self.latency)
+                if self.latency <= self.latencyTolerance * self.baseLatency:
+                    increase = 1.0 if self.slowStart else 1.0 / self.limit
+                    self.limit = min(self.maxLimit, self.limit + increase)
+            elif outcome in (THROTTLED, ERROR):
+                if now - self.lastDecrease >= (self.latency or 0.0):
+                    self.limit = max(self.minLimit, self.limit * self.backoffFactor)
+                    self.lastDecrease = now
+                    self.slowStart = False
+            self.peakLimit = max(self.peakLimit, self.limit)
+            self._condition.notify_all()
+
+    def acquire(self):
+        """Blocks until another request may be sent, returns a token for release()"""
+        with self._condition:
+            while self.inFlight >= self.currentLimit:
+                self._condition.wait()
+            self.inFlight += 1
+        return time.monotonic()
+
+    def release(self, token, outcome, nbytes=0):
+        with self._condition:
+            self.inFlight -= 1
+        self.record(time.monotonic() - token, outcome, nbytes)
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.startTime, 1e-9)
+        return {"limit": self.currentLimit,
+                "peakLimit": int(self.peakLimit),
+                "requests": sum(self.counts.values()),
+                "throttled": self.counts[THROTTLED],
+                "errors": self.counts[ERROR],
+                "throughput": self.bytes / elapsed,
+                "latency": self.latency}
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+""" connectionpool.py
+
+ Keep-alive HTTP(S) connection pool shared by all download workers.
+
+ urllib.request.urlopen() opens a new TCP connection (and performs a full TLS
+ handshake) for every file. For the thousands of small files of a model-level
+ download this handshake latency dominates the wall-clock time, so connections
+ are kept open and handed from one worker to the next instead. TLS sessions are
+ remembered per host and offered on every new connection, so even connections
+ that have to be re-established can use an abbreviated handshake.
+"""
+
+import http.client
+import ssl
+import threading
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class _HTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection offering a previously negotiated TLS session for resumption"""
+
+    def __init__(self, host, port=None, tlsSession=None, **kwargs):
+        super(_HTTPSConnection, self).__init__(host, port, **kwargs)
+        self.tlsSession = tlsSession
+
+    def connect(self):
+        # plain TCP connect (and CONNECT tunnel through a proxy, if configured)
+        http.client.HTTPConnection.connect(self)
+        serverHostname = self._tunnel_host if self._tunnel_host else self.host
+        try:
+            self.sock = self._context.wrap_socket(self.sock,
+                                                  server_hostname=serverHostname,
+                                                  session=self.tlsSession)
+        except ssl.SSLError:
+            if self.tlsSession is None:
+                raise
+            # the server refused the cached session, do a full handshake
+            self.tlsSession = None
+            self.sock.close()
+            http.client.HTTPConnection.connect(self)
+            self.sock = self._context.wrap_socket(self.sock,
+                                                  server_hostname=serverHostname)
+
+
+class PooledResponse(object):
+    """Wraps a http.client.HTTPResponse and returns its connection to the pool when closed"""
+
+    def __init__(self, pool, key, connection, response, url):
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self._response.read(amt)
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        self._pool._release(self._key, connection, self._response)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of persistent HTTP(S) connections, limited per host
+
+    urlopen() blocks while maxConnectionsPerHost responses for the same host are open.
+    Responses must be closed (or used as a context manager) to hand their connection back.
+    """
+
+    def __init__(self, maxConnectionsPerHost=10, timeout=60, proxies=None, sslContext=None):
+        self.maxConnectionsPerHost = max(1, maxConnectionsPerHost)
+        self.timeout = timeout
+        self.proxies = {}
+        for scheme, proxy in (proxies or {}).items():
+            if "://" not in proxy:
+                proxy = "http://" + proxy
+            self.proxies[scheme] = urlsplit(proxy)
+        # created on the first https connection, loading the CA certificates takes a while
+        self._sslContext = sslContext
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+        self._tlsSessions = {}
+
+    @property
+    def sslContext(self):
+        with self._lock:
+            if self._sslContext is None:
+                self._sslContext = ssl.create_default_context()
+            return self._sslContext
+
+    def _slot(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.maxConnectionsPerHost)
+            return self._slots[key]
+
+    def _newConnection(self, key):
+        scheme, host, port = key
+        proxy = self.proxies.get(scheme)
+        if scheme == "https":
+            if proxy:
+                connection = _HTTPSConnection(proxy.hostname, proxy.port or 8080,
+                                              tlsSession=self._tlsSessions.get(key),
+                                              timeout=self.timeout, context=self.sslContext)
+                connection.set_tunnel(host, port)
+            else:
+                connection = _HTTPSConnection(host, port,
+                                              tlsSession=self._tlsSessions.get(key),
+                                              timeout=self.timeout, context=self.sslContext)
+        elif proxy:
+            connection = http.client.HTTPConnection(proxy.hostname, proxy.port or 8080,
+                                                    timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        return connection
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._newConnection(key), False
+
+    def _release(self, key, connection, response):
+        try:
+            if response.isclosed() and not response.will_close and connection.sock is not None:
+                sock = connection.sock
+                if getattr(sock, "session", None) is not None:
+                    self._tlsSessions[key] = sock.session
+                with self._lock:
+                    self._idle.setdefault(key, []).append(connection)
+            else:
+                connection.close()
+        finally:
+            self._slot(key).release()
+
+    def _request(self, url, headers, method):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        if scheme == "http" and scheme in self.proxies:
+            target = url
+
+        slot = self._slot(key)
+        slot.acquire()
+        connection = None
+        try:
+            connection, reused = self._acquire(key)
+            try:
+                connection.request(method, target, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError, BrokenPipeError):
+                connection.close()
+                if not reused:
+                    raise
+                # the server closed an idle keep-alive connection, retry once on a fresh one
+                connection = self._newConnection(key)
+                connection.request(method, target, headers=headers)
+                response = connection.getresponse()
+        except BaseException:
+            # also on timeouts and TLS errors, the connection is in an unknown state
+            if connection is not None:
+                connection.close()
+            slot.release()
+            raise
+        return PooledResponse(self, key, connection, response, url)
+
+    def urlopen(self, url, headers=None, method="GET"):
+        """Sends a request and returns a PooledResponse, raises HTTPError for status codes >= 400"""
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._request(url, headers, method)
+            if response.status in REDIRECT_CODES and response.getheader("Location"):
+                location = urljoin(url, response.getheader("Location"))
+                response.read()
+                response.close()
+                url = location
+                continue
+            if response.status >= 400:
+                response.read()
+                response.close()
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+            return response
+        raise HTTPError(url, response.status, "too many redirects", response.headers, None)
+
+    def close(self):
+        """Closes all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
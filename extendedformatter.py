@@ -27,4 +27,51 @@ class ExtendedFormatter(Formatter):
         super(ExtendedFormatter, self).convert_field(value, conversion)
 
         # return for None case
-        return value
\ No newline at end of file
+        return value
+
+    def compile(self, format_string):
+        """ Parse format_string once, returns a CompiledFormat
+
+        format(format_string, **kwargs) parses the template on every call, the CompiledFormat
+        only converts and formats the fields.
+        """
+        return CompiledFormat(self, list(self.parse(format_string)))
+
+
+class CompiledFormat(object):
+    """A parsed format string, called with the keyword arguments of Formatter.format()"""
+
+    def __init__(self, formatter, parts):
+        self.formatter = formatter
+        # (literal_text, field_name, format_spec, conversion) as returned by Formatter.parse()
+        self.parts = parts
+        for _, field_name, format_spec, _ in parts:
+            if field_name is not None and (not field_name.isidentifier() or "{" in format_spec):
+                raise ValueError("only plain field names without nested fields can be compiled: "
+                                 "{!r}".format(field_name))
+
+    def __call__(self, **kwargs):
+        convert = self.formatter.convert_field
+        result = []
+        for literal_text, field_name, format_spec, conversion in self.parts:
+            result.append(literal_text)
+            if field_name is not None:
+                result.append(format(convert(kwargs[field_name], conversion), format_spec))
+        return "".join(result)
+
+    def bind(self, **kwargs):
+        """ Format the given fields now, returns a CompiledFormat of the remaining fields
+
+        For generating many strings that differ in a few fields only.
+        """
+        parts = []
+        literal = ""
+        for literal_text, field_name, format_spec, conversion in self.parts:
+            literal += literal_text
+            if field_name in kwargs:
+                literal += format(self.formatter.convert_field(kwargs[field_name], conversion), format_spec)
+            elif field_name is not None:
+                parts.append((literal, field_name, format_spec, conversion))
+                literal = ""
+        parts.append((literal, None, None, None))
+        return CompiledFormat(self.formatter, parts)
\ No newline at end of file
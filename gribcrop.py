@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+""" gribcrop.py
+
+ Cropping of GRIB2 messages on regular latitude/longitude grids to a bounding box.
+
+ GribCropper sits between the decompressor and the output file: it collects the bytes of
+ one message at a time, decodes it, slices the rows and columns inside the box out of the
+ field and writes the re-encoded, smaller message on, so only one message is held in memory.
+
+ Decoding and encoding needs the optional ecCodes and NumPy packages, they are imported
+ when the first cropper is created.
+"""
+
+from gribgrid import importDependencies
+from gribindex import GribFormatError, GribMessageFilter
+
+# grid coordinates of GRIB2 are integers in units of 10^-6 degrees
+MICRO_DEGREES = 1000000
+FULL_CIRCLE = 360 * MICRO_DEGREES
+
+
+class GribCropper(GribMessageFilter):
+    """Crops the GRIB messages written to it to bbox and passes them on to outfile
+
+    bbox is (west, south, east, north) in degrees, a box crossing the antimeridian has
+    west > east. A gribindex.GribScanner scanner indexes the cropped messages.
+    """
+
+    def __init__(self, outfile, bbox, scanner=None):
+        super().__init__(outfile, scanner)
+        self.numpy, self.eccodes = importDependencies()
+        self.west, self.south, self.east, self.north = (round(value * MICRO_DEGREES) for value in bbox)
+
+    def transform(self, message):
+        """Returns message cropped to the bounding box"""
+        np, codes = self.numpy, self.eccodes
+        gid = codes.codes_new_from_message(message)
+        try:
+            gridType = codes.codes_get(gid, "gridType")
+            if gridType != "regular_ll":
+                raise GribFormatError(f"cannot crop a {gridType} grid, only regular_ll")
+            if codes.codes_get(gid, "iScansNegatively") or codes.codes_get(gid, "jPointsAreConsecutive"):
+                raise GribFormatError("cannot crop a grid that is not scanned row by row from west to east")
+            ni, nj = codes.codes_get(gid, "Ni"), codes.codes_get(gid, "Nj")
+            di = codes.codes_get(gid, "iDirectionIncrement")
+            dj = codes.codes_get(gid, "jDirectionIncrement")
+            if not codes.codes_get(gid, "jScansPositively"):
+                dj = -dj
+            lats = codes.codes_get(gid, "latitudeOfFirstGridPoint") + dj * np.arange(nj, dtype=np.int64)
+            lons = codes.codes_get(gid, "longitudeOfFirstGridPoint") + di * np.arange(ni, dtype=np.int64)
+
+            rows = np.flatnonzero((lats >= self.south) & (lats <= self.north))
+            columns = np.flatnonzero((lons - self.west) % FULL_CIRCLE <= (self.east - self.west) % FULL_CIRCLE)
+            if not rows.size or not columns.size:
+                raise GribFormatError("the bounding box does not overlap the grid")
+            if columns[-1] - columns[0] + 1 != columns.size:
+                raise GribFormatError("the bounding box wraps around the grid")
+            j0, j1, i0, i1 = rows[0], rows[-1], columns[0], columns[-1]
+
+            values = codes.codes_get_values(gid).reshape(nj, ni)[j0:j1 + 1, i0:i1 + 1]
+            cropped = codes.codes_clone(gid)
+            try:
+                codes.codes_set(cropped, "Ni", int(i1 - i0 + 1))
+                codes.codes_set(cropped, "Nj", int(j1 - j0 + 1))
+                codes.codes_set(cropped, "latitudeOfFirstGridPoint", int(lats[j0]))
+                codes.codes_set(cropped, "latitudeOfLastGridPoint", int(lats[j1]))
+                codes.codes_set(cropped, "longitudeOfFirstGridPoint", int(lons[i0] % FULL_CIRCLE))
+                codes.codes_set(cropped, "longitudeOfLastGridPoint", int(lons[i1] % FULL_CIRCLE))
+                # not derived from Ni and Nj by every ecCodes version, the values must match it
+                codes.codes_set(cropped, "numberOfDataPoints", int(values.size))
+                codes.codes_set_values(cropped, np.ascontiguousarray(values).ravel())
+                return codes.codes_get_message(cropped)
+            finally:
+                codes.codes_release(cropped)
+        finally:
+            codes.codes_release(gid)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+""" gribgrid.py
+
+ Grid geometry shared by the GRIB message processing modules: the optional dependencies,
+ the coordinates of the icosahedral grid cells, unit vectors for nearest-point searches on
+ the sphere and the index arithmetic of regular latitude/longitude grids.
+
+ Decoding needs the optional ecCodes and NumPy packages, importDependencies() imports
+ them when a processor is created.
+"""
+
+
+def importDependencies():
+    """Returns the numpy and eccodes modules, raises ImportError if they are not installed"""
+    import numpy
+    import eccodes
+    return numpy, eccodes
+
+
+def readGridCoordinates(clatPath, clonPath):
+    """Returns (latitudes, longitudes) in degrees of the cells of an icosahedral grid
+
+    From the first message of the clat and clon files, given in radians or degrees.
+    """
+    numpy, eccodes = importDependencies()
+    coordinates = []
+    for path in (clatPath, clonPath):
+        with open(path, "rb") as gribfile:
+            gid = eccodes.codes_grib_new_from_file(gribfile)
+            if gid is None:
+                raise ValueError(f"no GRIB message in {path}")
+            try:
+                coordinates.append(eccodes.codes_get_values(gid))
+            finally:
+                eccodes.codes_release(gid)
+    lats, lons = coordinates
+    if numpy.abs(lats).max() <= numpy.pi / 2 + 1e-6 and numpy.abs(lons).max() <= 2 * numpy.pi + 1e-6:
+        lats, lons = numpy.degrees(lats), numpy.degrees(lons)
+    return lats, lons
+
+
+def unitVectors(lats, lons):
+    """The points given in degrees as unit vectors, one row each: the nearest point has the largest dot product"""
+    import numpy
+    lats, lons = numpy.radians(lats), numpy.radians(lons)
+    return numpy.stack([numpy.cos(lats) * numpy.cos(lons),
+                        numpy.cos(lats) * numpy.sin(lons),
+                        numpy.sin(lats)], axis=1)
+
+
+def regularGridIndices(lats, lons, lat1, lon1, di, dj, ni, nj):
+    """Returns the indices of the grid points nearest to the points and whether they are inside the grid
+
+    For a regular_ll grid scanned row by row, starting at (lat1, lon1) in degrees with the
+    signed increments di and dj. On a grid around the whole globe the point past its last
+    column is its first column.
+    """
+    import numpy
+    j = numpy.rint((numpy.asarray(lats) - lat1) / dj).astype(int)
+    i = numpy.rint(((numpy.asarray(lons) - lon1) * numpy.sign(di) % 360) / abs(di)).astype(int)
+    if round(ni * abs(di)) == 360:
+        i %= ni
+    inside = (j >= 0) & (j < nj) & (i >= 0) & (i < ni)
+    return numpy.where(inside, j * ni + i, 0), inside
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+""" gribindex.py
+
+ Index of the GRIB2 messages in a file, written next to it as a small JSON sidecar.
+
+ GribScanner is fed the decompressed bytes while they are written and reads only the
+ section headers and the small identification, grid and product definition sections;
+ the data sections are skipped without being buffered. For every message the index holds
+ its offset and length, discipline, parameter category and number, the fixed surfaces
+ (level), the forecast step and the grid definition template, so readers can seek
+ straight to a message instead of parsing the whole file:
+
+    for message in readIndex(path):
+        if message["number"] == 0 and message["level"] == 2:
+            infile.seek(message["offset"])
+            data = infile.read(message["length"])
+
+ Messages with several fields (repeated sections 2 to 7) are indexed with the
+ metadata of their first field.
+"""
+
+import json
+import os
+
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+COLUMNS = ("offset", "length", "discipline", "category", "number", "productTemplate",
+           "levelType", "level", "levelType2", "level2", "step", "stepUnit",
+           "gridTemplate", "points", "refTime")
+MISSING_SURFACE = 255
+
+
+class GribFormatError(ValueError):
+    """The data is not a sequence of complete GRIB2 messages"""
+
+
+def _uint(data, start, end):
+    return int.from_bytes(data[start:end], "big")
+
+
+def _scaledValue(scaleFactor, scaledValue):
+    # octets of all ones are missing, the scale factor is a signed (sign and magnitude) byte
+    if scaleFactor == 0xFF or scaledValue == 0xFFFFFFFF:
+        return None
+    scale = -(scaleFactor & 0x7F) if scaleFactor & 0x80 else scaleFactor
+    return scaledValue if scale == 0 else scaledValue / 10 ** scale
+
+
+class GribScanner(object):
+    """Indexes GRIB2 messages from data written to it chunk by chunk"""
+
+    def __init__(self):
+        self.position = 0
+        self.messages = []
+        self.error = None
+        self._message = None
+        self._remaining = 0
+        self._section = None
+        self._needed = 16
+        self._buffer = bytearray()
+        self._skip = 0
+
+    def write(self, data):
+        if self.error:
+            return
+        try:
+            self._write(memoryview(data))
+        except GribFormatError as e:
+            self.error = e
+
+    def _write(self, data):
+        while data:
+            if self._skip:
+                n = min(self._skip, len(data))
+                self._skip -= n
+                self.position += n
+                data = data[n:]
+                continue
+            n = self._needed - len(self._buffer)
+            self._buffer += data[:n]
+            self.position += min(n, len(data))
+            data = data[n:]
+            if len(self._buffer) == self._needed:
+                chunk = bytes(self._buffer)
+                self._buffer.clear()
+                self._parse(chunk)
+
+    def _parse(self, chunk):
+        if self._message is None:
+            # section 0, the indicator section
+            if chunk[:4] != b"GRIB":
+                raise GribFormatError(f"no GRIB message at offset {self.position - len(chunk)}")
+            if chunk[7] != 2:
+                raise GribFormatError(f"GRIB edition {chunk[7]} at offset {self.position - len(chunk)}")
+            length = _uint(chunk, 8, 16)
+            self._message = dict.fromkeys(COLUMNS)
+            self._message.update(offset=self.position - 16, length=length, discipline=chunk[6])
+            self._remaining = length - 16
+            self._expectHeader()
+        elif self._section is None:
+            if self._remaining == 4:
+                # section 8, the end section
+                if chunk != b"7777":
+                    raise GribFormatError(f"GRIB end section missing at offset {self.position - 4}")
+                self.messages.append(self._message)
+                self._message = None
+                self._needed = 16
+                return
+            length, number = _uint(chunk, 0, 4), chunk[4]
+            if length < 5 or length > self._remaining - 4:
+                raise GribFormatError(f"invalid length {length} of section {number} at offset {self.position - 5}")
+            self._remaining -= length
+            if number in (1, 3, 4) and not self._isFilled(number):
+                self._section = number
+                self._needed = length - 5
+            else:
+                self._skip = length - 5
+                self._expectHeader()
+        else:
+            self._parseSection(self._section, chunk)
+            self._section = None
+            self._expectHeader()
+
+    def _expectHeader(self):
+        self._needed = 4 if self._remaining == 4 else 5
+        if self._needed == 4 or self._remaining >= 5:
+            return
+        raise GribFormatError(f"truncated GRIB message at offset {self._message['offset']}")
+
+    def _isFilled(self, number):
+        # only the first field of a message is indexed
+        key = {1: "refTime", 3: "gridTemplate", 4: "productTemplate"}[number]
+        return self._message[key] is not None
+
+    def _parseSection(self, number, body):
+        # body starts at octet 6 of the section, offsets below are octet numbers - 6
+        message = self._message
+        if number == 1 and len(body) >= 14:
+            message["refTime"] = "{:04d}{:02d}{:02d}{:02d}{:02d}".format(_uint(body, 7, 9), *body[9:13])
+        elif number == 3 and len(body) >= 9:
+            message["points"] = _uint(body, 1, 5)
+            message["gridTemplate"] = _uint(body, 7, 9)
+        elif number == 4 and len(body) >= 4:
+            message["productTemplate"] = _uint(body, 2, 4)
+            message["category"] = body[4] if len(body) > 4 else None
+            message["number"] = body[5] if len(body) > 5 else None
+            # product definition templates 4.0 to 4.15 share the layout of the first 34 octets
+            if message["productTemplate"] <= 15 and len(body) >= 29:
+                message["stepUnit"] = body[12]
+                message["step"] = _uint(body, 13, 17)
+                message["levelType"] = body[17]
+                message["level"] = _scaledValue(body[18], _uint(body, 19, 23))
+                if body[23] != MISSING_SURFACE:
+                    message["levelType2"] = body[23]
+                    message["level2"] = _scaledValue(body[24], _uint(body, 25, 29))
+
+    def finish(self):
+        """Returns the indexed messages, raises GribFormatError if the data was not valid GRIB2"""
+        if self.error:
+            raise self.error
+        if self._message is not None or self._buffer or self._skip:
+            raise GribFormatError(f"GRIB data ends within a message at offset {self.position}")
+        return self.messages
+
+
+class GribMessageFilter(object):
+    """Collects the GRIB messages written to it one at a time and passes transform(message) on
+
+    A base for message-wise processing of a stream, only one message is held in memory.
+    The transformed messages are written to outfile and indexed by a GribScanner scanner.
+    """
+
+    def __init__(self, outfile, scanner=None):
+        self.outfile = outfile
+        self.scanner = scanner
+        self._buffer = bytearray()
+        self._length = None
+
+    def write(self, data):
+        self._buffer += data
+        while True:
+            if self._length is None:
+                if len(self._buffer) < 16:
+                    return
+                if self._buffer[:4] != b"GRIB":
+                    raise GribFormatError("no GRIB message")
+                self._length = int.from_bytes(self._buffer[8:16], "big")
+            if len(self._buffer) < self._length:
+                return
+            message = bytes(self._buffer[:self._length])
+            del self._buffer[:self._length]
+            self._length = None
+            transformed = self.transform(message)
+            self.outfile.write(transformed)
+            if self.scanner:
+                self.scanner.write(transformed)
+
+    def finish(self):
+        if self._buffer:
+            raise GribFormatError("GRIB data ends within a message")
+
+    def transform(self, message):
+        return message
+
+
+def indexPath(filePath):
+    return filePath + INDEX_SUFFIX
+
+
+def writeIndex(filePath, messages):
+    """Atomically writes the index sidecar of filePath"""
+    path = indexPath(filePath)
+    directory, fileName = os.path.split(path)
+    tmpPath = os.path.join(directory, ".{0}.{1}.tmp".format(fileName, os.urandom(6).hex()))
+    with open(tmpPath, "w") as jsonfile:
+        json.dump({"version": INDEX_VERSION,
+                   "columns": COLUMNS,
+                   "messages": [[message[column] for column in COLUMNS] for message in messages]},
+                  jsonfile, separators=(",", ":"))
+    os.replace(tmpPath, path)
+    return path
+
+
+def indexFile(filePath, bufferSize=1024 * 1024):
+    """Scans a GRIB2 file and writes its index sidecar"""
+    scanner = GribScanner()
+    with open(filePath, "rb") as infile:
+        for chunk in iter(lambda: infile.read(bufferSize), b""):
+            scanner.write(chunk)
+    return writeIndex(filePath, scanner.finish())
+
+
+def readIndex(filePath):
+    """Returns the indexed messages of filePath, a dict per message with the COLUMNS as keys"""
+    with open(indexPath(filePath), "r") as jsonfile:
+        index = json.load(jsonfile)
+    if index.get("version") != INDEX_VERSION:
+        raise GribFormatError(f"unsupported index version {index.get('version')} of {filePath}")
+    return [dict(zip(index["columns"], row)) for row in index["messages"]]
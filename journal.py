@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+""" journal.py
+
+ SQLite journal of the planned downloads, for resumable and idempotent runs.
+
+ Every planned file is recorded with its model run, param, level and step, its url and
+ destination path. Finished files are marked done with their size, checksum and timings,
+ so a restarted run finds the files that are still missing with a single indexed query
+ instead of stat-ing every destination path. The validators of the response (ETag,
+ Last-Modified) are kept as well, for conditional requests when files are reloaded.
+"""
+
+import sqlite3
+import threading
+import time
+
+PLANNED = "planned"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    url TEXT PRIMARY KEY,
+    model TEXT,
+    run TEXT,
+    param TEXT,
+    levtype TEXT,
+    level INTEGER,
+    step INTEGER,
+    path TEXT,
+    state TEXT NOT NULL,
+    bytes INTEGER,
+    checksum TEXT,
+    etag TEXT,
+    modified TEXT,
+    planned REAL,
+    started REAL,
+    finished REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS files_model_run_state ON files (model, run, state);
+"""
+
+# columns added after the first version of the schema
+ADDED_COLUMNS = {"etag": "TEXT", "modified": "TEXT"}
+
+
+class Journal(object):
+    """Thread-safe journal of planned and finished downloads in an SQLite database"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # the write-ahead log makes every state change a cheap append instead of a page rewrite
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(files)")}
+        for column, columnType in ADDED_COLUMNS.items():
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE files ADD COLUMN {column} {columnType}")
+
+    def plan(self, entries):
+        """Records planned files, dicts with url, model, run, param, levtype, level, step and path
+
+        Files that are already recorded keep their state, unless they are planned with
+        another destination path.
+        """
+        now = time.time()
+        rows = [(entry["url"], entry["model"], entry["run"], entry["param"], entry["levtype"],
+                 entry["level"], entry["step"], entry["path"], PLANNED, now) for entry in entries]
+        with self._lock:
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.executemany(
+                    "INSERT INTO files (url, model, run, param, levtype, level, step, path, state, planned) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (url) DO UPDATE SET "
+                    "state = CASE WHEN files.path IS excluded.path THEN files.state ELSE excluded.state END, "
+                    "path = excluded.path, planned = excluded.planned", rows)
+
+    def completed(self, model, run):
+        """Returns the urls of all files of a model run that are done"""
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT url FROM files WHERE model = ? AND run = ? AND state = ?", (model, run, DONE))
+            return {url for url, in cursor}
+
+    def validators(self, url, path):
+        """Returns (etag, lastModified) of the file last stored at path, None if there are none"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, modified FROM files WHERE url = ? AND path = ? "
+                "AND (etag IS NOT NULL OR modified IS NOT NULL)", (url, path)).fetchone()
+        return row
+
+    def done(self, url, nbytes=None, checksum=None, started=None, finished=None, etag=None, lastModified=None):
+        # values that are not known (skipped or unchanged files) are kept from the last download
+        with self._lock:
+            self._connection.execute(
+                "UPDATE files SET state = ?, bytes = COALESCE(?, bytes), checksum = COALESCE(?, checksum), "
+                "etag = COALESCE(?, etag), modified = COALESCE(?, modified), "
+                "started = ?, finished = ?, error = NULL WHERE url = ?",
+                (DONE, nbytes, checksum, etag, lastModified, started, finished or time.time(), url))
+
+    def failed(self, url, error):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE files SET state = ?, finished = ?, error = ? WHERE url = ?",
+                (FAILED, time.time(), error, url))
+
+    def removeRun(self, model, run):
+        """Forgets all files of a model run, e.g. after they were deleted"""
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE model = ? AND run = ?", (model, run))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+""" objectstore.py
+
+ Content-addressed store for files that do not change from one model run to the next.
+
+ Time-invariant fields (hhl, hsurf, fr_land, ...) are published again in every model run
+ directory, usually byte-identical. The store keeps one copy of every distinct content,
+ named by its sha256, and the destination paths of all runs are hard links to it, so a
+ repeated file takes no extra disk space.
+
+ A download is recognized before it is transferred by its signature: the run-independent
+ file name, the size and the last bytes of the compressed file, which end with the
+ CRC of the bz2 stream. These are probed with a small Range request.
+
+ The total size of the stored objects is capped, the least recently used objects are
+ evicted first. Evicting an object does not touch the hard links in the run directories.
+"""
+
+import errno
+import logging as log
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    lastUsed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_last_used ON objects (lastUsed);
+CREATE TABLE IF NOT EXISTS signatures (
+    signature TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+"""
+
+
+def linkOrCopy(source, destination):
+    """Atomically replaces destination by a hard link to source, or by a copy across file systems"""
+    directory, fileName = os.path.split(destination)
+    tmpPath = os.path.join(directory, ".{0}.{1}.tmp".format(fileName, uuid.uuid4().hex[:12]))
+    try:
+        os.link(source, tmpPath)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        # every run takes the full size again, the store belongs on the file system of the downloads
+        log.warning(f"Copying '{source}' to '{destination}', it cannot be hard linked: {e.strerror}")
+        shutil.copyfile(source, tmpPath)
+    try:
+        os.replace(tmpPath, destination)
+    except BaseException:
+        os.remove(tmpPath)
+        raise
+
+
+class ObjectStore(object):
+    """Thread-safe content-addressed file store with an SQLite index, at most maxBytes large"""
+
+    def __init__(self, path, maxBytes=None):
+        self.path = path
+        self.maxBytes = maxBytes
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "index.sqlite"),
+                                           check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def objectPath(self, name):
+        return os.path.join(self.path, "objects", name[:2], name)
+
+    def lookup(self, signature):
+        """Returns the path of the object stored for signature, None if there is none"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT name FROM signatures WHERE signature = ?", (signature,)).fetchone()
+            if row is None:
+                return None
+            objectPath = self.objectPath(row[0])
+            if not os.path.exists(objectPath):
+                self._connection.execute("DELETE FROM objects WHERE name = ?", row)
+                self._connection.execute("DELETE FROM signatures WHERE name = ?", row)
+                return None
+            self._connection.execute("UPDATE objects SET lastUsed = ? WHERE name = ?", (time.time(), row[0]))
+        return objectPath
+
+    def add(self, signature, name, filePath):
+        """Stores the content of filePath as object name (its hash), found by signature from now on"""
+        objectPath = self.objectPath(name)
+        with self._lock:
+            if not os.path.exists(objectPath):
+                os.makedirs(os.path.dirname(objectPath), exist_ok=True)
+                linkOrCopy(filePath, objectPath)
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO objects (name, size, lastUsed) VALUES (?, ?, ?)",
+                    (name, os.path.getsize(objectPath), time.time()))
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO signatures (signature, name) VALUES (?, ?)", (signature, name))
+            self._evict()
+        return objectPath
+
+    def _evict(self):
+        if not self.maxBytes:
+            return
+        totalBytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if totalBytes <= self.maxBytes:
+            return
+        evicted = []
+        for name, size in self._connection.execute("SELECT name, size FROM objects ORDER BY lastUsed"):
+            if totalBytes <= self.maxBytes:
+                break
+            evicted.append(name)
+            totalBytes -= size
+        with self._connection:
+            self._connection.execute("BEGIN")
+            for name in evicted:
+                self._connection.execute("DELETE FROM objects WHERE name = ?", (name,))
+                self._connection.execute("DELETE FROM signatures WHERE name = ?", (name,))
+        for name in evicted:
+            try:
+                os.remove(self.objectPath(name))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,2325 @@
+#!/usr/bin/env python
+""" opendata_downloader.py
+
+ Module to download and extract grib files from DWD's open data file server https://opendata.dwd.de
+ The command line interface is opendata-downloader.py (or python -m opendata_downloader).
+
+ Importing the module does no I/O, models.json is read on first use and the modules only
+ needed by some download modes (asyncio, process pool, journal, ...) are imported when used.
+
+ original Author:
+    Eduard Rosert
+ extensive rewrite:
+    Michael Haberler
+ Version history:
+    x.y, 2020-12-22, parallelize download, support model-level pressure-level time-invariant on some models
+    0.2, 2019-10-17, added --get-latest-timestamp, --min-timestamp option
+    0.1, 2019-10-01, initial version
+"""
+
+try:
+    import sys
+    from urllib.error import URLError, HTTPError
+    import json
+    import time
+    import math
+    import heapq
+    import functools
+    import os
+    import re
+    from datetime import datetime, timedelta, timezone
+    import logging as log
+    from extendedformatter import ExtendedFormatter
+    from partfile import MemoryPartFile, PartFile, ResumeError, contentRangePattern
+    import concurrency
+    import threading
+    import concurrent.futures
+    from concurrent.futures.thread import ThreadPoolExecutor
+
+except ImportError as ie:
+    log.exception("Importing required libraries failed")
+    sys.exit(1)
+
+global dryRun
+global compressed
+global skipExisting
+global maxWorkers
+global httpPool
+skipExisting = True
+dryRun = None
+compressed = False
+retainDwdTree = True
+dwdPattern = "{model!L}/grib/{modelrun:>02d}/{param!L}"
+failedFiles = []
+maxWorkers = 20
+bufferSize = 1024 * 1024
+decompressProcesses = 0
+decompressQueueSize = None
+decompressionStage = None
+engine = "threads"
+resumeAttempts = 3
+verifyDownloads = True
+adaptiveConcurrency = False
+minWorkers = 2
+concurrencyController = None
+retryBudget = {"connection": 5, "server": 3, "throttled": 5, "integrity": 2}
+retryBaseDelay = 1.0
+retryMaxDelay = 60.0
+resumableErrors = None
+useListing = True
+directoryListings = {}
+directoryListingsLock = threading.Lock()
+hrefPattern = re.compile(r'href="([^"?#]+)"', re.IGNORECASE)
+cacheDir = os.path.join(os.path.expanduser("~"), ".cache", "opendata-downloader")
+latestTimestampCacheTtl = 60
+connectionsPerHost = None
+httpProxy = None
+httpPool = None
+journalPath = None
+journal = None
+objectStorePath = None
+objectStoreMaxBytes = 10 * 1024 ** 3
+objectStore = None
+runTimestampPattern = re.compile(r"_\d{10}_")
+signatureProbeBytes = 32
+# write a gribindex sidecar next to every decompressed file
+gribIndex = False
+# (west, south, east, north) in degrees the messages are cropped to, see gribcrop.py
+cropBox = None
+# (west, south, east, north, resolution) in degrees the icosahedral fields are regridded to,
+# using the cell coordinates in the (clat, clon) GRIB files gridCoordinatePaths, see regrid.py
+regridTarget = None
+gridCoordinatePaths = None
+# an OutputSink receiving the decompressed files instead of the file system
+outputSink = None
+lazyInitLock = threading.Lock()
+
+
+# custom stringFormatter with uppercase/lowercase functionality
+stringFormatter = ExtendedFormatter()
+supportedModels = None
+# url patterns parsed once, by model and levtype
+urlTemplates = None
+dwdTemplate = stringFormatter.compile(dwdPattern)
+# names of the files written with --merge, with the model run where retention finds it
+mergedParamTemplate = stringFormatter.compile("{model!L}_{grid}_{levtype}_{timestamp:%Y%m%d%H}_{param!L}.grib2")
+mergedRunTemplate = stringFormatter.compile("{model!L}_{grid}_{timestamp:%Y%m%d%H}_merged.grib2")
+stationsTemplate = stringFormatter.compile("{model!L}_{grid}_{timestamp:%Y%m%d%H}_stations.csv")
+
+
+def getSupportedModels():
+    # models.json from the working directory, or the one next to this module
+    global supportedModels, urlTemplates
+    with lazyInitLock:
+        if supportedModels is None:
+            modelsFile = "models.json"
+            if not os.path.exists(modelsFile):
+                modelsFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.json")
+            with open(modelsFile, "r") as jsonfile:
+                models = json.load(jsonfile)
+            urlTemplates = {model["model"]: {levtype: stringFormatter.compile(pattern)
+                                             for levtype, pattern in model["pattern"].items()}
+                            for model in models}
+            supportedModels = {model["model"]: model for model in models}
+    return supportedModels
+
+
+def getUrlTemplate(model, levtype):
+    getSupportedModels()
+    return urlTemplates[model][levtype]
+
+
+def getResumableErrors():
+    # failures of a transfer that a Range request can resume
+    global resumableErrors
+    if resumableErrors is None:
+        import http.client
+        import socket
+        resumableErrors = (ConnectionError, TimeoutError, socket.timeout, http.client.IncompleteRead, ResumeError)
+    return resumableErrors
+
+
+def configureHttpProxyForUrllib(proxySettings={'http': 'proxyserver:8080'}):
+    import urllib.request
+    proxy = urllib.request.ProxyHandler(proxySettings)
+    opener = urllib.request.build_opener(proxy)
+    urllib.request.install_opener(opener)
+
+
+def getHttpPool():
+    # one keep-alive connection pool shared by all download workers
+    global httpPool
+    with lazyInitLock:
+        if httpPool is None:
+            from connectionpool import ConnectionPool
+            httpPool = ConnectionPool(maxConnectionsPerHost=connectionsPerHost or maxWorkers,
+                                      proxies={'http': httpProxy} if httpProxy else None)
+    return httpPool
+
+
+def getMostRecentModelTimestamp(waitTimeMinutes=360, modelIntervalHours=3, modelrun=None):
+
+    # explicit model run timestamp
+    if modelrun:
+        return datetime.strptime(modelrun, '%Y%m%d%H')
+
+    # model data becomes available approx 1.5 hours (90minutes) after a model run
+    # cosmo-d2 model and icon-eu run every 3 hours
+    now = datetime.utcnow() - timedelta(minutes=waitTimeMinutes)
+
+    latestAvailableUTCRun = int(math.floor(
+        now.hour / modelIntervalHours) * modelIntervalHours)
+    modelTimestamp = datetime(
+        now.year, now.month, now.day, latestAvailableUTCRun)
+    return modelTimestamp
+
+
+class IntegrityError(Exception):
+    """A downloaded file failed verification"""
+
+
+class OutputError(Exception):
+    """A downloaded file could not be written to the output sink, retrying the download does not help"""
+
+
+def getOutputError(e, url, cancelEvent=None):
+    # once the reader of the output stream is gone (EPIPE) nothing more can be delivered,
+    # the remaining downloads are cancelled
+    import errno
+    if e.errno == errno.EPIPE and cancelEvent is not None:
+        cancelEvent.set()
+    return OutputError(f"Writing {url.split('/')[-1]} to the output failed: {e}")
+
+
+class DownloadCancelled(concurrent.futures.CancelledError):
+    """The download was cancelled, the .part file is kept for resuming it later"""
+
+
+class Bz2StreamWriter(object):
+    """Decompresses bz2 data written to it chunk by chunk and passes it on to outfile
+
+    Each call writes at most bufferSize bytes at a time to outfile, so memory stays bounded
+    regardless of the file size. Concatenated bz2 streams are supported. The last bytes
+    written are kept in tail for verifying the GRIB end section. A gribindex.GribScanner
+    scanner indexes the GRIB messages as they pass.
+    """
+
+    def __init__(self, outfile, decompress=True, bufferSize=1024 * 1024, scanner=None):
+        import bz2
+        self.outfile = outfile
+        self.scanner = scanner
+        self.decompress = decompress
+        self.bufferSize = bufferSize
+        self.decompressorType = bz2.BZ2Decompressor
+        self.decompressor = self.decompressorType()
+        self.started = False
+        self.streams = 0
+        self.tail = b''
+
+    def _output(self, data):
+        if data:
+            self.outfile.write(data)
+            self.tail = (self.tail + data)[-4:]
+            if self.scanner:
+                self.scanner.write(data)
+
+    def write(self, chunk):
+        if not self.decompress:
+            self._output(chunk)
+            return
+        while chunk or not self.decompressor.needs_input:
+            if self.decompressor.eof:
+                # concatenated bz2 streams, continue with a fresh decompressor
+                chunk = self.decompressor.unused_data + chunk
+                self.decompressor = self.decompressorType()
+                self.started = False
+                if not chunk:
+                    break
+            self.started = self.started or bool(chunk)
+            try:
+                data = self.decompressor.decompress(chunk, self.bufferSize)
+            except OSError as e:
+                raise IntegrityError(f"Invalid bz2 data: {e}")
+            self._output(data)
+            chunk = b''
+            if self.decompressor.eof and self.started:
+                self.streams += 1
+                self.started = False
+
+    def finish(self):
+        if self.decompress and (self.started or not self.streams):
+            raise IntegrityError("Compressed file ended before the end-of-stream marker was reached")
+
+
+def getRegridding():
+    # the picklable --regrid settings for createBz2Writer, None if the fields are not regridded
+    return (regridTarget, gridCoordinatePaths, cacheDir) if regridTarget else None
+
+
+def createBz2Writer(outfile, bufferSize=1024 * 1024, scanner=None, bbox=None, regrid=None):
+    # returns the writer and the --bbox cropper or --regrid regridder the decompressed data
+    # passes on its way to outfile and scanner, None if the messages are written unchanged
+    messageFilter = None
+    if bbox:
+        from gribcrop import GribCropper
+        messageFilter = GribCropper(outfile, bbox, scanner=scanner)
+    elif regrid:
+        from gribgrid import readGridCoordinates
+        from regrid import GribRegridder
+        grid, coordinatePaths, regridCacheDir = regrid
+        messageFilter = GribRegridder(outfile, grid, functools.partial(readGridCoordinates, *coordinatePaths),
+                                      regridCacheDir, scanner=scanner)
+    if messageFilter:
+        return Bz2StreamWriter(messageFilter, bufferSize=bufferSize), messageFilter
+    return Bz2StreamWriter(outfile, bufferSize=bufferSize, scanner=scanner), None
+
+
+def verifyGribTrailer(tail, url):
+    # every GRIB message ends with the end section '7777'
+    if tail != b'7777':
+        raise IntegrityError(f"GRIB end section '7777' missing, got {tail!r}, URL={url}")
+
+
+def createTempFile(fullFilePath):
+    # a uniquely named hidden file in the destination directory, so it can be renamed atomically
+    directory, fileName = os.path.split(fullFilePath)
+    tmpFilePath = os.path.join(directory, ".{0}.{1}.tmp".format(fileName, os.urandom(6).hex()))
+    fd = os.open(tmpFilePath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    return os.fdopen(fd, 'wb'), tmpFilePath
+
+
+def commitFile(outfile, tmpFilePath, fullFilePath):
+    # make the file durable before it becomes visible under its final name
+    outfile.flush()
+    os.fsync(outfile.fileno())
+    outfile.close()
+    os.replace(tmpFilePath, fullFilePath)
+
+
+def verifyBz2File(filePath, url, bufferSize=1024 * 1024):
+    # decompress without writing, checks the bz2 stream end and the GRIB end section
+    with open(filePath, 'rb') as infile, open(os.devnull, 'wb') as devnull:
+        writer = Bz2StreamWriter(devnull, bufferSize=bufferSize)
+        for chunk in iter(lambda: infile.read(bufferSize), b''):
+            writer.write(chunk)
+        writer.finish()
+    verifyGribTrailer(writer.tail, url)
+
+
+def copyBz2Stream(source, outfile, decompress=True, bufferSize=1024 * 1024):
+    # read the compressed stream chunk by chunk and write each (decompressed) chunk right away
+    writer = Bz2StreamWriter(outfile, decompress=decompress, bufferSize=bufferSize)
+    for chunk in iter(lambda: source.read(bufferSize), b''):
+        writer.write(chunk)
+    writer.finish()
+
+
+def writeGribIndex(fullFilePath, scanner):
+    # the index sidecar is written before the file is committed, so a committed file has its index
+    import gribindex
+    try:
+        gribindex.writeIndex(fullFilePath, scanner.finish())
+    except gribindex.GribFormatError as e:
+        log.warning(f"Not indexing {fullFilePath}: {e}")
+
+
+def ensureGribIndex(fullFilePath):
+    # index an existing file (skipped, unchanged or linked from the invariant cache) once
+    if not gribIndex or compressed:
+        return
+    import gribindex
+    if os.path.exists(gribindex.indexPath(fullFilePath)):
+        return
+    try:
+        gribindex.indexFile(fullFilePath, bufferSize)
+    except (gribindex.GribFormatError, OSError) as e:
+        log.warning(f"Not indexing {fullFilePath}: {e}")
+
+
+def decompressBz2File(partFilePath, fullFilePath, bufferSize=1024 * 1024, verify=True, index=False, bbox=None,
+                      regrid=None):
+    # executed in a worker process of the DecompressionStage
+    outfile, tmpFilePath = createTempFile(fullFilePath)
+    try:
+        scanner = None
+        if index:
+            from gribindex import GribScanner
+            scanner = GribScanner()
+        with open(partFilePath, 'rb') as infile:
+            writer, messageFilter = createBz2Writer(outfile, bufferSize=bufferSize, scanner=scanner, bbox=bbox,
+                                                    regrid=regrid)
+            for chunk in iter(lambda: infile.read(bufferSize), b''):
+                writer.write(chunk)
+            writer.finish()
+            if messageFilter:
+                messageFilter.finish()
+        if verify:
+            verifyGribTrailer(writer.tail, fullFilePath)
+        if scanner:
+            writeGribIndex(fullFilePath, scanner)
+        commitFile(outfile, tmpFilePath, fullFilePath)
+    except BaseException:
+        outfile.close()
+        os.remove(tmpFilePath)
+        raise
+    finally:
+        PartFile(partFilePath, None).remove()
+    return fullFilePath
+
+
+class DecompressionStage(object):
+    """Decompresses downloaded bz2 data in a pool of worker processes
+
+    bz2 decompression is CPU-bound and holds the GIL, so the download threads only fetch
+    the compressed file and hand it over. At most queueSize compressed files wait for
+    decompression, submit() blocks the download threads when decompression falls behind.
+    """
+
+    def __init__(self, processes=None, queueSize=None):
+        processes = processes or os.cpu_count() or 1
+        from concurrent.futures.process import ProcessPoolExecutor
+        self.executor = ProcessPoolExecutor(max_workers=processes)
+        self.slots = threading.BoundedSemaphore(queueSize or 2 * processes)
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def submit(self, url, partFilePath, fullFilePath):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(decompressBz2File, partFilePath, fullFilePath,
+                                          bufferSize, verifyDownloads, gribIndex, cropBox, getRegridding())
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending[future] = url
+        future.add_done_callback(lambda f: self.slots.release())
+        return future
+
+    def wait(self):
+        # wait for all submitted files, failures are logged like download failures
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in concurrent.futures.as_completed(pending):
+            url = pending[future]
+            try:
+                future.result()
+            except Exception as e:
+                log.error(f"Decompressing failed. Reason={e}, URL={url}")
+                failedFiles.append((url, None, type(e)))
+                if getJournal():
+                    getJournal().failed(url, repr(e))
+
+    def shutdown(self):
+        self.wait()
+        self.executor.shutdown()
+
+
+def getDecompressionStage():
+    global decompressionStage
+    with lazyInitLock:
+        if decompressionStage is None and decompressProcesses:
+            decompressionStage = DecompressionStage(processes=decompressProcesses,
+                                                    queueSize=decompressQueueSize)
+    return decompressionStage
+
+
+def shutdownDecompressionStage():
+    # waits for the files still being decompressed and stops the worker processes,
+    # the next download starts a new stage
+    global decompressionStage
+    with lazyInitLock:
+        stage, decompressionStage = decompressionStage, None
+    if stage:
+        stage.shutdown()
+
+
+def getMergedFileName(task, perParam=True):
+    # the file a planned file is appended to with --merge, one per param or one per model run
+    template = mergedParamTemplate if perParam else mergedRunTemplate
+    return template(**dict(task, grid=task.get("grid") or "default"))
+
+
+def getDestinationFilePath(url, destFilePath=None, destFileName=None):
+    if destFileName == "" or destFileName == None:
+        # strip the filename from the url and remove the bz2 extension
+        destFileName = url.split('/')[-1].split('.bz2')[0]
+
+    if destFilePath == "" or destFilePath == None:
+        destFilePath = os.getcwd()
+
+    if compressed:
+        return os.path.join(destFilePath, destFileName + '.bz2')
+    return os.path.join(destFilePath, destFileName)
+
+
+class DownloadTarget(object):
+    """Receives the compressed body of a download
+
+    The compressed bytes are appended to a .part file, so an interrupted transfer can be
+    resumed with a Range request. finish() checks the expected Content-Length, the bz2
+    end-of-stream marker and the GRIB end section, then atomically renames the temporary
+    decompressed file (or the .part file itself when storing compressed files) to
+    fullFilePath. Readers never see a partial file and skipExisting never mistakes a
+    truncated file for a complete one. With fetchOnly the complete .part file is left
+    for the DecompressionStage. part replaces the .part file, e.g. by a MemoryPartFile.
+    """
+
+    def __init__(self, url, fullFilePath, decompress=True, fetchOnly=False, bufferSize=1024 * 1024,
+                 verify=True, part=None):
+        self.url = url
+        self.fullFilePath = fullFilePath
+        self.decompress = decompress
+        self.fetchOnly = fetchOnly
+        self.bufferSize = bufferSize
+        self.verify = verify
+        if part is None:
+            part = PartFile(fullFilePath + (".bz2.part" if decompress else ".part"), url)
+        self.part = part
+        self.tmpFilePath = None
+        self.partFile = None
+        self.outfile = None
+        self.writer = None
+        self.scanner = None
+        self.messageFilter = None
+        self.corrupt = False
+        # sha256, size and validators of the compressed file, for the journal
+        self.checksum = None
+        self.size = 0
+        self.startTime = None
+        self.etag = None
+        self.lastModified = None
+        # (etag, lastModified) of the existing fullFilePath, for a conditional request
+        self.validators = None
+        self.notModified = False
+        # signature for the object store, None if the file is not stored there
+        self.signature = None
+        # a threading.Event that cancels the transfer when set
+        self.cancelEvent = None
+
+    def requestHeaders(self):
+        # None if the .part file is complete already
+        if self.part.isComplete():
+            return None
+        headers = self.part.requestHeaders()
+        if self.validators and not headers:
+            etag, lastModified = self.validators
+            if etag:
+                headers["If-None-Match"] = etag
+            if lastModified:
+                headers["If-Modified-Since"] = lastModified
+        return headers
+
+    def begin(self, status=None, headers=None):
+        from hashlib import sha256
+        if self.startTime is None:
+            self.startTime = time.time()
+        if status == 304:
+            # the existing file is up to date, there is no body
+            self.notModified = True
+            return
+        if status is not None:
+            self.partFile = self.part.open(status, headers)
+        self.etag = self.part.meta.get("etag")
+        self.lastModified = self.part.meta.get("lastModified")
+        self.checksum = sha256()
+        self.size = 0
+        if self.decompress and not self.fetchOnly:
+            self.outfile, self.tmpFilePath = self.openOutput()
+            if gribIndex:
+                from gribindex import GribScanner
+                self.scanner = GribScanner()
+            self.writer, self.messageFilter = createBz2Writer(self.outfile, bufferSize=self.bufferSize,
+                                                              scanner=self.scanner, bbox=cropBox,
+                                                              regrid=getRegridding())
+        # checksum (and decompress) the bytes received by earlier attempts first
+        for chunk in self.part.chunks(self.bufferSize):
+            self._consume(chunk)
+
+    def openOutput(self):
+        # the file object the decompressed data is written to, and its temporary path
+        return createTempFile(self.fullFilePath)
+
+    def commit(self):
+        # the decompressed file is complete and verified
+        if self.scanner:
+            writeGribIndex(self.fullFilePath, self.scanner)
+        commitFile(self.outfile, self.tmpFilePath, self.fullFilePath)
+        self.outfile = None
+        self.part.remove()
+
+    def _consume(self, chunk):
+        self.checksum.update(chunk)
+        self.size += len(chunk)
+        if self.writer:
+            try:
+                self.writer.write(chunk)
+            except IntegrityError:
+                self.corrupt = True
+                raise
+
+    def write(self, chunk):
+        if self.cancelEvent is not None and self.cancelEvent.is_set():
+            raise DownloadCancelled(self.url)
+        self.partFile.write(chunk)
+        self._consume(chunk)
+
+    def finish(self):
+        from http.client import IncompleteRead
+        if self.notModified:
+            return self.fullFilePath
+        if self.partFile:
+            self.partFile.close()
+            self.partFile = None
+        if self.part.size is not None and self.part.offset < self.part.size:
+            raise IncompleteRead(b'', self.part.size - self.part.offset)
+        if self.fetchOnly:
+            return self.part.path
+        try:
+            if self.writer:
+                self.writer.finish()
+                if self.messageFilter:
+                    self.messageFilter.finish()
+                if self.verify:
+                    verifyGribTrailer(self.writer.tail, self.url)
+            elif self.verify:
+                verifyBz2File(self.part.path, self.url, self.bufferSize)
+        except IntegrityError:
+            self.corrupt = True
+            raise
+        if self.writer:
+            self.commit()
+        else:
+            with open(self.part.path, 'rb') as partFile:
+                os.fsync(partFile.fileno())
+            self.part.removeMeta()
+            os.replace(self.part.path, self.fullFilePath)
+        return self.fullFilePath
+
+    def abort(self):
+        # keeps the .part file for resuming, unless its content turned out to be corrupt
+        if self.partFile:
+            self.partFile.close()
+            self.partFile = None
+        if self.outfile:
+            self.outfile.close()
+            self.outfile = None
+            if self.tmpFilePath:
+                os.remove(self.tmpFilePath)
+        self.writer = None
+        self.messageFilter = None
+        if self.corrupt:
+            self.part.remove()
+            self.corrupt = False
+
+
+class SinkTarget(DownloadTarget):
+    """A DownloadTarget that writes the decompressed file to an OutputSink instead of the disk
+
+    Nothing is stored: the compressed bytes are kept in memory for resuming an interrupted
+    transfer. Once the transfer is complete they are decompressed straight into the sink,
+    which takes the file only if it is complete and verified, so the sink never receives a
+    partial file.
+    """
+
+    def __init__(self, url, sink, bufferSize=1024 * 1024, verify=True):
+        super().__init__(url, url.split('/')[-1].split('.bz2')[0], fetchOnly=True, bufferSize=bufferSize,
+                         verify=verify, part=MemoryPartFile(url))
+        self.sink = sink
+
+    def finish(self):
+        super().finish()
+        try:
+            with self.sink.appending(self.url) as outfile:
+                writer, messageFilter = createBz2Writer(outfile, bufferSize=self.bufferSize, bbox=cropBox,
+                                                        regrid=getRegridding())
+                for chunk in self.part.chunks(self.bufferSize):
+                    writer.write(chunk)
+                writer.finish()
+                if messageFilter:
+                    messageFilter.finish()
+                if self.verify:
+                    verifyGribTrailer(writer.tail, self.url)
+        except IntegrityError:
+            self.corrupt = True
+            raise
+        except OSError as e:
+            raise getOutputError(e, self.url, self.cancelEvent) from e
+        self.part.remove()
+        return self.fullFilePath
+
+
+def getConcurrencyController():
+    # shared by all downloads of the run, so the limit it has learned carries over
+    global concurrencyController
+    with lazyInitLock:
+        if concurrencyController is None and adaptiveConcurrency:
+            concurrencyController = concurrency.AdaptiveConcurrency(minLimit=minWorkers,
+                                                                    maxLimit=maxWorkers)
+    return concurrencyController
+
+
+def reportConcurrency():
+    controller = getConcurrencyController()
+    if controller:
+        summary = controller.summary()
+        log.info(f"Adaptive concurrency settled at {summary['limit']} requests in flight "
+                 f"(peak {summary['peakLimit']}, {summary['throughput'] / 1e6:.1f} MB/s, "
+                 f"{summary['throttled']} throttled and {summary['errors']} failed "
+                 f"of {summary['requests']} requests)")
+
+
+def getJournal():
+    global journal
+    with lazyInitLock:
+        if journal is None and journalPath:
+            os.makedirs(os.path.dirname(os.path.abspath(journalPath)), exist_ok=True)
+            from journal import Journal
+            journal = Journal(journalPath)
+    return journal
+
+
+def journalPlan(plan):
+    # records the planned files in the journal, returns the files still to download and
+    # the results of the files the journal knows to be done, without looking at the files
+    if getJournal() is None or dryRun or outputSink is not None:
+        return plan, []
+    entries = []
+    for task in plan:
+        url = getTaskUrl(task)
+        entries.append(dict(url=url,
+                            model=task["model"],
+                            run=task["timestamp"].strftime("%Y%m%d%H"),
+                            param=task["param"],
+                            levtype=task["levtype"],
+                            level=task["level"],
+                            step=task["timestep"],
+                            path=getDestinationFilePath(url, task.get("destFilePath"), task.get("destFileName"))))
+    getJournal().plan(entries)
+    if not skipExisting:
+        return plan, []
+    done = set()
+    for model, run in {(entry["model"], entry["run"]) for entry in entries}:
+        done |= getJournal().completed(model, run)
+    remaining = [task for task, entry in zip(plan, entries) if entry["url"] not in done]
+    results = [makeResult(entry["url"], entry["path"], "skipped") for entry in entries if entry["url"] in done]
+    log.info(f"Journal: {len(results)} of {len(plan)} planned files are done already")
+    return remaining, results
+
+
+def getObjectStore():
+    global objectStore
+    with lazyInitLock:
+        if objectStore is None and objectStorePath:
+            from objectstore import ObjectStore
+            objectStore = ObjectStore(objectStorePath, maxBytes=objectStoreMaxBytes)
+    return objectStore
+
+
+def probeSignature(url):
+    # run-independent file name, size and last bytes of the compressed file (the bz2 stream CRC),
+    # None if the server does not answer the Range request
+    with getHttpPool().urlopen(url, headers={"Range": f"bytes=-{signatureProbeBytes}"}) as resource:
+        match = contentRangePattern.match(resource.getheader("Content-Range") or "")
+        if resource.status != 206 or not match or match.group(3) == "*":
+            return None
+        tail = resource.read()
+    fileName = runTimestampPattern.sub("_", url.split('/')[-1], count=1)
+    return "{0}{1}:{2}:{3}".format(fileName, ".bz2" if compressed else "", match.group(3), tail.hex())
+
+
+def linkStoredObject(url, target):
+    # time-invariant files: links the destination to the stored object with the same signature,
+    # returns True if it did
+    if getObjectStore() is None or "_time-invariant_" not in url.split('/')[-1]:
+        return False
+    try:
+        target.signature = probeSignature(url)
+    except (HTTPError, URLError) + getResumableErrors() as e:
+        # the download itself reports the failure
+        log.debug(f"Probing failed. Reason={e!r}, URL={url}")
+        return False
+    objectPath = target.signature and getObjectStore().lookup(target.signature)
+    if not objectPath:
+        return False
+    log.debug("Linking stored object '{0}' to '{1}'".format(objectPath, target.fullFilePath))
+    from objectstore import linkOrCopy
+    linkOrCopy(objectPath, target.fullFilePath)
+    return True
+
+
+def fileDone(url, target):
+    journalDone(url, target)
+    if target.notModified:
+        ensureGribIndex(target.fullFilePath)
+    if target.signature and not target.notModified:
+        name = target.checksum.hexdigest() + (".bz2" if compressed else "")
+        getObjectStore().add(target.signature, name, target.fullFilePath)
+
+
+def journalDone(url, target=None):
+    if getJournal() is None:
+        return
+    if target is None or target.notModified:
+        # skipped or unchanged, the file existed already
+        getJournal().done(url, started=target and target.startTime)
+    else:
+        getJournal().done(url, target.size, target.checksum.hexdigest(), target.startTime,
+                          etag=target.etag, lastModified=target.lastModified)
+
+
+def setValidators(url, target):
+    # a reload asks the server to send the file only if it changed since it was stored
+    if getJournal() and os.path.exists(target.fullFilePath):
+        target.validators = getJournal().validators(url, target.fullFilePath)
+
+
+def downloadWithResume(url, target):
+    # download into target, interrupted transfers are resumed with Range requests
+    controller = getConcurrencyController()
+    for attempt in range(resumeAttempts + 1):
+        token = controller.acquire() if controller else None
+        outcome, nbytes = concurrency.IGNORED, 0
+        try:
+            headers = target.requestHeaders()
+            if headers is None:
+                target.begin()
+            else:
+                with getHttpPool().urlopen(url, headers=headers) as resource:
+                    target.begin(resource.status, resource.headers)
+                    for chunk in iter(lambda: resource.read(bufferSize), b''):
+                        nbytes += len(chunk)
+                        target.write(chunk)
+            result = target.finish()
+            outcome = concurrency.OK
+            return result
+        except getResumableErrors() as e:
+            outcome = concurrency.ERROR
+            target.abort()
+            if attempt == resumeAttempts:
+                raise
+            log.warning(f"Download interrupted, resuming at byte {target.part.offset}. Reason={e!r}, URL={url}")
+        except HTTPError as e:
+            outcome = concurrency.classifyHttpStatus(e.code)
+            target.abort()
+            raise
+        except BaseException:
+            target.abort()
+            raise
+        finally:
+            if token is not None:
+                controller.release(token, outcome, nbytes)
+
+
+def makeResult(url, fullFilePath=None, status="downloaded", nbytes=None, duration=None):
+    # the result of a file as returned by downloadPlan() and yielded by Downloader.fetch(),
+    # status is one of downloaded, unchanged (304), linked (invariant cache), skipped
+    # (existing file), streamed (to the output sink), unpublished (not listed on the server),
+    # dry-run, failed or cancelled
+    return {"url": url, "file": fullFilePath, "bytes": nbytes, "duration": duration, "status": status}
+
+
+def fetchFile(url, destFilePath=None, destFileName=None, cancelEvent=None):
+    # fetchBz2FileFromUrl() returning the result dict, failures are raised to the caller.
+    # With a decompression stage the result of a downloaded file has the "decompression"
+    # future, the file exists once it is done
+    startTime = time.monotonic()
+    if dryRun:
+        log.debug("Pretending to download file: '{0}' (dry-run)".format(url))
+        return makeResult(url, status="dry-run")
+    else:
+        log.debug("Downloading file: '{0}'".format(url))
+
+    if cancelEvent is not None and cancelEvent.is_set():
+        raise DownloadCancelled(url)
+    if outputSink is not None:
+        target = SinkTarget(url, outputSink, bufferSize=bufferSize, verify=verifyDownloads)
+        target.cancelEvent = cancelEvent
+        downloadWithResume(url, target)
+        return makeResult(url, status="streamed", nbytes=target.size, duration=time.monotonic() - startTime)
+
+    fullFilePath = getDestinationFilePath(url, destFilePath, destFileName)
+    if skipExisting and os.path.exists(fullFilePath):
+        log.debug("Skipping existing file: '{0}'".format(fullFilePath))
+        journalDone(url)
+        ensureGribIndex(fullFilePath)
+        return makeResult(url, fullFilePath, "skipped")
+
+    stage = None if compressed else getDecompressionStage()
+    # with a decompression stage, fetch only, decompression happens in the process pool
+    target = DownloadTarget(url, fullFilePath,
+                            decompress=not compressed,
+                            fetchOnly=bool(stage),
+                            bufferSize=bufferSize,
+                            verify=verifyDownloads)
+    target.cancelEvent = cancelEvent
+    if linkStoredObject(url, target):
+        journalDone(url)
+        ensureGribIndex(fullFilePath)
+        return makeResult(url, fullFilePath, "linked", duration=time.monotonic() - startTime)
+    setValidators(url, target)
+    log.debug("Saving file as: '{0}'".format(fullFilePath))
+    partFilePath = downloadWithResume(url, target)
+    result = makeResult(url, fullFilePath, nbytes=target.size, duration=time.monotonic() - startTime)
+    if target.notModified:
+        log.debug("File is unchanged: '{0}'".format(fullFilePath))
+        fileDone(url, target)
+        result["status"] = "unchanged"
+    elif stage:
+        log.debug("Queueing file for decompression: '{0}'".format(fullFilePath))
+        future = stage.submit(url, partFilePath, fullFilePath)
+        future.add_done_callback(
+            lambda f: f.cancelled() or f.exception() is not None or fileDone(url, target))
+        result["decompression"] = future
+    else:
+        fileDone(url, target)
+    return result
+
+
+def fetchBz2FileFromUrl(url, destFilePath=None, destFileName=None):
+    # like downloadAndExtractBz2FileFromUrl, but failures are raised to the caller
+    return fetchFile(url, destFilePath=destFilePath, destFileName=destFileName)["file"]
+
+
+def reportDownloadFailure(url, e):
+    if getJournal():
+        getJournal().failed(url, repr(e))
+    if isinstance(e, HTTPError):
+        log.error(f"Downloading failed. Reason={e}, URL={url}")
+        failedFiles.append((url, e.status, HTTPError))
+    elif isinstance(e, (IntegrityError, OutputError)) or getErrorClass(e) == "connection":
+        log.error(f"Downloading failed. Reason={e!r}, URL={url}")
+        failedFiles.append((url, None, type(e)))
+    else:
+        # also called from a result callback, outside the except block of the failure
+        log.error(f"Downloading failed. Reason={e}, URL={url}", exc_info=e)
+        failedFiles.append((url, None, type(e)))
+
+
+def downloadAndExtractBz2FileFromUrl(url, destFilePath=None, destFileName=None):
+    try:
+        return fetchBz2FileFromUrl(url, destFilePath=destFilePath, destFileName=destFileName)
+    except Exception as e:
+        reportDownloadFailure(url, e)
+
+
+def getErrorClass(e):
+    # failures are retried with a separate budget per class, "output" and "other" are not retried
+    if isinstance(e, concurrent.futures.CancelledError):
+        return "cancelled"
+    if isinstance(e, OutputError):
+        return "output"
+    if isinstance(e, HTTPError):
+        if e.code in (429, 503):
+            return "throttled"
+        return "server" if e.code >= 500 else "client"
+    if isinstance(e, IntegrityError):
+        return "integrity"
+    from http.client import HTTPException
+    if isinstance(e, getResumableErrors() + (HTTPException, URLError)):
+        return "connection"
+    return "other"
+
+
+def getRetryDelay(e, attempts):
+    # seconds to wait before retrying after e, None once the budget of its error class is used up;
+    # attempts counts the retries per error class of one file and is updated
+    errorClass = getErrorClass(e)
+    attempt = attempts.get(errorClass, 0)
+    if errorClass in ("cancelled", "output") or attempt >= retryBudget.get(errorClass, 0):
+        return None
+    attempts[errorClass] = attempt + 1
+    # exponential backoff with full jitter, spreads the retries of many workers over time
+    import random
+    delay = random.uniform(0, min(retryMaxDelay, retryBaseDelay * 2 ** attempt))
+    if isinstance(e, HTTPError) and e.headers is not None:
+        retryAfter = e.headers.get("Retry-After")
+        if retryAfter and retryAfter.isdigit():
+            delay = max(delay, min(retryMaxDelay, float(retryAfter)))
+    return delay
+
+
+def getGribFileUrl(model="icon-eu",
+                   grid=None,
+                   param="t_2m",
+                   timestep=0,
+                   timestamp=None,
+                   levtype="single-level",
+                   level=42):
+
+    cfg = getSupportedModels()[model]
+    if timestamp is None:
+        timestamp = getMostRecentModelTimestamp(waitTimeMinutes=180, modelIntervalHours=12)
+
+    # When "grid" parameter is not given, use first available grid type.
+    if (grid is None) or (grid not in cfg["grids"]):
+        grid = cfg["grids"][0]
+
+    template = getUrlTemplate(model, levtype)
+    return template(model=cfg["model"],
+                    param=param,
+                    grid=grid,
+                    modelrun=timestamp.hour,
+                    scope=cfg["scope"],
+                    levtype=levtype,
+                    timestamp=timestamp,
+                    step=timestep,
+                    level=level)
+
+
+def getGribFileUrls(model="icon-eu",
+                    grid=None,
+                    param="t_2m",
+                    timeSteps=[],
+                    timestamp=None,
+                    levtype="single-level",
+                    levelRange=[]):
+    # getGribFileUrl() for every (timestep, level), only step and level are formatted per file
+    cfg = getSupportedModels()[model]
+    if timestamp is None:
+        timestamp = getMostRecentModelTimestamp()
+
+    if (grid is None) or (grid not in cfg["grids"]):
+        grid = cfg["grids"][0]
+
+    template = getUrlTemplate(model, levtype)
+    template = template.bind(model=cfg["model"],
+                             param=param,
+                             grid=grid,
+                             modelrun=timestamp.hour,
+                             scope=cfg["scope"],
+                             levtype=levtype,
+                             timestamp=timestamp)
+    return [template(step=timestep, level=level) for timestep in timeSteps for level in levelRange]
+
+
+def downloadGribData(model="icon-eu",
+                     grid=None,
+                     param="t_2m",
+                     timestep=0,
+                     timestamp=None,
+                     destFilePath=None,
+                     destFileName=None,
+                     level=0,
+                     levtype="single-level"):
+
+    if timestamp is None:
+        timestamp = getMostRecentModelTimestamp()
+
+    dataUrl = getGribFileUrl(model=model,
+                             grid=grid,
+                             param=param,
+                             timestep=timestep,
+                             timestamp=timestamp,
+                             level=level,
+                             levtype=levtype)
+
+    output_file = downloadAndExtractBz2FileFromUrl(dataUrl,
+                                     destFilePath=destFilePath,
+                                     destFileName=destFileName)
+    return {"url": dataUrl, "file": output_file}
+
+
+def planGribDataSequence(model="icon-eu",
+                         flat=False,
+                         grid=None,
+                         param="t_2m",
+                         timeSteps=[],
+                         levelRange=[],
+                         levtype="single-level",
+                         timestamp=None,
+                         destFilePath=None):
+    # returns the downloadGribData() arguments for every (timestep, level) of a param
+    dfp = destFilePath
+    if timestamp is None:
+        timestamp = getMostRecentModelTimestamp()
+    if not flat:
+        # replicate DWD tree like
+        # https://opendata.dwd.de/weather/nwp/icon-d2/grib/00/t_2m/
+        subdir = dwdTemplate(model=model,
+                             param=param,
+                             grid=grid,
+                             modelrun=timestamp.hour,
+                             levtype=levtype,
+                             timestamp=timestamp)
+        dfp = os.path.join(destFilePath, subdir)
+
+    if not os.path.exists(dfp):
+        if dryRun:
+            log.debug(f"Creating directory: {dfp}")
+        elif outputSink is None:
+            os.makedirs(dfp)
+
+    urls = iter(getGribFileUrls(model=model,
+                                grid=grid,
+                                param=param,
+                                timeSteps=timeSteps,
+                                timestamp=timestamp,
+                                levtype=levtype,
+                                levelRange=levelRange))
+    plan = []
+    for timestep in timeSteps:
+        for level in levelRange:
+            plan.append(dict(model=model,
+                             grid=grid,
+                             param=param,
+                             timestep=timestep,
+                             timestamp=timestamp,
+                             destFilePath=dfp,
+                             level=level,
+                             levtype=levtype,
+                             url=next(urls)))
+    return plan
+
+
+def getTaskUrl(task):
+    # the url of a planned downloadGribData() call
+    if "url" in task:
+        return task["url"]
+    return getGribFileUrl(**{key: value for key, value in task.items()
+                             if key not in ("destFilePath", "destFileName")})
+
+
+class MissingDirectory(frozenset):
+    """The empty listing of a directory the server does not have (404)"""
+
+
+def getDirectoryListing(directoryUrl):
+    # names listed on the autoindex page of a directory, cached for the whole run,
+    # a MissingDirectory if there is no such directory, None if the listing is not available
+    from urllib.parse import unquote
+    with directoryListingsLock:
+        if directoryUrl in directoryListings:
+            return directoryListings[directoryUrl]
+    try:
+        with getHttpPool().urlopen(directoryUrl) as resource:
+            page = resource.read().decode("utf-8", "replace")
+        listing = set(unquote(href).rstrip("/") for href in hrefPattern.findall(page)
+                      if "://" not in href and not href.startswith(("/", "..")))
+    except HTTPError as e:
+        if e.status != 404:
+            log.warning(f"Fetching directory listing failed. Reason={e}, URL={directoryUrl}")
+            return None
+        # e.g. a misspelled param
+        listing = MissingDirectory()
+    except Exception as e:
+        log.warning(f"Fetching directory listing failed. Reason={e}, URL={directoryUrl}")
+        return None
+    with directoryListingsLock:
+        directoryListings[directoryUrl] = listing
+    return listing
+
+
+def clearDirectoryListings():
+    # forget cached listings, e.g. to see files published since the last check
+    with directoryListingsLock:
+        directoryListings.clear()
+
+
+def filterPublishedFiles(plan):
+    # drop planned files missing from the listing of their directory before sending any GET,
+    # e.g. steps of a sparse step schedule, instead of paying a 404 round trip for each of them.
+    # Returns the published tasks and the results of the dropped files: unpublished, or
+    # failed if the whole directory is missing on the server
+    urls = [getTaskUrl(task) for task in plan]
+    directories = sorted(set(url.rsplit('/', 1)[0] + '/' for url in urls))
+    if not directories:
+        return plan, []
+    with ThreadPoolExecutor(max_workers=min(maxWorkers, len(directories))) as executor:
+        listings = dict(zip(directories, executor.map(getDirectoryListing, directories)))
+
+    published = []
+    results = []
+    missingDirectories = {}
+    for task, url in zip(plan, urls):
+        directory, fileName = url.rsplit('/', 1)
+        listing = listings[directory + '/']
+        if listing is None or fileName in listing:
+            published.append(task)
+        elif isinstance(listing, MissingDirectory):
+            missingDirectories[directory + '/'] = missingDirectories.get(directory + '/', 0) + 1
+            failedFiles.append((url, 404, HTTPError))
+            if getJournal():
+                getJournal().failed(url, "directory not found")
+            results.append(makeResult(url, status="failed"))
+        else:
+            log.debug("Skipping unpublished file: '{0}'".format(url))
+            results.append(makeResult(url, status="unpublished"))
+    for directory, count in missingDirectories.items():
+        log.error(f"Directory not found on the server, {count} planned files fail. URL={directory}")
+    unpublished = len(results) - sum(missingDirectories.values())
+    if unpublished:
+        log.warning(f"Skipping {unpublished} of {len(plan)} files not listed on the server")
+    return published, results
+
+
+def getLatestPublishedModelTimestamp(model="icon-eu",
+                                     grid=None,
+                                     param="t_2m",
+                                     levtype="single-level",
+                                     level=0,
+                                     timeSteps=[0],
+                                     lookbackHours=48):
+    # newest modelrun for which the timeSteps of the probe field are published, None if the
+    # listings are not available or no run is complete.
+    # Models do not publish every step (e.g. icon is 3-hourly after step 78), so a run counts
+    # as complete once it lists all the requested steps the run before it lists: its last step
+    # is out. The oldest run looked at, or one after a run without files, needs the last
+    # requested step
+    if not timeSteps:
+        return None
+    cfg = getSupportedModels()[model]
+    modelIntervalHours = cfg["intervalHours"]
+    now = datetime.utcnow()
+    candidate = datetime(now.year, now.month, now.day,
+                         int(math.floor(now.hour / modelIntervalHours) * modelIntervalHours))
+    newer = None
+    while candidate >= now - timedelta(hours=lookbackHours):
+        urls = getGribFileUrls(model=model, grid=grid, param=param, timeSteps=timeSteps,
+                               timestamp=candidate, levtype=levtype, levelRange=[level])
+        listing = getDirectoryListing(urls[0].rsplit('/', 1)[0] + '/')
+        if listing is None:
+            return None
+        steps = {step for step, url in zip(timeSteps, urls) if url.rsplit('/', 1)[1] in listing}
+        if newer is not None:
+            newerTimestamp, newerSteps = newer
+            if newerSteps >= steps and (steps or max(timeSteps) in newerSteps):
+                return newerTimestamp
+        newer = (candidate, steps) if steps else None
+        candidate -= timedelta(hours=modelIntervalHours)
+    if newer is not None and max(timeSteps) in newer[1]:
+        return newer[0]
+    return None
+
+
+def getCachedLatestModelTimestamp(ttl=60, **probe):
+    # getLatestPublishedModelTimestamp() with the result cached on disk for ttl seconds,
+    # so frequent --get-latest-timestamp calls do not have to fetch listings every time
+    cacheFile = os.path.join(cacheDir, "latest-timestamps.json")
+    key = json.dumps(probe, sort_keys=True)
+    try:
+        with open(cacheFile, "r") as jsonfile:
+            cache = json.load(jsonfile)
+    except (OSError, ValueError):
+        cache = {}
+    entry = cache.get(key)
+    if ttl > 0 and entry and time.time() - entry["checked"] < ttl:
+        return datetime.strptime(entry["timestamp"], '%Y%m%d%H')
+
+    timestamp = getLatestPublishedModelTimestamp(**probe)
+    if timestamp is not None and ttl > 0:
+        cache[key] = {"timestamp": getTimestampString(timestamp), "checked": time.time()}
+        try:
+            os.makedirs(cacheDir, exist_ok=True)
+            tmpFile = f"{cacheFile}.{os.getpid()}.tmp"
+            with open(tmpFile, "w") as jsonfile:
+                json.dump(cache, jsonfile)
+            os.replace(tmpFile, cacheFile)
+        except OSError as e:
+            log.warning(f"Caching latest timestamp failed. Reason={e}")
+    return timestamp
+
+
+def getProbe(fieldSelection, timeSteps):
+    # the field whose listing decides the latest run: the first requested field at all requested
+    # steps, t_2m if no field is requested
+    for levtype, params, levels in fieldSelection:
+        if params and levels:
+            return dict(param=params[0], levtype=levtype, level=levels[0], timeSteps=list(timeSteps))
+    return dict(param="t_2m", levtype="single-level", level=0, timeSteps=list(timeSteps))
+
+
+def getLatestModelTimestamp(model, ttl=60, **probe):
+    # the newest run published on the server, see getLatestPublishedModelTimestamp() for the
+    # probe. Estimated from the delivery offset of the model if the listings do not tell
+    cfg = getSupportedModels()[model]
+    timestamp = None
+    if useListing:
+        timestamp = getCachedLatestModelTimestamp(ttl=ttl, model=model, **probe)
+        if timestamp is None:
+            log.warning(f"No completely published run of {model} found in the directory listings, "
+                        "estimating the latest run from the delivery offset of the model")
+    if timestamp is None:
+        timestamp = getMostRecentModelTimestamp(waitTimeMinutes=cfg["openDataDeliveryOffsetMinutes"],
+                                                modelIntervalHours=cfg["intervalHours"])
+    return timestamp
+
+
+def downloadTask(task, cancelEvent=None):
+    # downloadGribData() for the executor of downloadPlan, failures are raised for retrying
+    url = getTaskUrl(task)
+    return fetchFile(url,
+                     destFilePath=task.get("destFilePath"),
+                     destFileName=task.get("destFileName"),
+                     cancelEvent=cancelEvent)
+
+
+def iterDownloadPlanAsyncio(plan, cancelEvent):
+    # same skip-existing, compressed and dry-run semantics as downloadAndExtractBz2FileFromUrl
+    stage = None if compressed or outputSink is not None else getDecompressionStage()
+    jobs = []
+    for task in plan:
+        destFilePath = task.get("destFilePath")
+        destFileName = task.get("destFileName")
+        url = getTaskUrl(task)
+        if dryRun:
+            log.debug("Pretending to download file: '{0}' (dry-run)".format(url))
+            yield makeResult(url, status="dry-run")
+            continue
+        if outputSink is not None:
+            target = SinkTarget(url, outputSink, bufferSize=bufferSize, verify=verifyDownloads)
+            target.cancelEvent = cancelEvent
+            jobs.append((url, target))
+            continue
+        fullFilePath = getDestinationFilePath(url, destFilePath, destFileName)
+        if skipExisting and os.path.exists(fullFilePath):
+            log.debug("Skipping existing file: '{0}'".format(fullFilePath))
+            journalDone(url)
+            ensureGribIndex(fullFilePath)
+            yield makeResult(url, fullFilePath, "skipped")
+            continue
+        log.debug("Downloading file: '{0}'".format(url))
+        target = DownloadTarget(url, fullFilePath,
+                                decompress=not compressed,
+                                fetchOnly=bool(stage),
+                                bufferSize=bufferSize,
+                                verify=verifyDownloads)
+        target.cancelEvent = cancelEvent
+        setValidators(url, target)
+        jobs.append((url, target))
+
+    if getObjectStore() and outputSink is None:
+        # probe the object store in threads, before the event loop takes over
+        with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            linked = list(executor.map(lambda job: linkStoredObject(*job), jobs))
+        for (url, target), isLinked in zip(jobs, linked):
+            if isLinked:
+                journalDone(url)
+                ensureGribIndex(target.fullFilePath)
+                yield makeResult(url, target.fullFilePath, "linked")
+        jobs = [job for job, isLinked in zip(jobs, linked) if not isLinked]
+
+    # the event loop runs in its own thread and hands over the results as they complete
+    import queue
+    results = queue.Queue()
+
+    def onResult(job, fullFilePath, e):
+        url, target = job
+        if isinstance(e, concurrent.futures.CancelledError):
+            result = makeResult(url, status="cancelled")
+        elif e is not None:
+            reportDownloadFailure(url, e)
+            result = makeResult(url, status="failed")
+        elif isinstance(target, SinkTarget):
+            result = makeResult(url, status="streamed",
+                                nbytes=target.size, duration=time.time() - target.startTime)
+        elif target.fetchOnly and not target.notModified:
+            # fullFilePath is the .part file, it is handed to the decompression stage by the
+            # consuming thread below, stage.submit() blocks while the stage is busy
+            result = makeResult(url, target.fullFilePath, nbytes=target.size,
+                                duration=time.time() - target.startTime)
+            results.put((result, target, fullFilePath))
+            return
+        else:
+            if target.notModified:
+                log.debug("File is unchanged: '{0}'".format(target.fullFilePath))
+            fileDone(url, target)
+            result = makeResult(url, target.fullFilePath, "unchanged" if target.notModified else "downloaded",
+                                nbytes=target.size, duration=time.time() - target.startTime)
+        log.debug("Result: {}".format(result))
+        results.put(result)
+
+    def onDecompressed(future, result, target):
+        # failures are reported by the decompression stage
+        if future.cancelled() or future.exception() is not None:
+            result.update(file=None, status="failed")
+        else:
+            fileDone(result["url"], target)
+        results.put(result)
+
+    def runEventLoop():
+        try:
+            asyncengine.downloadAll(jobs, onResult,
+                                    maxConcurrency=maxWorkers,
+                                    connectionsPerHost=connectionsPerHost,
+                                    bufferSize=bufferSize,
+                                    resumeAttempts=resumeAttempts,
+                                    controller=getConcurrencyController(),
+                                    retryDelay=getRetryDelay,
+                                    cancelEvent=cancelEvent)
+        except BaseException as e:
+            results.put(e)
+        else:
+            results.put(None)
+
+    log.info(f"Using the asyncio engine with {maxWorkers} concurrent requests for downloading {len(jobs)} files")
+    import asyncengine
+    thread = threading.Thread(target=runEventLoop, name="asyncio-engine")
+    thread.start()
+    running = True
+    # urls of the files in the decompression stage
+    decompressing = set()
+    try:
+        while running or decompressing:
+            result = results.get()
+            if result is None:
+                running = False
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            if isinstance(result, tuple):
+                result, target, partFilePath = result
+                log.debug("Queueing file for decompression: '{0}'".format(target.fullFilePath))
+                future = stage.submit(result["url"], partFilePath, target.fullFilePath)
+                decompressing.add(result["url"])
+                future.add_done_callback(functools.partial(onDecompressed, result=result, target=target))
+                continue
+            decompressing.discard(result["url"])
+            yield result
+    finally:
+        # the caller stopped iterating, the remaining downloads are cancelled
+        if thread.is_alive():
+            cancelEvent.set()
+        thread.join()
+
+
+def iterDownloadPlanThreads(plan, cancelEvent, pollInterval=0.5):
+    # download all planned files through a single executor, so the workers stay busy
+    # across params and level types instead of draining at the end of every param
+    log.info(f"Using {maxWorkers} workers for downloading {len(plan)} files")
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = {executor.submit(downloadTask, task, cancelEvent): (task, {}) for task in plan}
+        # failed files wait here for their retry, ordered by the time they are due
+        delayed = []
+        sequence = 0
+        # results of downloaded files that are being decompressed by the decompression stage
+        decompressing = {}
+        try:
+            while (futures or delayed or decompressing) and not cancelEvent.is_set():
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    _, _, task, attempts = heapq.heappop(delayed)
+                    futures[executor.submit(downloadTask, task, cancelEvent)] = (task, attempts)
+                # wake up regularly to notice a cancellation
+                timeout = min(pollInterval, max(0, delayed[0][0] - now)) if delayed else pollInterval
+                done, _ = concurrent.futures.wait(list(futures) + list(decompressing), timeout=timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future in decompressing:
+                        # failures are reported by the decompression stage
+                        result = decompressing.pop(future)
+                        if future.exception() is not None:
+                            result.update(file=None, status="failed")
+                        yield result
+                        continue
+                    task, attempts = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        url = getTaskUrl(task)
+                        delay = getRetryDelay(e, attempts)
+                        if isinstance(e, concurrent.futures.CancelledError):
+                            result = makeResult(url, status="cancelled")
+                        elif delay is None:
+                            reportDownloadFailure(url, e)
+                            result = makeResult(url, status="failed")
+                        else:
+                            log.warning(f"Downloading failed, retrying in {delay:.1f} seconds. Reason={e!r}, URL={url}")
+                            sequence += 1
+                            heapq.heappush(delayed, (time.monotonic() + delay, sequence, task, attempts))
+                            continue
+                    log.debug("Result: {}".format(result))
+                    decompression = result.pop("decompression", None)
+                    if decompression:
+                        decompressing[decompression] = result
+                        continue
+                    yield result
+        finally:
+            # cancelled, or the caller stopped iterating: the files in flight stop at their next chunk
+            if futures or delayed:
+                cancelEvent.set()
+                for future in futures:
+                    future.cancel()
+
+    # cancelled, the executor has finished the files that were in flight
+    for future, (task, _) in futures.items():
+        url = getTaskUrl(task)
+        try:
+            result = future.result()
+        except concurrent.futures.CancelledError:
+            result = makeResult(url, status="cancelled")
+        except Exception as e:
+            reportDownloadFailure(url, e)
+            result = makeResult(url, status="failed")
+        decompression = result.pop("decompression", None)
+        if decompression:
+            decompressing[decompression] = result
+            continue
+        yield result
+    for _, _, task, _ in delayed:
+        yield makeResult(getTaskUrl(task), status="cancelled")
+    for future in concurrent.futures.as_completed(decompressing):
+        result = decompressing[future]
+        if future.exception() is not None:
+            result.update(file=None, status="failed")
+        yield result
+
+
+def iterPlanResults(plan, cancelEvent):
+    if useListing and not dryRun:
+        plan, results = filterPublishedFiles(plan)
+        yield from results
+
+    plan, results = journalPlan(plan)
+    yield from results
+
+    if engine == "asyncio":
+        yield from iterDownloadPlanAsyncio(plan, cancelEvent)
+    else:
+        yield from iterDownloadPlanThreads(plan, cancelEvent)
+
+
+def iterDownloadPlan(plan, cancelEvent=None):
+    """Downloads the planned files, yields the result of every file as it completes
+
+    The results are makeResult() dicts. Setting the threading.Event cancelEvent stops the
+    remaining downloads, they are yielded with the status cancelled.
+    """
+    if cancelEvent is None:
+        cancelEvent = threading.Event()
+    if outputSink is not None:
+        # the whole plan, the files that are not downloaded are skipped below
+        outputSink.expect([dict(task, url=getTaskUrl(task)) for task in plan])
+    for result in iterPlanResults(plan, cancelEvent):
+        if outputSink is not None and result["status"] != "streamed" and not cancelEvent.is_set():
+            # the files planned after it are not held back for it, once cancelled close() writes them
+            try:
+                outputSink.skip(result["url"])
+            except OSError as e:
+                log.error(f"{getOutputError(e, result['url'], cancelEvent)}, URL={result['url']}")
+        yield result
+
+    if decompressionStage:
+        decompressionStage.wait()
+
+
+def downloadPlan(plan):
+    return list(iterDownloadPlan(plan))
+
+
+def downloadGribDataSequence(model="icon-eu",
+                             flat=False,
+                             grid=None,
+                             param="t_2m",
+                             timeSteps=[],
+                             levelRange=[],
+                             levtype="single-level",
+                             timestamp=None,
+                             destFilePath=None):
+    return downloadPlan(planGribDataSequence(model=model,
+                                             flat=flat,
+                                             grid=grid,
+                                             param=param,
+                                             timeSteps=timeSteps,
+                                             levelRange=levelRange,
+                                             levtype=levtype,
+                                             timestamp=timestamp,
+                                             destFilePath=destFilePath))
+
+
+def watchPlan(plan, pollInterval=60, timeout=None):
+    # poll the directory listings and download planned files as soon as they are published,
+    # until all planned files are downloaded or timeout seconds have passed. Returns the last
+    # result of every planned file
+    deadline = time.time() + timeout if timeout else None
+    pending = list(plan)
+    results = {}
+    while pending:
+        clearDirectoryListings()
+        # a file that failed in an earlier poll is tried again, only its last failure is reported
+        pendingUrls = {getTaskUrl(task) for task in pending}
+        failedFiles[:] = [failure for failure in failedFiles if failure[0] not in pendingUrls]
+        downloaded = set()
+        for result in downloadPlan(pending):
+            results[result["url"]] = result
+            if result["status"] not in ("failed", "cancelled", "unpublished"):
+                downloaded.add(result["url"])
+        pending = [task for task in pending if getTaskUrl(task) not in downloaded]
+        if not pending:
+            break
+        if deadline and time.time() + pollInterval > deadline:
+            log.error(f"Watch timeout reached, {len(pending)} files were not published")
+            break
+        log.info(f"Waiting for {len(pending)} files, next check in {pollInterval} seconds")
+        time.sleep(pollInterval)
+    return list(results.values())
+
+
+# the module settings behind the command line options that configure() sets
+SETTINGS = ("dryRun", "compressed", "skipExisting", "maxWorkers", "connectionsPerHost",
+            "bufferSize", "decompressProcesses", "decompressQueueSize", "engine", "useListing",
+            "cacheDir", "resumeAttempts", "verifyDownloads", "adaptiveConcurrency", "minWorkers",
+            "retryBudget", "journalPath", "objectStorePath", "objectStoreMaxBytes", "retryBaseDelay",
+            "retryMaxDelay", "latestTimestampCacheTtl", "httpProxy", "outputSink", "gribIndex",
+            "cropBox", "regridTarget", "gridCoordinatePaths")
+defaultSettings = {name: globals()[name] for name in SETTINGS}
+defaultSettings["retryBudget"] = dict(retryBudget)
+# the Downloader whose settings are applied, see Downloader._activate()
+activeDownloader = None
+activeDownloaderLock = threading.Lock()
+
+
+def configure(**settings):
+    """Sets the module settings, the ones not given back to their defaults
+
+    The settings are process-wide. When they change, the connection pool, journal, object
+    store, decompression stage and concurrency controller built from the previous settings
+    are closed, the next download builds them anew; a new outputSink alone keeps them.
+    retryBudget is merged with the default budget.
+    """
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise TypeError(f"unknown settings: {', '.join(sorted(unknown))}")
+    values = dict(defaultSettings, **settings)
+    values["retryBudget"] = dict(defaultSettings["retryBudget"], **values["retryBudget"])
+    if values["httpProxy"] and values["engine"] == "asyncio":
+        raise ValueError("httpProxy is not supported by the asyncio engine")
+    changed = {name for name in SETTINGS if values[name] != globals()[name]}
+    if changed - {"outputSink"}:
+        closeSharedResources()
+    globals().update(values)
+
+
+def closeSharedResources():
+    # the next download builds them from the current settings
+    global httpPool, journal, objectStore, concurrencyController
+    shutdownDecompressionStage()
+    with lazyInitLock:
+        resources = [httpPool, journal, objectStore]
+        httpPool = journal = objectStore = concurrencyController = None
+    for resource in resources:
+        if resource is not None:
+            resource.close()
+
+
+class Downloader(object):
+    """Library interface: plans and downloads the files of a model, file by file
+
+        downloader = Downloader("icon-d2", destFilePath="/data", maxWorkers=50)
+        plan = downloader.plan(["t_2m", "tot_prec"], timeSteps=range(0, 49))
+        for result in downloader.fetch(plan):
+            print(result["status"], result["file"], result["bytes"], result["duration"])
+
+    The settings are the module settings behind the command line options, see configure().
+    They are process-wide, not per instance: a Downloader applies its settings, the others
+    at their defaults, when it is created and whenever it is used after another one, and
+    using one while another is fetching raises RuntimeError. With
+    outputSink=sink.OutputSink(stream) the decompressed files are written to stream instead
+    of destFilePath. cancel() stops a running fetch(), from any thread.
+    """
+
+    SETTINGS = SETTINGS
+
+    def __init__(self, model="icon-eu", grid=None, destFilePath=None, flat=False, **settings):
+        unknown = set(settings) - set(self.SETTINGS)
+        if unknown:
+            raise TypeError(f"unknown settings: {', '.join(sorted(unknown))}")
+        self.settings = settings
+        self.model = getSupportedModels()[model.lower()]
+        self.grid = grid
+        self.destFilePath = destFilePath or os.getcwd()
+        self.flat = flat
+        self.cancelEvent = threading.Event()
+        self.fetching = 0
+        self._activate()
+
+    def _activate(self, fetching=0):
+        # applies the settings of this instance unless they are the active ones
+        global activeDownloader
+        with activeDownloaderLock:
+            if activeDownloader is not self:
+                if activeDownloader is not None and activeDownloader.fetching:
+                    raise RuntimeError("another Downloader is fetching, the settings are process-wide")
+                configure(**self.settings)
+                activeDownloader = self
+            self.fetching += fetching
+
+    def latestTimestamp(self, param="t_2m", levtype="single-level", level=0, timeSteps=(0,)):
+        """The newest published run of the model, from the listings or estimated from its delivery offset"""
+        self._activate()
+        return getLatestModelTimestamp(self.model["model"], ttl=latestTimestampCacheTtl, grid=self.grid,
+                                       **getProbe([(levtype, [param], [level])], timeSteps))
+
+    def plan(self, params, timeSteps, levelRange=[0], levtype="single-level", timestamp=None):
+        """Returns the plan of the files of params for all timeSteps and levels of a run"""
+        if isinstance(params, str):
+            params = [params]
+        self._activate()
+        timeSteps = list(timeSteps)
+        levelRange = list(levelRange)
+        if timestamp is None:
+            timestamp = self.latestTimestamp(**getProbe([(levtype, params, levelRange)], timeSteps))
+        plan = []
+        for param in params:
+            plan.extend(planGribDataSequence(model=self.model["model"],
+                                             flat=self.flat,
+                                             grid=self.grid,
+                                             param=param,
+                                             timeSteps=timeSteps,
+                                             levelRange=levelRange,
+                                             levtype=levtype,
+                                             timestamp=timestamp,
+                                             destFilePath=self.destFilePath))
+        return plan
+
+    def fetch(self, plan):
+        """Downloads the planned files, yields their results as they complete, see iterDownloadPlan()
+
+        Leaving the loop early cancels the remaining downloads.
+        """
+        self._activate()
+        self.cancelEvent = threading.Event()
+        return self._fetch(plan, self.cancelEvent)
+
+    def _fetch(self, plan, cancelEvent):
+        self._activate(fetching=1)
+        try:
+            yield from iterDownloadPlan(plan, cancelEvent=cancelEvent)
+        finally:
+            with activeDownloaderLock:
+                self.fetching -= 1
+            shutdownDecompressionStage()
+
+    def cancel(self):
+        """Stops the running fetch(), the remaining files are yielded as cancelled"""
+        self.cancelEvent.set()
+
+
+def formatDateIso8601(date):
+    return date.replace(microsecond=0, tzinfo=timezone.utc).isoformat()
+
+
+def getTimestampString(date):
+    modelrun = "{0:02d}".format(date.hour)
+    return date.strftime("%Y%m%d" + modelrun)
+
+
+def getParser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='A tool to download grib model data from DWD\'s open data server https://opendata.dwd.de .',
+        add_help=True)
+
+    parser.add_argument('--model', choices=getSupportedModels().keys(),
+                        dest='model',
+                        type=str,
+                        required=True,
+                        help='the model name')
+
+    parser.add_argument('--grid', choices=["icosahedral", "regular-lat-lon", "rotated-lat-lon"],
+                        dest='grid',
+                        type=str,
+                        required=False,
+                        default=None,
+                        help='the grid type')
+
+    parser.add_argument('--get-latest-timestamp',
+                        dest='getLatestTimestamp',
+                        action='store_true',
+                        help='Returns the latest available timestamp for the specified model: the newest run '
+                             'publishing the first requested field at all requested steps (t_2m without '
+                             'fields). Pass it with --modelrun to later calls, which probe their own fields.')
+
+    parser.add_argument('--single-level-fields',
+                        dest='single_level_params',
+                        nargs='+',
+                        metavar='shortName',
+                        type=str,
+                        default=[],
+                        help='one or more single-level model fields that should be downloaded, e.g. t_2m, tmax_2m, clch, pmsl, ...')
+
+    parser.add_argument('--model-level-fields',
+                        dest='model_level_params',
+                        nargs='+',
+                        metavar='shortName',
+                        type=str,
+                        default=[],  # ['t_2m'],
+                        help='one or more model-level fields that should be downloaded, e.g. u, v, p, m, ...')
+
+    parser.add_argument('--pressure-level-fields',
+                        dest='pressure_level_params',
+                        nargs='+',
+                        metavar='shortName',
+                        type=str,
+                        default=[],
+                        help='one or more pressure-level fields that should be downloaded, e.g. u, v, p, m, ...')
+
+    parser.add_argument('--time-invariant-fields',
+                        dest='time_invariant_params',
+                        nargs='+',
+                        metavar='shortName',
+                        type=str,
+                        default=[],
+                        help='one or more time invariant fields that should be downloaded, e.g. hhl, ...')
+
+    parser.add_argument('--min-model-level',
+                        dest='minModelLevel',
+                        default=0,
+                        type=int,
+                        metavar='LEVEL',
+                        help='the minimum level number to download (default=0)')
+
+    parser.add_argument('--max-model-level', dest='maxModelLevel', default=0,  # 90,
+                        type=int,
+                        metavar='LEVEL',
+                        help='the maximum level number to download (default=0)')
+
+    parser.add_argument('--pressure-levels', dest='pressureLevels',
+                        default=[],
+                        type=str,
+                        nargs='+',
+                        metavar='PRESSURELEVEL',
+                        help='a list of pressure levels. e.g. 1000 975 950 850')
+
+    parser.add_argument('--min-time-step',
+                        dest='minTimeStep',
+                        default=0,
+                        type=int,
+                        metavar='STEP',
+                        help='the minimum forecast time step to download (default=0)')
+
+    parser.add_argument('--max-time-step',
+                        dest='maxTimeStep',
+                        default=0,
+                        type=int,
+                        metavar='STEP',
+                        help='the maximung forecast time step to download, e.g. 12 will download time steps from min-time-step - 12. If no max-time-step was defined, no data will be downloaded.')
+
+    parser.add_argument('--directory', dest='destFilePath', default=os.getcwd(),
+                        help='the download directory')
+
+    parser.add_argument('--modelrun', dest='modelrun', default=None,
+                        help='explicitly download from a particular model run. Example: --modelrun 2020121212')
+
+    parser.add_argument('--http-proxy', dest='proxy', metavar='proxy_name_or_ip:port', required=False,
+                        help='the http proxy url and port')
+
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_const", dest="loglevel", const=log.INFO)
+
+    parser.add_argument("-d", "--dry-run", help="only show debug output, do not download",
+                        action="store_true", dest="dryRun")
+
+    parser.add_argument("-f", "--flat",
+                        help="store all files under --directory "
+                        "-  default is to retain the opendata.dwd.de directory structure "
+                        "and create subdirectories under  --directory as needed",
+                        action="store_true",
+                        dest="flat")
+
+    parser.add_argument("-c", "--compressed", help="store as bz2 file (do not uncompress)",
+                        action="store_true", dest="compressed")
+    parser.add_argument("-r", "--reload", help="reload files even if bz2 file exists - default to skipping existing files. "
+                        "With --journal, unchanged files are not transferred again",
+                        action="store_false", default=True, dest="skipexisting")
+
+    parser.add_argument('--max-workers', dest='maxWorkers', default=20, type=int,
+                        help='number of thread workers for parallel download')
+
+    parser.add_argument('--engine', dest='engine', choices=["threads", "asyncio"], default="threads",
+                        help='download with a pool of --max-workers threads or with an asyncio event loop '
+                        'running up to --max-workers concurrent requests (default=threads)')
+
+    parser.add_argument('--no-listing', dest='useListing', action='store_false', default=True,
+                        help='do not check the directory listings on the server before downloading '
+                        '- default is to skip files that are not published')
+
+    parser.add_argument('--connections-per-host', dest='connectionsPerHost', default=None, type=int,
+                        metavar='N',
+                        help='maximum number of persistent (keep-alive) connections per host (default=--max-workers)')
+
+    parser.add_argument('--cache-dir', dest='cacheDir', default=cacheDir,
+                        help=f'directory for cached server state (default={cacheDir})')
+
+    parser.add_argument('--latest-timestamp-ttl', dest='latestTimestampCacheTtl', default=60, type=int,
+                        metavar='SECONDS',
+                        help='reuse the latest published model run found on the server for this many seconds, 0 disables the cache (default=60)')
+
+    parser.add_argument('--watch', dest='watch', action='store_true',
+                        help='keep polling the server and download files as soon as they are published, '
+                        'until all requested files are downloaded')
+
+    parser.add_argument('--poll-interval', dest='pollInterval', default=60, type=int,
+                        metavar='SECONDS',
+                        help='seconds between two checks for new files in --watch mode (default=60)')
+
+    parser.add_argument('--watch-timeout', dest='watchTimeout', default=6 * 3600, type=int,
+                        metavar='SECONDS',
+                        help='give up waiting for files in --watch mode after this many seconds, 0 waits forever (default=21600)')
+
+    parser.add_argument('--resume-attempts', dest='resumeAttempts', default=3, type=int,
+                        metavar='N',
+                        help='resume an interrupted download up to N times with HTTP Range requests (default=3)')
+
+    parser.add_argument('--no-verify', dest='verifyDownloads', action='store_false', default=True,
+                        help='do not check the bz2 stream end and the GRIB end section of downloaded files '
+                        '- the size is always checked')
+
+    parser.add_argument('--adaptive-concurrency', dest='adaptiveConcurrency', action='store_true',
+                        help='adjust the number of requests in flight between --min-workers and --max-workers '
+                        'to the measured latency and the error and throttling (429/503) rates')
+
+    parser.add_argument('--min-workers', dest='minWorkers', default=2, type=int,
+                        metavar='N',
+                        help='lower bound for --adaptive-concurrency (default=2)')
+
+    parser.add_argument('--retry-budget', dest='retryBudget', nargs='+', default=[],
+                        metavar='CLASS=N',
+                        help='number of retries per file and error class, classes are connection, server (5xx), '
+                        'throttled (429/503), integrity, client (4xx) and other '
+                        '(default: connection=5 server=3 throttled=5 integrity=2)')
+
+    parser.add_argument('--retry-base-delay', dest='retryBaseDelay', default=1.0, type=float,
+                        metavar='SECONDS',
+                        help='the first retry waits up to this long, doubling with every further retry (default=1)')
+
+    parser.add_argument('--retry-max-delay', dest='retryMaxDelay', default=60.0, type=float,
+                        metavar='SECONDS',
+                        help='upper limit for the wait before a retry (default=60)')
+
+    parser.add_argument('--journal', dest='journalPath', default=None, nargs='?', const='',
+                        metavar='PATH',
+                        help='record the planned and downloaded files in an SQLite journal, a restarted run downloads only '
+                        'the files the journal does not know to be done (default PATH=DESTFILEPATH/.opendata-journal.sqlite)')
+
+    parser.add_argument('--invariant-cache', dest='objectStorePath', default=None, nargs='?', const='',
+                        metavar='DIR',
+                        help='keep time-invariant files in a content-addressed store and hard-link them into every model run, '
+                        'files that did not change are not transferred again, DIR belongs on the file system of --directory '
+                        '(default DIR=CACHEDIR/objects)')
+
+    parser.add_argument('--invariant-cache-size', dest='objectStoreMaxBytes', default=10 * 1024 ** 3, type=int,
+                        metavar='BYTES',
+                        help='evict the least recently used files when the store grows larger (default=10737418240)')
+
+    parser.add_argument('--retain-runs', dest='retainRuns', default=None, type=int,
+                        metavar='N',
+                        help='keep only the N most recent model runs per model below --directory, older runs are deleted')
+
+    parser.add_argument('--retain-bytes', dest='retainBytes', default=None, type=int,
+                        metavar='BYTES',
+                        help='delete the oldest model runs below --directory while they take more than BYTES')
+
+    parser.add_argument('--retention-interval', dest='retentionInterval', default=60, type=int,
+                        metavar='SECONDS',
+                        help='seconds between two retention checks while downloading (default=60)')
+
+    parser.add_argument('--buffer-size', dest='bufferSize', default=1024 * 1024, type=int,
+                        metavar='BYTES',
+                        help='read and decompress downloads in chunks of this size, bounds the memory used per worker (default=1048576)')
+
+    parser.add_argument('--decompress-processes', dest='decompressProcesses', default=0, type=int,
+                        nargs='?', const=os.cpu_count(), metavar='N',
+                        help='decompress in a pool of N worker processes instead of the download threads '
+                        '(default: off, N defaults to the number of CPUs)')
+
+    parser.add_argument('--decompress-queue-size', dest='decompressQueueSize', default=None, type=int,
+                        metavar='N',
+                        help='maximum number of compressed files waiting for decompression (default=2*N)')
+
+    parser.add_argument('--grib-index', dest='gribIndex', action='store_true', default=False,
+                        help='write an index of the GRIB messages (offsets, lengths, parameter, level, step, grid) '
+                        'next to every file as FILE.idx.json, built while the file is decompressed')
+
+    parser.add_argument('--bbox', dest='bbox', nargs=4, type=float, default=None,
+                        metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'),
+                        help='crop the fields of regular-lat-lon grids to this box in degrees while decompressing, '
+                        'needs the numpy and eccodes packages')
+
+    parser.add_argument('--regrid', dest='regrid', nargs=5, type=float, default=None,
+                        metavar=('WEST', 'SOUTH', 'EAST', 'NORTH', 'RESOLUTION'),
+                        help='regrid the fields of the icosahedral grid to a regular-lat-lon grid of this box and '
+                        'resolution in degrees while decompressing, needs --grid-coordinates and the numpy and eccodes '
+                        'packages; the interpolation weights are built once per grid (needs scipy) and cached in '
+                        '--cache-dir')
+
+    parser.add_argument('--merge', dest='merge', choices=["param", "run"], default=None,
+                        help='append the messages of all files to one GRIB file per param or per model run in '
+                        '--directory, in the order they complete, each with an index of its messages in FILE.idx.json')
+
+    parser.add_argument('--stations', dest='stations', default=None, metavar='FILE',
+                        help='extract the values at the stations of FILE (CSV with name, lat and lon columns) and append '
+                        'them to a CSV time series in --directory instead of storing the fields, needs the numpy and '
+                        'eccodes packages, and scipy for grids other than regular-lat-lon')
+
+    parser.add_argument('--grid-coordinates', dest='gridCoordinates', nargs=2, default=None,
+                        metavar=('CLAT', 'CLON'),
+                        help='GRIB files of the time-invariant clat and clon fields, the cell coordinates of the '
+                        'icosahedral grid for --stations and --regrid')
+
+    parser.add_argument('--stdout', dest='stdout', action='store_true', default=False,
+                        help='write the decompressed GRIB data of all files to stdout instead of --directory, '
+                        'nothing is stored on disk')
+
+    parser.add_argument('--stdout-order', dest='stdoutOrder', choices=["plan", "completed"], default="plan",
+                        help='with --stdout, write the files in the order they are planned (holding back files '
+                        'that complete early, in memory up to 256 MB and in a temporary file beyond) or in the '
+                        'order they complete (default=plan)')
+
+    return parser
+
+
+"""
+usage: opendata-downloader.py [-h] --model {cosmo-d2,cosmo-d2-eps,icon,icon-eps,icon-eu,icon-eu-eps,icon-d2,icon-d2-eps} [--grid {icosahedral,regular-lat-lon,rotated-lat-lon}]
+                              [--get-latest-timestamp] [--single-level-fields shortName [shortName ...]] [--model-level-fields shortName [shortName ...]]
+                              [--pressure-level-fields shortName [shortName ...]] [--time-invariant-fields shortName [shortName ...]] [--min-model-level LEVEL]
+                              [--max-model-level LEVEL] [--pressure-levels PRESSURELEVEL [PRESSURELEVEL ...]] [--min-time-step STEP] [--max-time-step STEP]
+                              [--directory DESTFILEPATH] [--modelrun MODELRUN] [--http-proxy proxy_name_or_ip:port] [-v] [-d] [-f] [-c] [-r] [--max-workers MAXWORKERS]
+                              [--engine {threads,asyncio}] [--no-listing] [--connections-per-host N]
+                              [--cache-dir CACHEDIR] [--latest-timestamp-ttl SECONDS]
+                              [--watch] [--poll-interval SECONDS] [--watch-timeout SECONDS]
+                              [--resume-attempts N] [--no-verify] [--adaptive-concurrency] [--min-workers N]
+                              [--retry-budget CLASS=N [CLASS=N ...]] [--retry-base-delay SECONDS] [--retry-max-delay SECONDS]
+                              [--journal [PATH]] [--invariant-cache [DIR]] [--invariant-cache-size BYTES]
+                              [--retain-runs N] [--retain-bytes BYTES] [--retention-interval SECONDS] [--buffer-size BYTES]
+                              [--decompress-processes [N]] [--decompress-queue-size N] [--grib-index] [--bbox WEST SOUTH EAST NORTH]
+                              [--regrid WEST SOUTH EAST NORTH RESOLUTION] [--merge {param,run}]
+                              [--stations FILE] [--grid-coordinates CLAT CLON] [--stdout] [--stdout-order {plan,completed}]
+
+A tool to download grib model data from DWD's open data server https://opendata.dwd.de .
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --model {cosmo-d2,cosmo-d2-eps,icon,icon-eps,icon-eu,icon-eu-eps,icon-d2,icon-d2-eps}
+                        the model name
+  --grid {icosahedral,regular-lat-lon,rotated-lat-lon}
+                        the grid type
+  --get-latest-timestamp
+                        Returns the latest available timestamp for the specified model: the newest run publishing the first
+                        requested field at all requested steps (t_2m without fields). Pass it with --modelrun to later calls,
+                        which probe their own fields.
+  --single-level-fields shortName [shortName ...]
+                        one or more single-level model fields that should be downloaded, e.g. t_2m, tmax_2m, clch, pmsl, ...
+  --model-level-fields shortName [shortName ...]
+                        one or more model-level fields that should be downloaded, e.g. u, v, p, m, ...
+  --pressure-level-fields shortName [shortName ...]
+                        one or more pressure-level fields that should be downloaded, e.g. u, v, p, m, ...
+  --time-invariant-fields shortName [shortName ...]
+                        one or more time invariant fields that should be downloaded, e.g. hhl, ...
+  --min-model-level LEVEL
+                        the minimum level number to download (default=0)
+  --max-model-level LEVEL
+                        the maximum level number to download (default=0)
+  --pressure-levels PRESSURELEVEL [PRESSURELEVEL ...]
+                        a list of pressure levels. e.g. 1000 975 950 850
+  --min-time-step STEP  the minimum forecast time step to download (default=0)
+  --max-time-step STEP  the maximung forecast time step to download, e.g. 12 will download time steps from min-time-step - 12. If no max-time-step was defined, no data will be
+                        downloaded.
+  --directory DESTFILEPATH
+                        the download directory
+  --modelrun MODELRUN   explicitly download from a particular model run. Example: --modelrun 2020121212
+  --http-proxy proxy_name_or_ip:port
+                        the http proxy url and port
+  -v, --verbose         increase output verbosity
+  -d, --dry-run         only show debug output, do not download
+  -f, --flat            store all files in under --directory - default is to retain the opendata.dwd.de directory structure and create subdirectories under --directory as needed
+  -c, --compressed      store as bz2 file (do not uncompress)
+  -r, --reload          reload files even if bz2 file exists - default to skipping existing files. With --journal, unchanged files are not transferred again
+  --max-workers MAXWORKERS
+                        number of thread workers for parallel download
+  --engine {threads,asyncio}
+                        download with a pool of --max-workers threads or with an asyncio event loop running up to --max-workers concurrent requests (default=threads)
+  --no-listing          do not check the directory listings on the server before downloading - default is to skip files that are not published
+  --connections-per-host N
+                        maximum number of persistent (keep-alive) connections per host (default=--max-workers)
+  --cache-dir CACHEDIR  directory for cached server state (default=~/.cache/opendata-downloader)
+  --latest-timestamp-ttl SECONDS
+                        reuse the latest published model run found on the server for this many seconds, 0 disables the cache (default=60)
+  --watch               keep polling the server and download files as soon as they are published, until all requested files are downloaded
+  --poll-interval SECONDS
+                        seconds between two checks for new files in --watch mode (default=60)
+  --watch-timeout SECONDS
+                        give up waiting for files in --watch mode after this many seconds, 0 waits forever (default=21600)
+  --resume-attempts N   resume an interrupted download up to N times with HTTP Range requests (default=3)
+  --no-verify           do not check the bz2 stream end and the GRIB end section of downloaded files - the size is always checked
+  --adaptive-concurrency
+                        adjust the number of requests in flight between --min-workers and --max-workers to the measured latency and the error and throttling (429/503) rates
+  --min-workers N       lower bound for --adaptive-concurrency (default=2)
+  --retry-budget CLASS=N [CLASS=N ...]
+                        number of retries per file and error class, classes are connection, server (5xx), throttled (429/503), integrity, client (4xx) and other (default: connection=5 server=3 throttled=5
+                        integrity=2)
+  --retry-base-delay SECONDS
+                        the first retry waits up to this long, doubling with every further retry (default=1)
+  --retry-max-delay SECONDS
+                        upper limit for the wait before a retry (default=60)
+  --journal [PATH]      record the planned and downloaded files in an SQLite journal, a restarted run downloads only the files the journal does not know to be done (default
+                        PATH=DESTFILEPATH/.opendata-journal.sqlite)
+  --invariant-cache [DIR]
+                        keep time-invariant files in a content-addressed store and hard-link them into every model run, files that did not change are not transferred again, DIR
+                        belongs on the file system of --directory (default DIR=CACHEDIR/objects)
+  --invariant-cache-size BYTES
+                        evict the least recently used files when the store grows larger (default=10737418240)
+  --retain-runs N       keep only the N most recent model runs per model below --directory, older runs are deleted
+  --retain-bytes BYTES  delete the oldest model runs below --directory while they take more than BYTES
+  --retention-interval SECONDS
+                        seconds between two retention checks while downloading (default=60)
+  --buffer-size BYTES   read and decompress downloads in chunks of this size, bounds the memory used per worker (default=1048576)
+  --decompress-processes [N]
+                        decompress in a pool of N worker processes instead of the download threads (default: off, N defaults to the number of CPUs)
+  --decompress-queue-size N
+                        maximum number of compressed files waiting for decompression (default=2*N)
+  --grib-index          write an index of the GRIB messages (offsets, lengths, parameter, level, step, grid) next to every file as FILE.idx.json, built
+                        while the file is decompressed
+  --bbox WEST SOUTH EAST NORTH
+                        crop the fields of regular-lat-lon grids to this box in degrees while decompressing, needs the numpy and eccodes packages
+  --regrid WEST SOUTH EAST NORTH RESOLUTION
+                        regrid the fields of the icosahedral grid to a regular-lat-lon grid of this box and resolution in degrees while
+                        decompressing, needs --grid-coordinates and the numpy and eccodes packages; the interpolation weights are built once
+                        per grid (needs scipy) and cached in --cache-dir
+  --merge {param,run}   append the messages of all files to one GRIB file per param or per model run in --directory, in the order they
+                        complete, each with an index of its messages in FILE.idx.json
+  --stations FILE       extract the values at the stations of FILE (CSV with name, lat and lon columns) and append them to a CSV time series in
+                        --directory instead of storing the fields, needs the numpy and eccodes packages, and scipy for grids other than
+                        regular-lat-lon
+  --grid-coordinates CLAT CLON
+                        GRIB files of the time-invariant clat and clon fields, the cell coordinates of the icosahedral grid for --stations
+                        and --regrid
+  --stdout              write the decompressed GRIB data of all files to stdout instead of --directory, nothing is stored on disk
+  --stdout-order {plan,completed}
+                        with --stdout, write the files in the order they are planned (holding back files that complete early, in memory up to 256 MB
+                        and in a temporary file beyond) or in the order they complete (default=plan)
+"""
+def main(argv=None):
+    logformat = "[%(filename)s:%(lineno)s - %(funcName)20s() ] %(message)s"
+
+    parser = getParser()
+    args = parser.parse_args(argv)
+    if args.loglevel:
+        log.basicConfig(format=logformat, level=log.DEBUG)  # verbose
+    else:
+        log.basicConfig(format=logformat, level=log.ERROR)  # default
+
+    # the module settings, applied by configure() once the options are checked
+    settings = dict(dryRun=args.dryRun,
+                    compressed=args.compressed,
+                    skipExisting=args.skipexisting,
+                    maxWorkers=args.maxWorkers,
+                    connectionsPerHost=args.connectionsPerHost,
+                    bufferSize=args.bufferSize,
+                    decompressProcesses=args.decompressProcesses,
+                    decompressQueueSize=args.decompressQueueSize,
+                    engine=args.engine,
+                    useListing=args.useListing,
+                    cacheDir=args.cacheDir,
+                    resumeAttempts=args.resumeAttempts,
+                    verifyDownloads=args.verifyDownloads,
+                    adaptiveConcurrency=args.adaptiveConcurrency,
+                    minWorkers=args.minWorkers,
+                    gribIndex=args.gribIndex,
+                    objectStoreMaxBytes=args.objectStoreMaxBytes,
+                    retryBaseDelay=args.retryBaseDelay,
+                    retryMaxDelay=args.retryMaxDelay,
+                    latestTimestampCacheTtl=args.latestTimestampCacheTtl,
+                    httpProxy=args.proxy,
+                    retryBudget={})
+    if args.journalPath is not None:
+        settings["journalPath"] = args.journalPath or os.path.join(args.destFilePath, ".opendata-journal.sqlite")
+    if args.objectStorePath is not None:
+        settings["objectStorePath"] = args.objectStorePath or os.path.join(args.cacheDir, "objects")
+    for budget in args.retryBudget:
+        errorClass, _, retries = budget.partition("=")
+        if errorClass not in ("connection", "server", "throttled", "integrity", "client", "other") \
+                or not retries.isdigit():
+            parser.error(f"invalid --retry-budget {budget!r}")
+        settings["retryBudget"][errorClass] = int(retries)
+
+    if args.stdout:
+        if args.compressed or args.journalPath is not None or args.objectStorePath is not None \
+                or args.retainRuns or args.retainBytes or args.gribIndex or args.merge:
+            parser.error("--stdout cannot be combined with -c, --journal, --invariant-cache, --retain-*, "
+                         "--grib-index or --merge")
+        from sink import OutputSink
+        settings["outputSink"] = OutputSink(sys.stdout.buffer, ordered=args.stdoutOrder == "plan")
+
+    if args.merge:
+        if args.compressed or args.journalPath is not None or args.objectStorePath is not None or args.gribIndex:
+            parser.error("--merge cannot be combined with -c, --journal, --invariant-cache or --grib-index")
+        from sink import MergedOutput
+        perParam = args.merge == "param"
+        settings["outputSink"] = MergedOutput(args.destFilePath, lambda task: getMergedFileName(task, perParam))
+
+    if args.bbox:
+        west, south, east, north = args.bbox
+        if args.compressed or args.objectStorePath is not None:
+            parser.error("--bbox crops decompressed files, it cannot be combined with -c or --invariant-cache")
+        if not (-90 <= south < north <= 90):
+            parser.error("--bbox needs -90 <= SOUTH < NORTH <= 90")
+        try:
+            from gribgrid import importDependencies
+            importDependencies()
+        except ImportError as e:
+            parser.error(f"--bbox needs the numpy and eccodes packages: {e}")
+        settings["cropBox"] = (west, south, east, north)
+
+    if args.regrid:
+        west, south, east, north, resolution = args.regrid
+        if args.compressed or args.objectStorePath is not None or args.bbox:
+            parser.error("--regrid cannot be combined with -c, --invariant-cache or --bbox")
+        if not args.gridCoordinates:
+            parser.error("--regrid needs the coordinates of the icosahedral grid, see --grid-coordinates")
+        if not (-90 <= south < north <= 90 and west < east <= west + 360 and resolution > 0):
+            parser.error("--regrid needs -90 <= SOUTH < NORTH <= 90, WEST < EAST <= WEST + 360 and RESOLUTION > 0")
+        try:
+            from gribgrid import importDependencies
+            importDependencies()
+        except ImportError as e:
+            parser.error(f"--regrid needs the numpy and eccodes packages: {e}")
+        try:
+            import scipy  # noqa: F401
+        except ImportError:
+            log.warning("--regrid without the scipy package can only use interpolation weights cached before")
+        settings["regridTarget"] = (west, south, east, north, resolution)
+        settings["gridCoordinatePaths"] = tuple(os.path.abspath(path) for path in args.gridCoordinates)
+
+    if args.stations:
+        if args.compressed or args.journalPath is not None or args.objectStorePath is not None or args.gribIndex \
+                or args.merge or args.stdout:
+            parser.error("--stations cannot be combined with -c, --journal, --invariant-cache, --grib-index, "
+                         "--merge or --stdout")
+        try:
+            from gribgrid import importDependencies
+            importDependencies()
+            if args.gridCoordinates or args.grid == "rotated-lat-lon":
+                import scipy.spatial
+        except ImportError as e:
+            parser.error(f"--stations needs the numpy and eccodes packages, and scipy for grids other than "
+                         f"regular-lat-lon: {e}")
+
+    if args.gribIndex and args.compressed:
+        parser.error("--grib-index indexes decompressed files, it cannot be combined with -c")
+
+    if args.proxy and args.engine == "asyncio":
+        parser.error("--http-proxy is not supported by the asyncio engine")
+
+    if args.proxy:
+        # configure proxy
+        configureHttpProxyForUrllib(proxySettings={'http': args.proxy})
+
+    configure(**settings)
+
+    selectedModel = getSupportedModels()[args.model.lower()]
+
+    if args.regrid:
+        # the grid the files are downloaded on, the first grid of the model unless it has --grid
+        grid = args.grid if args.grid in selectedModel["grids"] else selectedModel["grids"][0]
+        if grid != "icosahedral":
+            parser.error(f"--regrid regrids icosahedral fields, {selectedModel['model']} would be downloaded "
+                         f"on the {grid} grid, see --grid")
+
+    timeSteps = list(range(args.minTimeStep, args.maxTimeStep + 1))
+    minModelLevel = args.minModelLevel if args.minModelLevel > 0 else selectedModel.get(
+        "minlevel", 0)
+    maxModelLevel = args.maxModelLevel if args.maxModelLevel > 0 else selectedModel.get(
+        "maxlevel", 0)
+    levelRange = list(range(minModelLevel, maxModelLevel + 1))
+
+    fieldSelection = [("single-level", args.single_level_params, [0]),
+                      ("model-level", args.model_level_params, levelRange),
+                      ("pressure-level", args.pressure_level_params, args.pressureLevels),
+                      ("time-invariant", args.time_invariant_params, [0])]
+
+    if args.modelrun:
+        latestTimestamp = getMostRecentModelTimestamp(modelrun=args.modelrun)
+    else:
+        # in --watch mode the newest run that has started publishing
+        probe = getProbe(fieldSelection, timeSteps[:1] if args.watch else timeSteps)
+        latestTimestamp = getLatestModelTimestamp(selectedModel["model"], ttl=latestTimestampCacheTtl,
+                                                  grid=args.grid, **probe)
+
+    if args.getLatestTimestamp:
+        log.info("Acquiring latest timestamp")
+        print(getTimestampString(latestTimestamp))
+        sys.exit(0)
+
+    if args.single_level_params is None and args.model_level_params is None and args.time_invariant_params is None and args.pressure_level_params is None:
+
+        log.error("nothing to download. Specify  any of: "
+                  "--single-level-fields <fields>, "
+                  "--model-level-fields <fields>, "
+                  "--pressure-level-fields <fields> or "
+                  "--time-invariant-fields <fields>")
+        sys.exit(1)
+
+    if args.stations:
+        # one time series per model run, fed by all planned fields
+        import stations
+        from gribgrid import readGridCoordinates
+        gridCoordinates = readGridCoordinates(*args.gridCoordinates) if args.gridCoordinates else None
+        configure(**dict(settings, outputSink=stations.StationSeries(
+            os.path.join(args.destFilePath, stationsTemplate(model=selectedModel["model"],
+                                                              grid=args.grid or "default",
+                                                              timestamp=latestTimestamp)),
+            stations.readStations(args.stations), gridCoordinates=gridCoordinates)))
+
+    # one plan across all params and level types, downloaded through one shared executor
+    plan = []
+    for levtype, params, levels in fieldSelection:
+        for param in params:
+            plan.extend(planGribDataSequence(model=selectedModel["model"],
+                                             flat=args.flat,
+                                             grid=args.grid,
+                                             param=param,
+                                             timeSteps=timeSteps,
+                                             timestamp=latestTimestamp,
+                                             levelRange=levels,
+                                             levtype=levtype,
+                                             destFilePath=args.destFilePath))
+
+    retention = None
+    if (args.retainRuns or args.retainBytes) and not dryRun:
+        # runs alongside the downloads, the run being downloaded is kept
+        from retention import RetentionManager
+        retention = RetentionManager(args.destFilePath, getSupportedModels(),
+                                     maxRuns=args.retainRuns,
+                                     maxBytes=args.retainBytes,
+                                     interval=args.retentionInterval,
+                                     protectedRuns=[(selectedModel["model"], latestTimestamp.strftime("%Y%m%d%H"))],
+                                     onEvict=getJournal().removeRun if getJournal() else None)
+        retention.start()
+
+    if args.watch:
+        watchPlan(plan, pollInterval=args.pollInterval, timeout=args.watchTimeout)
+    else:
+        downloadPlan(plan)
+    shutdownDecompressionStage()
+    reportConcurrency()
+
+    if retention:
+        retention.stop()
+
+    if outputSink:
+        try:
+            outputSink.close()
+        except BrokenPipeError:
+            # the reader of --stdout is gone, keep the interpreter from failing again flushing it at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+    if journal:
+        journal.close()
+    if objectStore:
+        objectStore.close()
+
+    if failedFiles:
+        print(f"#the command line was: {sys.argv}", file=sys.stderr)
+        print("#the below URLs failed to download:", file=sys.stderr)
+
+        for url, status, exc in failedFiles:
+            print(f"{exc.__name__} {url} {status}", file=sys.stderr)
+
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
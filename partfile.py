@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+""" partfile.py
+
+ Partially downloaded files that can be resumed with HTTP Range requests.
+
+ The bytes received so far are kept in a '.part' file, a small '.part.json' sidecar
+ remembers the url, the total size and the validators (ETag/Last-Modified) of the
+ response. A retry asks only for the missing bytes and sends the validator as
+ If-Range, so a file that changed on the server in the meantime is sent in full.
+"""
+
+import json
+import os
+import re
+
+contentRangePattern = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class ResumeError(IOError):
+    """The server answered a Range request with a range that does not match the part file"""
+
+
+class PartFile(object):
+
+    def __init__(self, path, url):
+        self.path = path
+        self.metaPath = path + ".json"
+        self.url = url
+        self.meta = self._loadMeta()
+
+    def _loadMeta(self):
+        try:
+            with open(self.metaPath, "r") as jsonfile:
+                meta = json.load(jsonfile)
+            if meta.get("url") == self.url:
+                return meta
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _saveMeta(self):
+        with open(self.metaPath, "w") as jsonfile:
+            json.dump(self.meta, jsonfile)
+
+    @property
+    def offset(self):
+        # number of bytes that do not have to be downloaded again
+        if not self.meta or not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path)
+
+    @property
+    def size(self):
+        return self.meta.get("size")
+
+    def isComplete(self):
+        return self.size is not None and self.offset == self.size
+
+    def requestHeaders(self):
+        offset = self.offset
+        if offset == 0:
+            return {}
+        headers = {"Range": f"bytes={offset}-"}
+        validator = self.meta.get("etag") or self.meta.get("lastModified")
+        if validator:
+            headers["If-Range"] = validator
+        return headers
+
+    def open(self, status, headers):
+        """Returns the part file opened for the body of a response with the given status and headers"""
+        offset = self.offset
+        if status == 206:
+            match = contentRangePattern.match(headers.get("Content-Range", ""))
+            if not match or int(match.group(1)) != offset:
+                self.remove()
+                raise ResumeError(f"unexpected Content-Range {headers.get('Content-Range')!r} "
+                                  f"for offset {offset}")
+            size = None if match.group(3) == "*" else int(match.group(3))
+            mode = "ab"
+        else:
+            contentLength = headers.get("Content-Length")
+            size = int(contentLength) if contentLength is not None else None
+            mode = "wb"
+        self.meta = {"url": self.url,
+                     "etag": headers.get("ETag"),
+                     "lastModified": headers.get("Last-Modified"),
+                     "size": size}
+        self._saveMeta()
+        return self._open(mode)
+
+    def _open(self, mode):
+        return open(self.path, mode)
+
+    def chunks(self, bufferSize):
+        """Yields the bytes received so far"""
+        if self.offset:
+            with open(self.path, 'rb') as partFile:
+                yield from iter(lambda: partFile.read(bufferSize), b'')
+
+    def removeMeta(self):
+        self.meta = {}
+        if os.path.exists(self.metaPath):
+            os.remove(self.metaPath)
+
+    def remove(self):
+        self.removeMeta()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MemoryPartFile(PartFile):
+    """A PartFile that keeps the bytes in memory, transfers are resumed within the process only"""
+
+    def __init__(self, url):
+        self.path = None
+        self.url = url
+        self.meta = {}
+        self.data = bytearray()
+
+    def _saveMeta(self):
+        pass
+
+    @property
+    def offset(self):
+        return len(self.data) if self.meta else 0
+
+    def _open(self, mode):
+        if mode == "wb":
+            self.data = bytearray()
+        # the part file is its own file object
+        return self
+
+    def write(self, chunk):
+        self.data += chunk
+
+    def close(self):
+        pass
+
+    def chunks(self, bufferSize):
+        for start in range(0, self.offset, bufferSize):
+            yield bytes(self.data[start:start + bufferSize])
+
+    def removeMeta(self):
+        self.meta = {}
+
+    def remove(self):
+        self.meta = {}
+        self.data = bytearray()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+""" regrid.py
+
+ Regridding of icosahedral (unstructured) ICON fields to a regular latitude/longitude grid.
+
+ Every target point is interpolated from the NEIGHBOURS source cells nearest to it,
+ weighted by their inverse distance. The weights form a sparse matrix with a fixed number
+ of entries per row, kept as two arrays: the source indices and the weights of every
+ target point. They are built once per (source grid, target grid) with a k-d tree, stored
+ in the cache directory as .npy files and memory-mapped from there, so further fields,
+ processes and runs only apply them: a gather, a multiply and a row sum per field.
+
+ GribRegridder sits between the decompressor and the output file like the GribCropper and
+ writes every message re-encoded on the target grid. Decoding and encoding needs the
+ optional ecCodes and NumPy packages; building the weights needs SciPy, applying cached
+ weights does not.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+
+from gribgrid import importDependencies, unitVectors
+from gribindex import GribFormatError, GribMessageFilter
+
+NEIGHBOURS = 3
+# ICON uses a sphere of this radius, shapeOfTheEarth 6
+EARTH_SHAPE = 6
+
+weightsCache = {}
+weightsLock = threading.Lock()
+
+
+def targetShape(grid):
+    """(Nj, Ni) of the target grid (west, south, east, north, resolution) in degrees"""
+    west, south, east, north, resolution = grid
+    return (int(round((north - south) / resolution)) + 1,
+            int(round((east - west) / resolution)) + 1)
+
+
+def targetCoordinates(grid):
+    """Latitudes and longitudes of all points of the target grid, row by row from the south west"""
+    import numpy
+    west, south, _, _, resolution = grid
+    nj, ni = targetShape(grid)
+    lats, lons = numpy.meshgrid(south + resolution * numpy.arange(nj),
+                                west + resolution * numpy.arange(ni), indexing="ij")
+    return lats.ravel(), lons.ravel()
+
+
+def buildWeights(sourceLats, sourceLons, grid):
+    """Returns (indices, weights) of the NEIGHBOURS nearest source points of every target point"""
+    import numpy
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError as e:
+        raise ImportError(f"building regridding weights needs the scipy package: {e}")
+    tree = cKDTree(unitVectors(sourceLats, sourceLons))
+    distances, indices = tree.query(unitVectors(*targetCoordinates(grid)), k=NEIGHBOURS)
+    # inverse distance weights, a target point on a source point takes its value: all its
+    # entries refer to that point, a missing neighbour must not turn it into NaN * 0
+    exact = distances < 1e-12
+    hit = exact.any(axis=1, keepdims=True)
+    weights = 1.0 / numpy.where(exact, 1.0, distances)
+    weights = numpy.where(hit, exact.astype(float), weights)
+    weights /= weights.sum(axis=1, keepdims=True)
+    indices = numpy.where(hit, numpy.take_along_axis(indices, exact.argmax(axis=1)[:, None], axis=1), indices)
+    return indices.astype(numpy.int32), weights.astype(numpy.float32)
+
+
+def applyWeights(values, indices, weights):
+    """Returns the values of the target points, the sparse matrix-vector product with NEIGHBOURS entries per row"""
+    import numpy
+    return numpy.einsum("ij,ij->i", values[indices], weights)
+
+
+def loadWeights(cacheDir, sourceGrid, grid, gridCoordinates):
+    """Returns the memory-mapped (indices, weights) for regridding sourceGrid to grid
+
+    sourceGrid identifies the source grid (the hash of its GRIB grid section),
+    gridCoordinates() returns its (latitudes, longitudes) when the weights have to be built.
+    """
+    import numpy
+    key = hashlib.sha256(repr((sourceGrid, tuple(grid), NEIGHBOURS)).encode()).hexdigest()[:32]
+    with weightsLock:
+        if key in weightsCache:
+            return weightsCache[key]
+        directory = os.path.join(cacheDir, "regrid", key)
+        if not os.path.exists(directory):
+            indices, weights = buildWeights(*gridCoordinates(), grid)
+            # written to a temporary directory and renamed, other processes see all or nothing
+            tmpDirectory = os.path.join(cacheDir, "regrid", ".{0}.{1}.tmp".format(key, os.urandom(6).hex()))
+            os.makedirs(tmpDirectory)
+            try:
+                numpy.save(os.path.join(tmpDirectory, "indices.npy"), indices)
+                numpy.save(os.path.join(tmpDirectory, "weights.npy"), weights)
+                os.replace(tmpDirectory, directory)
+            except OSError:
+                # built by another process in the meantime
+                shutil.rmtree(tmpDirectory, ignore_errors=True)
+                if not os.path.exists(directory):
+                    raise
+        weightsCache[key] = (numpy.load(os.path.join(directory, "indices.npy"), mmap_mode="r"),
+                             numpy.load(os.path.join(directory, "weights.npy"), mmap_mode="r"))
+        return weightsCache[key]
+
+
+class GribRegridder(GribMessageFilter):
+    """Regrids the icosahedral GRIB messages written to it and passes them on to outfile
+
+    grid is (west, south, east, north, resolution) in degrees, gridCoordinates() returns
+    the (latitudes, longitudes) of the icosahedral cells, see gribgrid.readGridCoordinates().
+    The weights are cached below cacheDir.
+    """
+
+    def __init__(self, outfile, grid, gridCoordinates, cacheDir, scanner=None):
+        super().__init__(outfile, scanner)
+        self.numpy, self.eccodes = importDependencies()
+        self.grid = tuple(grid)
+        self.gridCoordinates = gridCoordinates
+        self.cacheDir = cacheDir
+
+    def transform(self, message):
+        """Returns message on the target grid"""
+        numpy, codes = self.numpy, self.eccodes
+        gid = codes.codes_new_from_message(message)
+        try:
+            if codes.codes_get(gid, "gridType") != "unstructured_grid":
+                raise GribFormatError(f"cannot regrid a {codes.codes_get(gid, 'gridType')} grid, only icosahedral")
+            indices, weights = loadWeights(self.cacheDir, codes.codes_get(gid, "md5GridSection"),
+                                           self.grid, self.gridCoordinates)
+            values = codes.codes_get_values(gid)
+            if len(values) <= indices.max(initial=0):
+                raise GribFormatError("the grid coordinates do not match the grid of the field")
+            bitmap = codes.codes_get(gid, "bitmapPresent")
+            if bitmap:
+                missingValue = codes.codes_get(gid, "missingValue")
+                values = numpy.where(values == missingValue, numpy.nan, values)
+            regridded = applyWeights(values, indices, weights)
+
+            west, south, east, north, resolution = self.grid
+            nj, ni = targetShape(self.grid)
+            result = codes.codes_clone(gid)
+            try:
+                codes.codes_set(result, "gridDefinitionTemplateNumber", 0)
+                codes.codes_set(result, "shapeOfTheEarth", EARTH_SHAPE)
+                codes.codes_set(result, "Ni", ni)
+                codes.codes_set(result, "Nj", nj)
+                codes.codes_set(result, "iScansNegatively", 0)
+                codes.codes_set(result, "jScansPositively", 1)
+                codes.codes_set(result, "latitudeOfFirstGridPointInDegrees", south)
+                codes.codes_set(result, "longitudeOfFirstGridPointInDegrees", west % 360)
+                codes.codes_set(result, "latitudeOfLastGridPointInDegrees", south + resolution * (nj - 1))
+                codes.codes_set(result, "longitudeOfLastGridPointInDegrees", (west + resolution * (ni - 1)) % 360)
+                codes.codes_set(result, "iDirectionIncrementInDegrees", resolution)
+                codes.codes_set(result, "jDirectionIncrementInDegrees", resolution)
+                # not derived from Ni and Nj by every ecCodes version, the values must match it
+                codes.codes_set(result, "numberOfDataPoints", ni * nj)
+                if bitmap or numpy.isnan(regridded).any():
+                    codes.codes_set(result, "bitmapPresent", 1)
+                    regridded = numpy.where(numpy.isnan(regridded), codes.codes_get(result, "missingValue"), regridded)
+                codes.codes_set_values(result, regridded)
+                return codes.codes_get_message(result)
+            finally:
+                codes.codes_release(result)
+        finally:
+            codes.codes_release(gid)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+""" retention.py
+
+ Retention of downloaded model runs below the download directory.
+
+ The DWD directory structure only contains the hour of a model run, so the files of all
+ days end up in the same {model}/grib/{modelrun}/{param} directories. The model run a
+ file belongs to is taken from the model name and the YYYYMMDDHH timestamp in its name.
+ Only the files the downloader writes are looked at: names starting with a known model
+ and ending in .grib2, .grib2.bz2, their .part and .part.json files, .idx.json sidecars
+ and the temporary files of all of these. Other files below the directory are left alone.
+
+ RetentionManager keeps at most maxRuns runs per model and at most maxBytes in total,
+ deleting the oldest runs first. It runs in a background thread alongside the downloads,
+ the runs that are being downloaded are never deleted.
+"""
+
+import logging as log
+import os
+import re
+import threading
+
+
+def compileRunFilePattern(models):
+    """Matches the (temporary or partial) grib files of models, the groups are the model name and run"""
+    names = "|".join(re.escape(model) for model in sorted(models, key=len, reverse=True))
+    return re.compile(r"^\.?({0})_.*?_(\d{{10}})_.*\.grib2(?:\.bz2)?(?:\.part(?:\.json)?|\.idx\.json)?"
+                      r"(?:\.[0-9a-f]+\.tmp)?$".format(names))
+
+
+class RetentionManager(object):
+    """Deletes the oldest runs of models below directory, see the module docstring"""
+
+    def __init__(self, directory, models, maxRuns=None, maxBytes=None, interval=60, protectedRuns=(),
+                 onEvict=None):
+        self.directory = directory
+        self.runFilePattern = compileRunFilePattern(models)
+        self.maxRuns = maxRuns
+        self.maxBytes = maxBytes
+        self.interval = interval
+        self.protectedRuns = set(protectedRuns)
+        # called with (model, run) after the files of a run were deleted
+        self.onEvict = onEvict
+        self._stop = threading.Event()
+        self._thread = None
+
+    def scan(self):
+        """Returns {(model, run): (bytes, [paths])} for all files below the directory"""
+        runs = {}
+        inodes = set()
+        for directory, _, fileNames in os.walk(self.directory):
+            for fileName in fileNames:
+                match = self.runFilePattern.match(fileName)
+                if not match:
+                    continue
+                path = os.path.join(directory, fileName)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                size, paths = runs.get(match.groups(), (0, []))
+                # hard links (e.g. to the invariant cache) take their space only once
+                if (stat.st_dev, stat.st_ino) not in inodes:
+                    inodes.add((stat.st_dev, stat.st_ino))
+                    size += stat.st_size
+                paths.append(path)
+                runs[match.groups()] = (size, paths)
+        return runs
+
+    def expiredRuns(self, runs):
+        """Returns the (model, run) keys to delete, oldest first"""
+        expired = []
+        if self.maxRuns:
+            for model in {model for model, _ in runs}:
+                modelRuns = sorted(run for runModel, run in runs if runModel == model)
+                expired += [(model, run) for run in modelRuns[:-self.maxRuns]]
+        if self.maxBytes:
+            totalBytes = sum(size for key, (size, _) in runs.items() if key not in expired)
+            for key in sorted(runs, key=lambda key: key[1]):
+                if totalBytes <= self.maxBytes:
+                    break
+                if key in expired or key in self.protectedRuns:
+                    continue
+                expired.append(key)
+                totalBytes -= runs[key][0]
+            if totalBytes > self.maxBytes:
+                log.warning(f"Retention: {totalBytes} bytes are kept, more than the quota of {self.maxBytes} bytes, "
+                            "the remaining runs are being downloaded")
+        return sorted((key for key in expired if key not in self.protectedRuns), key=lambda key: (key[1], key[0]))
+
+    def enforce(self):
+        """Deletes the files of expired runs, returns the number of bytes freed"""
+        runs = self.scan()
+        freed = 0
+        for key in self.expiredRuns(runs):
+            size, paths = runs[key]
+            log.info(f"Retention: deleting model run {key[1]} of {key[0]}, {len(paths)} files, {size} bytes")
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            freed += size
+            if self.onEvict:
+                self.onEvict(*key)
+        return freed
+
+    def _run(self):
+        while True:
+            try:
+                self.enforce()
+            except Exception:
+                log.exception("Retention failed")
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, after a last pass over the finished downloads"""
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.enforce()
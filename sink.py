@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+""" sink.py
+
+ Output of the downloaded files to a single binary stream instead of the file system.
+
+ The decompressed GRIB data of every file is written to the stream in one piece, so the
+ messages of concurrent downloads never interleave and the stream is a valid sequence of
+ GRIB messages, e.g. for `opendata-downloader.py --stdout ... | grib_filter rules -`.
+
+ The files are written in the order they complete, or in the order of the plan: then a
+ file that completes early is held back until all files planned before it were written
+ or have failed, in memory up to a limit and in a temporary file beyond it.
+
+ MergedOutput appends the files of a model run to a few large GRIB files instead, one per
+ run or per param, each with a gribindex sidecar of its messages. The files are streamed
+ into the merged files as they complete, in completion order, the index tells where each
+ message is.
+"""
+
+import contextlib
+import io
+import logging as log
+import os
+import threading
+
+
+class OutputSink(object):
+    """Thread-safe writer of whole files to a binary stream, in plan or completion order"""
+
+    def __init__(self, stream, ordered=True, maxHeldBytes=256 * 1024 * 1024):
+        self.stream = stream
+        self.ordered = ordered
+        self.maxHeldBytes = maxHeldBytes
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._held = {}
+        self._heldBytes = 0
+        self._spill = None
+        self._next = 0
+
+    def expect(self, tasks):
+        """Sets the plan order of the files that are written next, tasks are dicts with the url of a file"""
+        with self._lock:
+            self._flush(force=True)
+            self._positions = {task["url"]: position for position, task in enumerate(tasks)}
+            self._held = {}
+            self._heldBytes = 0
+            self._next = 0
+
+    def write(self, url, data):
+        """Writes the data of a file, held back until its turn in plan order"""
+        with self._lock:
+            position = self._positions.get(url) if self.ordered else None
+            if position is None:
+                self._write(data)
+            else:
+                self._held[position] = self._hold(data)
+                self._flush()
+
+    @contextlib.contextmanager
+    def appending(self, url):
+        """Returns a file object for the data of a file, written once the block ends without an error"""
+        data = io.BytesIO()
+        yield data
+        self.write(url, data.getvalue())
+
+    def skip(self, url):
+        """A file that will not be written, the files planned after it are not held back for it"""
+        if self.ordered:
+            self.write(url, b"")
+
+    def _hold(self, data):
+        # beyond maxHeldBytes the data goes to a temporary file, held as its (offset, length) there
+        if self._heldBytes + len(data) <= self.maxHeldBytes:
+            self._heldBytes += len(data)
+            return data
+        if self._spill is None:
+            import tempfile
+            self._spill = tempfile.TemporaryFile()
+        self._spill.seek(0, os.SEEK_END)
+        offset = self._spill.tell()
+        self._spill.write(data)
+        return offset, len(data)
+
+    def _flush(self, force=False):
+        while self._next in self._held or (force and self._held):
+            data = self._held.pop(self._next, b"")
+            if isinstance(data, tuple):
+                self._writeSpilled(*data)
+            elif data:
+                self._heldBytes -= len(data)
+                self._write(data)
+            self._next += 1
+        if not self._held and self._spill is not None:
+            # nothing refers to the temporary file any more, its space is reused
+            self._spill.seek(0)
+            self._spill.truncate()
+
+    def _writeSpilled(self, offset, length, chunkSize=1024 * 1024):
+        self._spill.seek(offset)
+        while length > 0:
+            data = self._spill.read(min(chunkSize, length))
+            self._write(data)
+            length -= len(data)
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        """Writes the files still held back and flushes the stream"""
+        with self._lock:
+            self._flush(force=True)
+            self._closeSpill()
+            self.stream.flush()
+
+    def _closeSpill(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+class _ScannedFile(object):
+    # passes the data written to it on to outfile and a GribScanner
+
+    def __init__(self, outfile, scanner):
+        self.outfile = outfile
+        self.scanner = scanner
+
+    def write(self, data):
+        self.outfile.write(data)
+        self.scanner.write(data)
+
+
+class MergedFile(object):
+    """One GRIB file of MergedOutput, close() commits it with its index
+
+    The files are written one at a time straight into a temporary file next to the merged
+    file, in the order they complete, nothing is held in memory. A file that fails half way
+    is cut off again. close() writes the gribindex sidecar and renames the temporary file,
+    so the merged file appears complete with its index and its data is written only once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._outfile = None
+        self._tmpPath = None
+        self._messages = []
+        self._indexError = None
+
+    @contextlib.contextmanager
+    def appending(self, url):
+        """Returns a file object appending the data of a file, cut off again if the block fails
+
+        Other files wait until the block ends.
+        """
+        import gribindex
+        with self._lock:
+            if self._outfile is None:
+                # opened on the first file, a plan without any downloads leaves no file behind
+                directory, fileName = os.path.split(self.path)
+                os.makedirs(directory or ".", exist_ok=True)
+                self._tmpPath = os.path.join(directory, ".{0}.{1}.tmp".format(fileName, os.urandom(6).hex()))
+                self._outfile = open(self._tmpPath, "wb")
+            offset = self._outfile.tell()
+            scanner = gribindex.GribScanner()
+            try:
+                yield _ScannedFile(self._outfile, scanner)
+            except BaseException:
+                self._outfile.seek(offset)
+                self._outfile.truncate()
+                raise
+            try:
+                self._messages.extend(dict(message, offset=message["offset"] + offset)
+                                      for message in scanner.finish())
+            except gribindex.GribFormatError as e:
+                self._indexError = e
+
+    def write(self, url, data):
+        """Appends the data of a file"""
+        with self.appending(url) as outfile:
+            outfile.write(data)
+
+    def close(self):
+        import gribindex
+        with self._lock:
+            if self._outfile is None:
+                return
+            try:
+                self._outfile.flush()
+                os.fsync(self._outfile.fileno())
+                self._outfile.close()
+                if self._indexError:
+                    log.warning(f"Not indexing {self.path}: {self._indexError}")
+                else:
+                    gribindex.writeIndex(self.path, self._messages)
+                os.replace(self._tmpPath, self.path)
+            except BaseException:
+                self._outfile.close()
+                if os.path.exists(self._tmpPath):
+                    os.remove(self._tmpPath)
+                raise
+            finally:
+                self._outfile = None
+                self._messages = []
+
+
+class MergedOutput(object):
+    """Appends the files to a few large GRIB files in directory, in completion order
+
+    fileName(task) names the merged file a planned file is appended to, e.g. one per run
+    or one per param of a run. The merged files are committed by close().
+    """
+
+    def __init__(self, directory, fileName):
+        self.directory = directory
+        self.fileName = fileName
+        self.files = {}
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def expect(self, tasks):
+        groups = {}
+        for task in tasks:
+            groups.setdefault(os.path.join(self.directory, self.fileName(task)), []).append(task)
+        with self._lock:
+            for path, group in groups.items():
+                if path not in self.files:
+                    self.files[path] = MergedFile(path)
+                self._routes.update((task["url"], self.files[path]) for task in group)
+
+    def appending(self, url):
+        return self._route(url).appending(url)
+
+    def write(self, url, data):
+        self._route(url).write(url, data)
+
+    def _route(self, url):
+        with self._lock:
+            mergedFile = self._routes.get(url)
+        if mergedFile is None:
+            raise ValueError(f"{url} is not part of the planned files")
+        return mergedFile
+
+    def skip(self, url):
+        # the files are written in completion order, no file waits for a skipped one
+        pass
+
+    def close(self):
+        with self._lock:
+            for mergedFile in self.files.values():
+                mergedFile.close()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+""" stations.py
+
+ Extraction of the values at a list of stations, appended to a CSV time series.
+
+ StationSeries is an output sink: instead of storing a downloaded file it decodes its GRIB
+ messages and appends one row per message to the CSV file, with the param, level, model
+ run, step and valid time and a column per station. No field is stored on disk.
+
+ The grid point nearest to every station is looked up once per grid and cached, the
+ values of a field are then gathered with a single numpy.take. Regular and rotated
+ latitude/longitude grids carry their coordinates, the cells of the icosahedral grid are
+ given by the time-invariant clat and clon fields of the model. A model run that is
+ downloaded again does not repeat the rows the file has already.
+
+ Decoding needs the optional ecCodes and NumPy packages, they are imported when a
+ StationSeries is created. The nearest points of grids other than regular_ll are searched
+ with the k-d tree of SciPy.
+"""
+
+import csv
+import io
+import os
+import threading
+
+from gribgrid import importDependencies, regularGridIndices, unitVectors
+from gribindex import GribFormatError
+from sink import OutputSink
+
+csv.register_dialect('excel-semicolon', delimiter=';',
+                     quoting=csv.QUOTE_ALL, lineterminator='\r\n')
+
+COLUMNS = ["param", "levelType", "level", "run", "step", "validTime"]
+# the columns that identify a field
+KEY_COLUMNS = len(COLUMNS) - 1
+
+
+def readStations(path):
+    """Returns [(name, latitude, longitude)] from a CSV file with name, lat and lon columns"""
+    with open(path, "r", newline="") as csvfile:
+        sample = csvfile.read(4096)
+        csvfile.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        rows = csv.DictReader(csvfile, dialect=dialect)
+        columns = {name.strip().lower(): name for name in rows.fieldnames or ()}
+        if not {"name", "lat", "lon"} <= set(columns):
+            raise ValueError(f"{path} needs the columns name, lat and lon, found {rows.fieldnames}")
+        return [(row[columns["name"]].strip(), float(row[columns["lat"]]), float(row[columns["lon"]]))
+                for row in rows]
+
+
+class StationSeries(OutputSink):
+    """An OutputSink appending the values of every field at the stations to a CSV file
+
+    stations are (name, latitude, longitude) tuples, gridCoordinates the (latitudes,
+    longitudes) of the icosahedral grid cells, see gribgrid.readGridCoordinates(). The rows are
+    appended in plan or completion order, see OutputSink.
+    """
+
+    def __init__(self, path, stations, gridCoordinates=None, ordered=True):
+        super().__init__(None, ordered)
+        self.numpy, self.eccodes = importDependencies()
+        self.path = path
+        self.names = [name for name, _, _ in stations]
+        self.lats = self.numpy.array([lat for _, lat, _ in stations], dtype=float)
+        self.lons = self.numpy.array([lon for _, _, lon in stations], dtype=float)
+        self.gridCoordinates = gridCoordinates
+        self._lookups = {}
+        self._lookupLock = threading.Lock()
+        # the fields of an earlier download of the run
+        self._existing = self._readKeys()
+
+    def _readKeys(self):
+        try:
+            with open(self.path, "r", newline="", encoding="utf-8") as csvfile:
+                rows = csv.reader(csvfile, dialect='excel-semicolon')
+                next(rows, None)
+                return {tuple(row[:KEY_COLUMNS]) for row in rows}
+        except FileNotFoundError:
+            return set()
+
+    def write(self, url, data):
+        # decoded on the calling download thread, only the rows are held back for the plan order
+        rows = [row for row in self.extract(data) if tuple(row[:KEY_COLUMNS]) not in self._existing]
+        super().write(url, self._formatRows(rows) if rows else b"")
+
+    def _write(self, data):
+        if self.stream is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            newFile = not os.path.exists(self.path) or not os.path.getsize(self.path)
+            self.stream = open(self.path, "ab")
+            if newFile:
+                self.stream.write(self._formatRows([COLUMNS + self.names]))
+        super()._write(data)
+
+    def close(self):
+        with self._lock:
+            self._flush(force=True)
+            self._closeSpill()
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+    def _formatRows(self, rows):
+        text = io.StringIO()
+        csv.writer(text, dialect='excel-semicolon').writerows(rows)
+        return text.getvalue().encode("utf-8")
+
+    def extract(self, data):
+        """Returns the rows of the station values of all GRIB messages in data, lists of strings
+
+        Raises GribFormatError if data is not a sequence of complete GRIB messages.
+        """
+        numpy, codes = self.numpy, self.eccodes
+        rows = []
+        offset = 0
+        while offset < len(data):
+            if data[offset:offset + 4] != b"GRIB":
+                raise GribFormatError(f"no GRIB message at offset {offset}")
+            length = int.from_bytes(data[offset + 8:offset + 16], "big")
+            if length < 16 or offset + length > len(data):
+                raise GribFormatError(f"invalid length {length} of the GRIB message at offset {offset}")
+            gid = codes.codes_new_from_message(data[offset:offset + length])
+            offset += length
+            try:
+                indices, inside = self.lookup(gid)
+                values = codes.codes_get_values(gid)
+                stationValues = numpy.take(values, indices)
+                missing = ~inside
+                if codes.codes_get(gid, "bitmapPresent"):
+                    missing |= stationValues == codes.codes_get(gid, "missingValue")
+                get = lambda key: codes.codes_get(gid, key, ktype=str)
+                rows.append([get("shortName"), get("typeOfLevel"), get("level"),
+                             "{}{:04d}".format(get("dataDate"), int(get("dataTime"))),
+                             get("stepRange"),
+                             "{}{:04d}".format(get("validityDate"), int(get("validityTime")))]
+                            + ["" if isMissing else repr(float(value))
+                               for value, isMissing in zip(stationValues, missing)])
+            finally:
+                codes.codes_release(gid)
+        return rows
+
+    def lookup(self, gid):
+        """Returns the indices of the grid points nearest to the stations and whether they are inside the grid"""
+        key = self.eccodes.codes_get(gid, "md5GridSection")
+        with self._lookupLock:
+            if key not in self._lookups:
+                self._lookups[key] = self._nearest(gid)
+            return self._lookups[key]
+
+    def _nearest(self, gid):
+        numpy, codes = self.numpy, self.eccodes
+        gridType = codes.codes_get(gid, "gridType")
+        if gridType == "regular_ll" and not codes.codes_get(gid, "jPointsAreConsecutive"):
+            # the index follows from the coordinates, no search needed
+            ni, nj = codes.codes_get(gid, "Ni"), codes.codes_get(gid, "Nj")
+            lat1 = codes.codes_get(gid, "latitudeOfFirstGridPointInDegrees")
+            lon1 = codes.codes_get(gid, "longitudeOfFirstGridPointInDegrees")
+            di = codes.codes_get(gid, "iDirectionIncrementInDegrees")
+            dj = codes.codes_get(gid, "jDirectionIncrementInDegrees")
+            if codes.codes_get(gid, "iScansNegatively"):
+                di = -di
+            if not codes.codes_get(gid, "jScansPositively"):
+                dj = -dj
+            return regularGridIndices(self.lats, self.lons, lat1, lon1, di, dj, ni, nj)
+        if gridType == "unstructured_grid":
+            if self.gridCoordinates is None:
+                raise ValueError("the coordinates of the icosahedral grid are needed, see --grid-coordinates")
+            lats, lons = self.gridCoordinates
+            if len(lats) != codes.codes_get(gid, "numberOfDataPoints"):
+                raise ValueError("the grid coordinates do not match the grid of the field")
+        else:
+            lats = codes.codes_get_array(gid, "latitudes")
+            lons = codes.codes_get_array(gid, "longitudes")
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError as e:
+            raise ImportError(f"the nearest points of a {gridType} grid are searched with the scipy package: {e}")
+        # the nearest point on the sphere is the nearest unit vector
+        _, indices = cKDTree(unitVectors(lats, lons)).query(unitVectors(self.lats, self.lons))
+        return indices, numpy.ones(len(indices), dtype=bool)
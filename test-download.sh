@@ -20,7 +20,10 @@ min_step=0
 
 # --- end configuration
 
-latest_timestamp=`python3 opendata-downloader.py --get-latest-timestamp --model ${model} ${modelrun}`
+latest_timestamp=`python3 opendata-downloader.py --get-latest-timestamp --model ${model} --grid ${grid} \
+        --min-time-step ${min_step} --max-time-step ${max_step} ${modelrun}`
+# the calls below probe their own fields, pin them to the same run
+modelrun="--modelrun ${latest_timestamp}"
 
 gribdir=${path}/${latest_timestamp}
 
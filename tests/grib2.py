@@ -0,0 +1,25 @@
+""" grib2.py
+
+ Minimal GRIB2 messages for the tests, built byte by byte. Only the sections the
+ gribindex scanner reads carry meaningful content; the data sections hold filler bytes.
+"""
+
+import struct
+
+
+def section(number, body):
+    return struct.pack(">IB", 5 + len(body), number) + body
+
+
+def makeMessage(discipline=0, category=0, number=0, levelType=103, level=2, levelScale=0,
+                levelType2=255, step=0, stepUnit=1, refTime=(2026, 10, 15, 0, 0), points=4,
+                gridTemplate=0, productTemplate=0, data=b"\x00" * 8):
+    year, month, day, hour, minute = refTime
+    identification = struct.pack(">HHBBBHBBBBBBB", 78, 255, 2, 1, 1, year, month, day, hour, minute, 0, 0, 1)
+    grid = struct.pack(">BIBBH", 0, points, 0, 0, gridTemplate) + b"\x00" * 8
+    product = struct.pack(">HHBBBBBHBBIBBIBBI", 0, productTemplate, category, number, 2, 0, 0, 0, 0,
+                          stepUnit, step, levelType, levelScale, level, levelType2,
+                          255 if levelType2 == 255 else 0, 0xFFFFFFFF if levelType2 == 255 else 0)
+    body = (section(1, identification) + section(3, grid) + section(4, product)
+            + section(5, b"\x00" * 16) + section(6, b"\xff") + section(7, data) + b"7777")
+    return b"GRIB" + struct.pack(">HBBQ", 0, discipline, 2, 16 + len(body)) + body
@@ -0,0 +1,100 @@
+""" httpserver.py
+
+ A local keep-alive HTTP server for the tests, answering from a dict of paths and bodies.
+ Suffix and open Range requests are answered with 206, every request is recorded. The
+ first requests can be answered with given failures instead, e.g. a 503 with Retry-After.
+ With dropConnections the server closes every connection after its response without
+ saying so, as a server does with a keep-alive connection that was idle for too long.
+"""
+
+import http.server
+import re
+import threading
+
+rangePattern = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.server.dropConnections:
+            self.close_connection = True
+        body = self.server.files.get(self.path)
+        if self.server.failures or body is None:
+            status, headers = self.server.failures.pop(0) if self.server.failures else (404, {})
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        match = rangePattern.match(self.headers.get("Range") or "")
+        if match:
+            first, last = match.groups()
+            start = max(len(body) - int(last), 0) if not first else int(first)
+            end = int(last) + 1 if first and last else len(body)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(body)}")
+            body = body[start:end]
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FileServer(object):
+    """Serves files, a dict of paths and bodies, on a free port of the loopback interface
+
+    failures are (status, headers) the first requests are answered with.
+    """
+
+    def __init__(self, files, failures=()):
+        self.files = files
+        self.failures = list(failures)
+
+    def url(self, path):
+        return "http://127.0.0.1:{0}{1}".format(self.server.server_address[1], path)
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def connections(self):
+        """The number of connections accepted so far"""
+        return self.server.connections
+
+    @property
+    def dropConnections(self):
+        return self.server.dropConnections
+
+    @dropConnections.setter
+    def dropConnections(self, value):
+        self.server.dropConnections = value
+
+    def __enter__(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.files = self.files
+        self.server.failures = self.failures
+        self.server.requests = []
+        self.server.connections = 0
+        self.server.dropConnections = False
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
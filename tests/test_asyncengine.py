@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+
+from asyncengine import AsyncConnectionPool
+
+
+class StallingServer(object):
+    """Answers every request with the given head and the start of a body, then stalls"""
+
+    def __init__(self, head, body):
+        self.head = head
+        self.body = body
+        self.release = None
+        self.reader = None
+
+    async def handle(self, reader, writer):
+        self.reader = reader
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(self.head + self.body)
+        await writer.drain()
+        await self.release.wait()
+        writer.close()
+
+    async def __aenter__(self):
+        self.release = asyncio.Event()
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = "http://127.0.0.1:{}/file".format(self.server.sockets[0].getsockname()[1])
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release.set()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def readAll(self, head, body):
+        async def run():
+            async with StallingServer(head, body) as server:
+                pool = AsyncConnectionPool(timeout=0.2)
+                response = await pool.urlopen(server.url)
+                try:
+                    while await response.read(1024):
+                        pass
+                finally:
+                    response.release()
+                    pool.close()
+        asyncio.run(run())
+
+    def testStalledBody(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.readAll(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n", b"GRIB")
+
+    def testStalledChunkedBody(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.readAll(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n", b"4\r\nGRIB\r\n")
+
+    def testStalledBodyUntilClose(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.readAll(b"HTTP/1.1 200 OK\r\n\r\n", b"GRIB")
+
+    def testStalledHeaders(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.readAll(b"HTTP/1.1 200 OK\r\n", b"")
+
+    def testTimedOutConnectionIsClosed(self):
+        async def run():
+            async with StallingServer(b"HTTP/1.1 200 OK\r\n", b"") as server:
+                pool = AsyncConnectionPool(timeout=0.2)
+                try:
+                    try:
+                        await pool.urlopen(server.url)
+                    except asyncio.TimeoutError as e:
+                        # its traceback keeps the request alive, as in a caller that retries or reports it
+                        raised = e
+                    self.assertIsInstance(raised, asyncio.TimeoutError)
+                    # the server reads the end of the stream
+                    self.assertEqual(await asyncio.wait_for(server.reader.read(), 1), b"")
+                finally:
+                    pool.close()
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
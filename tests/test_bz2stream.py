@@ -0,0 +1,74 @@
+import bz2
+import io
+import unittest
+
+from opendata_downloader import Bz2StreamWriter, IntegrityError
+
+
+def decompress(data, chunkSize, bufferSize=1024 * 1024):
+    outfile = io.BytesIO()
+    writer = Bz2StreamWriter(outfile, bufferSize=bufferSize)
+    for start in range(0, len(data), chunkSize):
+        writer.write(data[start:start + chunkSize])
+    writer.finish()
+    return writer, outfile.getvalue()
+
+
+class Bz2StreamWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parts = [b"GRIB" + bytes(range(256)) * 40 + b"7777", b"GRIB" + b"\x01" * 5000 + b"7777"]
+
+    def testSingleStream(self):
+        writer, data = decompress(bz2.compress(self.parts[0]), 100)
+        self.assertEqual(data, self.parts[0])
+        self.assertEqual(writer.streams, 1)
+        self.assertEqual(writer.tail, b"7777")
+
+    def testConcatenatedStreams(self):
+        compressed = b"".join(bz2.compress(part) for part in self.parts)
+        # chunk boundaries before, at and after the start of the second stream
+        for chunkSize in (1, 7, len(bz2.compress(self.parts[0])), len(compressed)):
+            writer, data = decompress(compressed, chunkSize)
+            self.assertEqual(data, b"".join(self.parts), chunkSize)
+            self.assertEqual(writer.streams, 2)
+
+    def testOutputIsBounded(self):
+        outfile = io.BytesIO()
+        sizes = []
+        outfile.write = lambda data: sizes.append(len(data))
+        writer = Bz2StreamWriter(outfile, bufferSize=1000)
+        writer.write(bz2.compress(b"\x00" * 100000))
+        writer.finish()
+        self.assertEqual(sum(sizes), 100000)
+        self.assertLessEqual(max(sizes), 1000)
+
+    def testTruncatedStream(self):
+        compressed = bz2.compress(self.parts[0])
+        with self.assertRaises(IntegrityError):
+            decompress(compressed[:-10], 50)
+
+    def testTruncatedSecondStream(self):
+        compressed = bz2.compress(self.parts[0]) + bz2.compress(self.parts[1])
+        with self.assertRaises(IntegrityError):
+            decompress(compressed[:-10], 50)
+
+    def testEmptyInput(self):
+        with self.assertRaises(IntegrityError):
+            decompress(b"", 1)
+
+    def testInvalidData(self):
+        with self.assertRaises(IntegrityError):
+            decompress(b"not bz2 data at all", 4)
+
+    def testWithoutDecompressing(self):
+        outfile = io.BytesIO()
+        writer = Bz2StreamWriter(outfile, decompress=False)
+        writer.write(b"abc")
+        writer.write(b"7777")
+        writer.finish()
+        self.assertEqual((outfile.getvalue(), writer.tail), (b"abc7777", b"7777"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import threading
+import unittest
+from unittest import mock
+
+import concurrency
+from concurrency import ERROR, IGNORED, OK, THROTTLED, AdaptiveConcurrency
+
+
+class AdaptiveConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch("concurrency.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testSlowStartAddsOnePerRequest(self):
+        controller = AdaptiveConcurrency(minLimit=2, maxLimit=20)
+        for _ in range(5):
+            controller.record(0.1, OK)
+        self.assertEqual(controller.currentLimit, 7)
+
+    def testLimitIsBounded(self):
+        controller = AdaptiveConcurrency(minLimit=2, maxLimit=5)
+        for _ in range(10):
+            controller.record(0.1, OK)
+        self.assertEqual(controller.currentLimit, 5)
+        for _ in range(10):
+            self.now += 1
+            controller.record(0.1, THROTTLED)
+        self.assertEqual(controller.currentLimit, 2)
+
+    def testMultiplicativeDecreaseOncePerLatency(self):
+        controller = AdaptiveConcurrency(minLimit=1, maxLimit=64, initialLimit=32)
+        controller.record(0.5, OK)
+        self.now += 1
+        # a burst of failures from the same round halves the limit once
+        for _ in range(5):
+            controller.record(0.5, ERROR)
+        self.assertEqual(controller.currentLimit, 16)
+        self.now += 0.6
+        controller.record(0.5, THROTTLED)
+        self.assertEqual(controller.currentLimit, 8)
+
+    def testAdditiveIncreaseAfterDecrease(self):
+        controller = AdaptiveConcurrency(minLimit=1, maxLimit=64, initialLimit=20)
+        controller.record(0.1, OK)
+        self.now += 1
+        controller.record(0.1, THROTTLED)
+        self.assertEqual(controller.limit, 10.5)
+        # one more request in flight per round of limit requests
+        for _ in range(10):
+            controller.record(0.1, OK)
+        self.assertEqual(controller.currentLimit, 11)
+
+    def testNoIncreaseWhenLatencyGrows(self):
+        controller = AdaptiveConcurrency(minLimit=1, maxLimit=64, initialLimit=10, smoothing=1.0)
+        controller.record(0.1, OK)
+        limit = controller.limit
+        controller.record(0.5, OK)
+        self.assertEqual(controller.limit, limit)
+
+    def testIgnoredOutcomesKeepTheLimit(self):
+        controller = AdaptiveConcurrency(minLimit=1, maxLimit=64, initialLimit=10)
+        controller.record(0.1, IGNORED)
+        self.assertEqual(controller.currentLimit, 10)
+
+    def testAcquireWaitsForTheLimit(self):
+        controller = AdaptiveConcurrency(minLimit=1, maxLimit=1)
+        token = controller.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        controller.release(token, OK)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(controller.inFlight, 1)
+
+    def testSummary(self):
+        controller = AdaptiveConcurrency(minLimit=2, maxLimit=8)
+        controller.record(0.1, OK, 1000)
+        self.now += 1
+        controller.record(0.1, THROTTLED)
+        summary = controller.summary()
+        self.assertEqual((summary["requests"], summary["throttled"], summary["errors"]), (2, 1, 0))
+        self.assertEqual(summary["peakLimit"], 3)
+
+
+class ClassifyHttpStatusTest(unittest.TestCase):
+
+    def testClasses(self):
+        self.assertEqual([concurrency.classifyHttpStatus(status) for status in (429, 503, 500, 404)],
+                         [THROTTLED, THROTTLED, ERROR, IGNORED])
+
+
+if __name__ == "__main__":
+    unittest.main()
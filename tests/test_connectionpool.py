@@ -0,0 +1,95 @@
+import socket
+import threading
+import unittest
+from urllib.error import HTTPError
+
+from connectionpool import MAX_REDIRECTS, ConnectionPool
+from tests.httpserver import FileServer
+
+FILES = {"/t_2m": b"GRIB t_2m 7777", "/tot_prec": b"GRIB tot_prec 7777"}
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FileServer(dict(FILES))
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+
+    def pool(self, **options):
+        pool = ConnectionPool(timeout=5, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def get(self, pool, path):
+        with pool.urlopen(self.server.url(path)) as response:
+            return response.read()
+
+    def testKeepAlive(self):
+        pool = self.pool()
+        self.assertEqual([self.get(pool, path) for path in ("/t_2m", "/tot_prec", "/t_2m")],
+                         [FILES["/t_2m"], FILES["/tot_prec"], FILES["/t_2m"]])
+        self.assertEqual((len(self.server.requests), self.server.connections), (3, 1))
+
+    def testLimitPerHost(self):
+        pool = self.pool(maxConnectionsPerHost=1)
+        first = pool.urlopen(self.server.url("/t_2m"))
+        second = []
+        thread = threading.Thread(target=lambda: second.append(self.get(pool, "/tot_prec")))
+        thread.start()
+        # the second request waits for the connection of the first response
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(first.read(), FILES["/t_2m"])
+        first.close()
+        thread.join(5)
+        self.assertEqual(second, [FILES["/tot_prec"]])
+        self.assertEqual(self.server.connections, 1)
+
+    def testRedirects(self):
+        self.server.failures[:] = [(302, {"Location": "/t_2m"})]
+        pool = self.pool()
+        with pool.urlopen(self.server.url("/moved")) as response:
+            self.assertEqual((response.url, response.read()), (self.server.url("/t_2m"), FILES["/t_2m"]))
+        self.assertEqual([path for path, _ in self.server.requests], ["/moved", "/t_2m"])
+        self.server.failures[:] = [(301, {"Location": "/moved"})] * (MAX_REDIRECTS + 1)
+        with self.assertRaises(HTTPError) as raised:
+            pool.urlopen(self.server.url("/moved"))
+        self.assertEqual(raised.exception.code, 301)
+
+    def testErrorStatus(self):
+        with self.assertRaises(HTTPError) as raised:
+            self.pool().urlopen(self.server.url("/missing"))
+        self.assertEqual(raised.exception.code, 404)
+
+    def testStaleIdleConnection(self):
+        pool = self.pool()
+        self.server.dropConnections = True
+        self.assertEqual(self.get(pool, "/t_2m"), FILES["/t_2m"])
+        # the connection in the pool was closed by the server, the request is sent again once
+        self.assertEqual(self.get(pool, "/tot_prec"), FILES["/tot_prec"])
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual([path for path, _ in self.server.requests], ["/t_2m", "/tot_prec"])
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def testTimedOutConnectionIsClosed(self):
+        with socket.create_server(("127.0.0.1", 0)) as server:
+            pool = ConnectionPool(timeout=0.2)
+            self.addCleanup(pool.close)
+            try:
+                pool.urlopen("http://127.0.0.1:{}/file".format(server.getsockname()[1]))
+            except TimeoutError as e:
+                # its traceback keeps the request alive, as in a caller that retries or reports it
+                raised = e
+            self.assertIsInstance(raised, TimeoutError)
+            client, _ = server.accept()
+            with client:
+                client.settimeout(1)
+                self.assertTrue(client.recv(65536).startswith(b"GET /file HTTP/1.1"))
+                self.assertEqual(client.recv(1), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import tempfile
+import unittest
+from datetime import datetime
+
+import opendata_downloader
+from opendata_downloader import Downloader, configure
+from sink import OutputSink
+
+
+class DownloaderSettingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(configure)
+        self.addCleanup(setattr, opendata_downloader, "activeDownloader", None)
+
+    def downloader(self, **settings):
+        return Downloader("icon-d2", grid="regular-lat-lon", destFilePath=self.directory.name, **settings)
+
+    def testUnspecifiedSettingsAreDefaults(self):
+        first = self.downloader(maxWorkers=3, retryBudget={"server": 0})
+        self.assertEqual(opendata_downloader.maxWorkers, 3)
+        self.assertEqual(opendata_downloader.retryBudget["server"], 0)
+        self.assertEqual(opendata_downloader.retryBudget["connection"], 5)
+        self.downloader(dryRun=True)
+        self.assertEqual(opendata_downloader.maxWorkers, 20)
+        # the first one applies its settings again when it is used
+        first.plan("t_2m", [0], timestamp=datetime(2026, 10, 15))
+        self.assertEqual((opendata_downloader.maxWorkers, opendata_downloader.dryRun), (3, None))
+
+    def testChangedSettingsReplaceTheConnectionPool(self):
+        self.downloader(maxWorkers=3)
+        pool = opendata_downloader.getHttpPool()
+        self.downloader(maxWorkers=3, httpProxy="proxy:8080")
+        self.assertIsNot(opendata_downloader.getHttpPool(), pool)
+
+    def testDefaultRetryBudgetIsACopy(self):
+        opendata_downloader.retryBudget["server"] = 0
+        configure()
+        self.assertEqual(opendata_downloader.retryBudget["server"], 3)
+        self.assertIsNot(opendata_downloader.retryBudget, opendata_downloader.defaultSettings["retryBudget"])
+
+    def testOutputSinkKeepsTheConnectionPool(self):
+        pool = opendata_downloader.getHttpPool()
+        configure(outputSink=OutputSink(io.BytesIO()))
+        self.assertIs(opendata_downloader.getHttpPool(), pool)
+
+    def testUnknownSetting(self):
+        with self.assertRaises(TypeError):
+            self.downloader(maxworkers=3)
+
+    def testProxyWithAsyncio(self):
+        with self.assertRaises(ValueError):
+            self.downloader(engine="asyncio", httpProxy="proxy:8080")
+
+    def testOtherDownloaderWhileFetching(self):
+        downloader = self.downloader(dryRun=True, useListing=False)
+        results = downloader.fetch(downloader.plan("t_2m", range(3), timestamp=datetime(2026, 10, 15)))
+        self.assertEqual(next(results)["status"], "dry-run")
+        with self.assertRaises(RuntimeError):
+            self.downloader(maxWorkers=3)
+        self.assertEqual(len(list(results)), 2)
+        self.downloader(maxWorkers=3)
+        self.assertEqual(opendata_downloader.maxWorkers, 3)
+
+
+class ReportDownloadFailureTest(unittest.TestCase):
+
+    def testTracebackOutsideTheExceptBlock(self):
+        self.addCleanup(opendata_downloader.failedFiles.clear)
+        try:
+            raise KeyError("shortName")
+        except KeyError as e:
+            error = e
+        # as from the result callback of a download that failed earlier
+        with self.assertLogs(level="ERROR") as logs:
+            opendata_downloader.reportDownloadFailure("http://example.com/t_2m.grib2.bz2", error)
+        self.assertIs(logs.records[0].exc_info[1], error)
+        self.assertIn("raise KeyError", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
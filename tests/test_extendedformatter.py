@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime
+
+from extendedformatter import ExtendedFormatter
+
+PATTERN = ("https://opendata.dwd.de/weather/nwp/{model!L}/grib/{modelrun:>02d}/{param!L}/"
+           "{model!L}_{scope}_{grid}_{levtype}_{timestamp:%Y%m%d}{modelrun:>02d}_{step:>03d}_{level:>d}_{param!U}.grib2.bz2")
+
+
+class CompiledFormatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.formatter = ExtendedFormatter()
+        self.fields = dict(model="ICON-D2", modelrun=6, param="T_2m", scope="germany", grid="regular-lat-lon",
+                           levtype="model-level", timestamp=datetime(2026, 10, 15, 6), step=7, level=60)
+
+    def testLikeFormat(self):
+        expected = self.formatter.format(PATTERN, **self.fields)
+        self.assertEqual(self.formatter.compile(PATTERN)(**self.fields), expected)
+        self.assertTrue(expected.endswith("/icon-d2/grib/06/t_2m/icon-d2_germany_regular-lat-lon_model-level_"
+                                          "2026101506_007_60_T_2M.grib2.bz2"))
+
+    def testBindSomeFields(self):
+        template = self.formatter.compile(PATTERN)
+        fixed = {key: value for key, value in self.fields.items() if key not in ("step", "level")}
+        bound = template.bind(**fixed)
+        for step, level in ((0, 1), (7, 60), (120, 65)):
+            fields = dict(self.fields, step=step, level=level)
+            self.assertEqual(bound(step=step, level=level), template(**fields))
+        # only the literal text around step and level is left
+        self.assertEqual([part[1] for part in bound.parts], ["step", "level", None])
+
+    def testBindAllFields(self):
+        template = self.formatter.compile(PATTERN)
+        self.assertEqual(template.bind(**self.fields)(), template(**self.fields))
+
+    def testBindTwice(self):
+        template = self.formatter.compile(PATTERN)
+        fixed = {key: value for key, value in self.fields.items() if key not in ("step", "level")}
+        self.assertEqual(template.bind(**fixed).bind(level=60)(step=7), template(**self.fields))
+
+    def testNestedFieldsAreRejected(self):
+        with self.assertRaises(ValueError):
+            self.formatter.compile("{step:>{width}d}")
+        with self.assertRaises(ValueError):
+            self.formatter.compile("{fields[0]}")
+
+
+if __name__ == "__main__":
+    unittest.main()
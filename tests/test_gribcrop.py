@@ -0,0 +1,79 @@
+import io
+import unittest
+
+try:
+    import numpy
+    import eccodes
+except ImportError:
+    eccodes = None
+
+from gribindex import GribFormatError
+
+
+def makeField(ni=36, nj=19, lat1=90, lon1=0, increment=10):
+    """A regular_ll GRIB2 message scanned from the north west, the value of a point is its index"""
+    gid = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+    try:
+        eccodes.codes_set(gid, "Ni", ni)
+        eccodes.codes_set(gid, "Nj", nj)
+        eccodes.codes_set(gid, "jScansPositively", 0)
+        eccodes.codes_set(gid, "iDirectionIncrementInDegrees", increment)
+        eccodes.codes_set(gid, "jDirectionIncrementInDegrees", increment)
+        eccodes.codes_set(gid, "latitudeOfFirstGridPointInDegrees", lat1)
+        eccodes.codes_set(gid, "longitudeOfFirstGridPointInDegrees", lon1)
+        eccodes.codes_set(gid, "latitudeOfLastGridPointInDegrees", lat1 - increment * (nj - 1))
+        eccodes.codes_set(gid, "longitudeOfLastGridPointInDegrees", (lon1 + increment * (ni - 1)) % 360)
+        eccodes.codes_set(gid, "numberOfDataPoints", ni * nj)
+        eccodes.codes_set_values(gid, numpy.arange(ni * nj, dtype=float))
+        return eccodes.codes_get_message(gid)
+    finally:
+        eccodes.codes_release(gid)
+
+
+def decode(message):
+    gid = eccodes.codes_new_from_message(message)
+    try:
+        keys = ("Ni", "Nj", "numberOfDataPoints", "latitudeOfFirstGridPointInDegrees",
+                "longitudeOfFirstGridPointInDegrees", "latitudeOfLastGridPointInDegrees",
+                "longitudeOfLastGridPointInDegrees")
+        return {key: eccodes.codes_get(gid, key) for key in keys}, eccodes.codes_get_values(gid)
+    finally:
+        eccodes.codes_release(gid)
+
+
+@unittest.skipIf(eccodes is None, "needs the numpy and eccodes packages")
+class GribCropperTest(unittest.TestCase):
+
+    def crop(self, message, bbox):
+        from gribcrop import GribCropper
+        outfile = io.BytesIO()
+        cropper = GribCropper(outfile, bbox)
+        cropper.write(message)
+        cropper.finish()
+        return outfile.getvalue()
+
+    def testCrop(self):
+        keys, values = decode(self.crop(makeField(), (10, 40, 30, 60)))
+        self.assertEqual(keys, {"Ni": 3, "Nj": 3, "numberOfDataPoints": 9,
+                                "latitudeOfFirstGridPointInDegrees": 60, "longitudeOfFirstGridPointInDegrees": 10,
+                                "latitudeOfLastGridPointInDegrees": 40, "longitudeOfLastGridPointInDegrees": 30})
+        # rows 3 to 5 from the north, columns 1 to 3
+        expected = [row * 36 + column for row in (3, 4, 5) for column in (1, 2, 3)]
+        numpy.testing.assert_allclose(values, expected, atol=0.01)
+
+    def testCropAcrossTheAntimeridian(self):
+        # a grid from 100 to 270 east
+        keys, values = decode(self.crop(makeField(ni=18, lon1=100), (170, -10, -170, 10)))
+        self.assertEqual((keys["Ni"], keys["Nj"]), (3, 3))
+        self.assertEqual((keys["longitudeOfFirstGridPointInDegrees"], keys["longitudeOfLastGridPointInDegrees"]),
+                         (170, 190))
+        expected = [row * 18 + column for row in (8, 9, 10) for column in (7, 8, 9)]
+        numpy.testing.assert_allclose(values, expected, atol=0.01)
+
+    def testBoxOutsideTheGrid(self):
+        with self.assertRaises(GribFormatError):
+            self.crop(makeField(ni=18, lon1=100), (0, 0, 50, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
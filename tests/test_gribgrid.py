@@ -0,0 +1,54 @@
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from gribgrid import regularGridIndices, unitVectors
+
+
+@unittest.skipIf(numpy is None, "needs the numpy package")
+class RegularGridIndicesTest(unittest.TestCase):
+
+    def indices(self, lats, lons, *grid):
+        indices, inside = regularGridIndices(numpy.array(lats), numpy.array(lons), *grid)
+        return list(indices), list(inside)
+
+    def testGlobalGrid(self):
+        # 0.25 degrees from 90 north and 0 east, scanned southwards
+        grid = (90, 0, 0.25, -0.25, 1440, 721)
+        self.assertEqual(self.indices([90, 89.8, -90], [0, 0.1, 359.75], *grid),
+                         ([0, 1440, 720 * 1440 + 1439], [True, True, True]))
+
+    def testWrapAroundTheGlobe(self):
+        # nearer to the first column than to the last one, also west of the first column
+        grid = (90, 0, 0.25, -0.25, 1440, 721)
+        self.assertEqual(self.indices([0, 0, 0], [359.9, -0.1, 360], *grid),
+                         ([360 * 1440, 360 * 1440, 360 * 1440], [True, True, True]))
+
+    def testLimitedArea(self):
+        # icon-d2 like, from 43.18 north and 356.06 east, scanned northwards
+        grid = (43.18, 356.06, 0.02, 0.02, 1215, 746)
+        indices, inside = self.indices([43.18, 50, 43.18, 30], [-3.94, 10, 20.5, 10], *grid)
+        self.assertEqual(inside, [True, True, False, False])
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[1], 341 * 1215 + 697)
+
+    def testWestwardScanning(self):
+        grid = (0, 10, -1, 1, 11, 1)
+        self.assertEqual(self.indices([0, 0, 0], [10, 5, 0], *grid), ([0, 5, 10], [True, True, True]))
+
+
+@unittest.skipIf(numpy is None, "needs the numpy package")
+class UnitVectorsTest(unittest.TestCase):
+
+    def testNearestPoint(self):
+        points = unitVectors(numpy.array([0, 45, -45, 89]), numpy.array([0, 179, -179, 0]))
+        station = unitVectors(numpy.array([44]), numpy.array([-178]))[0]
+        self.assertEqual(numpy.argmax(points @ station), 1)
+        numpy.testing.assert_allclose(numpy.linalg.norm(points, axis=1), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
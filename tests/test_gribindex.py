@@ -0,0 +1,141 @@
+import io
+import os
+import tempfile
+import unittest
+
+import gribindex
+from gribindex import GribFormatError, GribMessageFilter, GribScanner
+from tests.grib2 import makeMessage
+
+
+def scan(data, chunkSize=None):
+    scanner = GribScanner()
+    chunkSize = chunkSize or len(data) or 1
+    for start in range(0, len(data), chunkSize):
+        scanner.write(data[start:start + chunkSize])
+    return scanner.finish()
+
+
+class GribScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.first = makeMessage(category=0, number=0, levelType=103, level=2, step=0, points=4)
+        self.second = makeMessage(discipline=0, category=2, number=2, levelType=150, level=60,
+                                  step=6, refTime=(2026, 10, 15, 12, 0), points=2949120, gridTemplate=101)
+        self.data = self.first + self.second
+
+    def testIndexesEveryMessage(self):
+        first, second = scan(self.data)
+        self.assertEqual((first["offset"], first["length"]), (0, len(self.first)))
+        self.assertEqual((second["offset"], second["length"]), (len(self.first), len(self.second)))
+        self.assertEqual((first["discipline"], first["category"], first["number"]), (0, 0, 0))
+        self.assertEqual((first["levelType"], first["level"], first["step"], first["stepUnit"]), (103, 2, 0, 1))
+        self.assertEqual((second["category"], second["number"], second["level"], second["step"]), (2, 2, 60, 6))
+        self.assertEqual((second["gridTemplate"], second["points"]), (101, 2949120))
+        self.assertEqual(first["productTemplate"], 0)
+        self.assertEqual((first["refTime"], second["refTime"]), ("202610150000", "202610151200"))
+        self.assertIsNone(first["levelType2"])
+        self.assertIsNone(first["level2"])
+
+    def testChunkBoundariesDoNotMatter(self):
+        expected = scan(self.data)
+        for chunkSize in (1, 5, 16, 17, 33):
+            self.assertEqual(scan(self.data, chunkSize), expected, chunkSize)
+
+    def testScaledLevels(self):
+        # scale factor 2: 101325 * 10^-2, a negative scale factor (sign bit) multiplies
+        message, = scan(makeMessage(levelType=100, level=101325, levelScale=2))
+        self.assertEqual(message["level"], 1013.25)
+        message, = scan(makeMessage(levelType=100, level=5, levelScale=0x81))
+        self.assertEqual(message["level"], 50)
+        message, = scan(makeMessage(levelType=100, level=0xFFFFFFFF))
+        self.assertIsNone(message["level"])
+
+    def testSecondSurface(self):
+        message, = scan(makeMessage(levelType=106, level=0, levelType2=106))
+        self.assertEqual((message["levelType2"], message["level2"]), (106, 0))
+
+    def testTruncatedData(self):
+        with self.assertRaises(GribFormatError):
+            scan(self.data[:-3])
+
+    def testNoGribMessage(self):
+        with self.assertRaises(GribFormatError):
+            scan(b"\x00" * 32)
+
+    def testMissingEndSection(self):
+        with self.assertRaises(GribFormatError):
+            scan(self.first[:-4] + b"8888")
+
+    def testSectionLongerThanMessage(self):
+        broken = bytearray(self.first)
+        # the length of section 1 starts at octet 17
+        broken[16:20] = (len(self.first)).to_bytes(4, "big")
+        with self.assertRaises(GribFormatError):
+            scan(bytes(broken))
+
+    def testOnlyGrib2(self):
+        broken = bytearray(self.first)
+        broken[7] = 1
+        with self.assertRaises(GribFormatError):
+            scan(bytes(broken))
+
+
+class IndexFileTest(unittest.TestCase):
+
+    def testWriteAndReadIndex(self):
+        data = makeMessage(step=3) + makeMessage(step=4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "t_2m.grib2")
+            with open(path, "wb") as gribfile:
+                gribfile.write(data)
+            self.assertEqual(gribindex.indexFile(path, bufferSize=7), path + gribindex.INDEX_SUFFIX)
+            messages = gribindex.readIndex(path)
+            self.assertEqual(messages, scan(data))
+            with open(path, "rb") as gribfile:
+                gribfile.seek(messages[1]["offset"])
+                self.assertEqual(gribfile.read(messages[1]["length"]), makeMessage(step=4))
+            self.assertEqual(sorted(os.listdir(directory)), ["t_2m.grib2", "t_2m.grib2.idx.json"])
+
+
+class ReversingFilter(GribMessageFilter):
+
+    def transform(self, message):
+        return message[::-1]
+
+
+class GribMessageFilterTest(unittest.TestCase):
+
+    def testPassesWholeMessages(self):
+        messages = [makeMessage(step=step) for step in range(3)]
+        data = b"".join(messages)
+        outfile = io.BytesIO()
+        scanner = GribScanner()
+        messageFilter = GribMessageFilter(outfile, scanner)
+        for start in range(0, len(data), 10):
+            messageFilter.write(data[start:start + 10])
+        messageFilter.finish()
+        self.assertEqual(outfile.getvalue(), data)
+        self.assertEqual(len(scanner.finish()), 3)
+
+    def testTransformsEachMessage(self):
+        messages = [makeMessage(step=step) for step in range(2)]
+        outfile = io.BytesIO()
+        messageFilter = ReversingFilter(outfile)
+        messageFilter.write(b"".join(messages))
+        messageFilter.finish()
+        self.assertEqual(outfile.getvalue(), b"".join(message[::-1] for message in messages))
+
+    def testIncompleteMessage(self):
+        messageFilter = GribMessageFilter(io.BytesIO())
+        messageFilter.write(makeMessage()[:-1])
+        with self.assertRaises(GribFormatError):
+            messageFilter.finish()
+
+    def testNoGribMessage(self):
+        with self.assertRaises(GribFormatError):
+            GribMessageFilter(io.BytesIO()).write(b"\x00" * 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
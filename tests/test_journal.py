@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+
+import opendata_downloader
+from journal import DONE, FAILED, PLANNED, Journal
+from opendata_downloader import Downloader, configure, getTaskUrl, journalPlan
+
+
+def entry(step, run="2026101500", model="icon-d2", path=None):
+    url = f"http://example.com/{model}/{run}/t_2m_{step:03d}.grib2.bz2"
+    return dict(url=url, model=model, run=run, param="t_2m", levtype="single-level", level=0, step=step,
+                path=path or f"/data/t_2m_{step:03d}.grib2")
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "journal.sqlite")
+        self.journal = Journal(self.path)
+        self.addCleanup(self.journal.close)
+
+    def row(self, url, columns="state"):
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute(f"SELECT {columns} FROM files WHERE url = ?", (url,)).fetchone()
+
+    def testPlanKeepsTheStateOfTheSamePath(self):
+        first = entry(0)
+        self.journal.plan([first])
+        self.assertEqual(self.row(first["url"]), (PLANNED,))
+        self.journal.done(first["url"], nbytes=10)
+        self.journal.plan([first])
+        self.assertEqual(self.row(first["url"]), (DONE,))
+
+    def testPlanResetsTheStateOfAnotherPath(self):
+        first = entry(0)
+        self.journal.plan([first])
+        self.journal.done(first["url"], nbytes=10)
+        self.journal.plan([dict(first, path="/elsewhere/t_2m_000.grib2")])
+        self.assertEqual(self.row(first["url"], "state, path"), (PLANNED, "/elsewhere/t_2m_000.grib2"))
+
+    def testCompletedPerModelRun(self):
+        entries = [entry(0), entry(1), entry(0, run="2026101503"), entry(0, model="icon-eu")]
+        self.journal.plan(entries)
+        for planned in entries:
+            self.journal.done(planned["url"])
+        self.journal.failed(entries[1]["url"], "HTTPError 404")
+        self.assertEqual(self.journal.completed("icon-d2", "2026101500"), {entries[0]["url"]})
+        self.assertEqual(self.journal.completed("icon-d2", "2026101503"), {entries[2]["url"]})
+        self.assertEqual(self.row(entries[1]["url"], "state, error"), (FAILED, "HTTPError 404"))
+
+    def testDoneKeepsUnknownValues(self):
+        first = entry(0)
+        self.journal.plan([first])
+        self.journal.done(first["url"], nbytes=10, checksum="abc", etag='"1"', lastModified="Thu, 15 Oct 2026")
+        # skipped or unchanged (304) files do not know them
+        self.journal.done(first["url"])
+        self.assertEqual(self.row(first["url"], "bytes, checksum"), (10, "abc"))
+        self.assertEqual(self.journal.validators(first["url"], first["path"]), ('"1"', "Thu, 15 Oct 2026"))
+        self.assertIsNone(self.journal.validators(first["url"], "/elsewhere/t_2m_000.grib2"))
+
+
+class JournalPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(configure)
+        self.addCleanup(setattr, opendata_downloader, "activeDownloader", None)
+
+    def plan(self):
+        downloader = Downloader("icon-d2", grid="regular-lat-lon", destFilePath=self.directory.name,
+                                journalPath=os.path.join(self.directory.name, "journal.sqlite"),
+                                skipExisting=True, useListing=False)
+        return downloader.plan("t_2m", range(3), timestamp=datetime(2026, 10, 15))
+
+    def testRestartedPlanSkipsDoneFiles(self):
+        plan = self.plan()
+        remaining, results = journalPlan(plan)
+        self.assertEqual((remaining, results), (plan, []))
+        opendata_downloader.getJournal().done(getTaskUrl(plan[1]), nbytes=10)
+        # a new run opens the journal again
+        configure()
+        plan = self.plan()
+        remaining, results = journalPlan(plan)
+        self.assertEqual(remaining, [plan[0], plan[2]])
+        self.assertEqual([(result["url"], result["status"]) for result in results],
+                         [(getTaskUrl(plan[1]), "skipped")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import opendata_downloader
+from opendata_downloader import getGribFileUrls, getLatestPublishedModelTimestamp
+
+NOW = datetime(2026, 10, 15, 10, 30)
+# icon-eu is 3-hourly after step 78
+STEPS = list(range(0, 79)) + list(range(81, 121, 3))
+
+
+class FixedDatetime(datetime):
+
+    @classmethod
+    def utcnow(cls):
+        return NOW
+
+
+class LatestPublishedModelTimestampTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listings = {}
+        for target, replacement in (("getDirectoryListing", lambda url: self.listings.get(url, frozenset())),
+                                    ("datetime", FixedDatetime)):
+            patcher = mock.patch.object(opendata_downloader, target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def publish(self, hoursAgo, steps):
+        timestamp = datetime(2026, 10, 15, 9) - timedelta(hours=hoursAgo)
+        for url in getGribFileUrls(model="icon-eu", grid="regular-lat-lon", param="t_2m", timeSteps=steps,
+                                   timestamp=timestamp, levtype="single-level", levelRange=[0]):
+            directory, name = url.rsplit('/', 1)
+            self.listings[directory + '/'] = self.listings.get(directory + '/', frozenset()) | {name}
+        return timestamp
+
+    def latest(self, timeSteps):
+        return getLatestPublishedModelTimestamp(model="icon-eu", grid="regular-lat-lon", param="t_2m",
+                                                levtype="single-level", level=0, timeSteps=timeSteps)
+
+    def testSparseStepsOfTheRun(self):
+        # the requested hourly steps past 78 are never published
+        self.publish(6, STEPS)
+        newest = self.publish(3, STEPS)
+        self.publish(0, range(0, 30))
+        self.assertEqual(self.latest(list(range(0, 121))), newest)
+
+    def testNewestRunComplete(self):
+        self.publish(3, STEPS)
+        newest = self.publish(0, STEPS)
+        self.assertEqual(self.latest(list(range(0, 121))), newest)
+
+    def testOldestRunNeedsTheLastStep(self):
+        self.publish(0, range(0, 30))
+        self.assertIsNone(self.latest(STEPS))
+        self.publish(0, STEPS)
+        self.assertEqual(self.latest(STEPS), datetime(2026, 10, 15, 9))
+
+    def testRunWithoutFiles(self):
+        # the run before the newest one has been removed from the server
+        newest = self.publish(0, STEPS)
+        self.publish(6, STEPS)
+        self.assertEqual(self.latest(STEPS), newest)
+
+    def testListingNotAvailable(self):
+        self.listings = mock.Mock(get=lambda url, default: None)
+        self.assertIsNone(self.latest(STEPS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import opendata_downloader
+from opendata_downloader import MissingDirectory, filterPublishedFiles, getTaskUrl, planGribDataSequence
+
+
+class FilterPublishedFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listings = {}
+        patcher = mock.patch.object(opendata_downloader, "getDirectoryListing", lambda url: self.listings[url])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(opendata_downloader.failedFiles.clear)
+        self.plan = []
+        for param in ("t_2m", "tot_prec"):
+            self.plan.extend(planGribDataSequence(model="icon-d2", grid="regular-lat-lon", param=param,
+                                                  timeSteps=[0, 1, 2], levelRange=[0], levtype="single-level",
+                                                  timestamp=datetime(2026, 10, 15), destFilePath="out"))
+        self.urls = [getTaskUrl(task) for task in self.plan]
+        self.directories = sorted({url.rsplit('/', 1)[0] + '/' for url in self.urls})
+
+    def listing(self, urls):
+        return {url.rsplit('/', 1)[1] for url in urls}
+
+    def filter(self):
+        with self.assertLogs(level="DEBUG") as logs:
+            published, results = filterPublishedFiles(self.plan)
+        return published, {result["url"]: result["status"] for result in results}, logs.output
+
+    def testUnlistedFilesAreUnpublished(self):
+        t2m, totPrec = self.directories
+        self.listings = {t2m: self.listing(self.urls[:2]), totPrec: self.listing(self.urls[3:])}
+        published, results, _ = self.filter()
+        self.assertEqual(published, self.plan[:2] + self.plan[3:])
+        self.assertEqual(results, {self.urls[2]: "unpublished"})
+        self.assertEqual(opendata_downloader.failedFiles, [])
+
+    def testMissingDirectoryFails(self):
+        t2m, totPrec = self.directories
+        self.listings = {t2m: MissingDirectory(), totPrec: self.listing(self.urls[3:])}
+        published, results, logs = self.filter()
+        self.assertEqual(published, self.plan[3:])
+        self.assertEqual(results, {url: "failed" for url in self.urls[:3]})
+        self.assertEqual([failure[:2] for failure in opendata_downloader.failedFiles],
+                         [(url, 404) for url in self.urls[:3]])
+        self.assertTrue(any("Directory not found" in line and t2m in line for line in logs))
+
+    def testListingNotAvailable(self):
+        t2m, totPrec = self.directories
+        self.listings = {t2m: None, totPrec: frozenset()}
+        published, results, _ = self.filter()
+        # without a listing the files are requested anyway
+        self.assertEqual(published, self.plan[:3])
+        self.assertEqual(results, {url: "unpublished" for url in self.urls[3:]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import errno
+import itertools
+import os
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import opendata_downloader
+from objectstore import ObjectStore, linkOrCopy
+from opendata_downloader import configure, linkStoredObject, probeSignature
+from tests.httpserver import FileServer
+
+
+class ObjectStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # distinct times for the least recently used order
+        clock = mock.patch("objectstore.time.time", side_effect=itertools.count(1000))
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def store(self, maxBytes=None):
+        store = ObjectStore(os.path.join(self.directory.name, "store"), maxBytes=maxBytes)
+        self.addCleanup(store.close)
+        return store
+
+    def create(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as outfile:
+            outfile.write(content)
+        return path
+
+    def testAddLinksTheObject(self):
+        path = self.create("hhl.grib2", b"hhl")
+        objectPath = self.store().add("hhl:3:abc", "aa11", path)
+        self.assertEqual(objectPath, os.path.join(self.directory.name, "store", "objects", "aa", "aa11"))
+        self.assertTrue(os.path.samefile(objectPath, path))
+        self.assertEqual(self.store().lookup("hhl:3:abc"), objectPath)
+        self.assertIsNone(self.store().lookup("hhl:3:abd"))
+
+    def testLeastRecentlyUsedAreEvicted(self):
+        store = self.store(maxBytes=25)
+        first = store.add("a", "aa", self.create("a", b"a" * 10))
+        second = store.add("b", "bb", self.create("b", b"b" * 10))
+        store.lookup("a")
+        store.add("c", "cc", self.create("c", b"c" * 10))
+        self.assertEqual((store.lookup("a"), store.lookup("b")), (first, None))
+        self.assertFalse(os.path.exists(second))
+        # the hard link in the run directory stays
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, "b")))
+
+    def testLookupForgetsMissingObjects(self):
+        store = self.store()
+        os.remove(store.add("a", "aa", self.create("a", b"a")))
+        self.assertIsNone(store.lookup("a"))
+        self.assertEqual(store._connection.execute("SELECT COUNT(*) FROM objects").fetchone(), (0,))
+
+    def testCopyWhenLinkingFails(self):
+        source = self.create("source", b"hhl")
+        destination = os.path.join(self.directory.name, "destination")
+        with mock.patch("objectstore.os.link", side_effect=OSError(errno.EXDEV, "Invalid cross-device link")):
+            with self.assertLogs(level="WARNING"):
+                linkOrCopy(source, destination)
+        self.assertFalse(os.path.samefile(source, destination))
+        with open(destination, "rb") as infile:
+            self.assertEqual(infile.read(), b"hhl")
+        with mock.patch("objectstore.os.link", side_effect=OSError(errno.EACCES, "Permission denied")):
+            with self.assertRaises(OSError):
+                linkOrCopy(source, destination)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["destination", "source"])
+
+
+class LinkStoredObjectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(configure)
+        configure(objectStorePath=os.path.join(self.directory.name, "store"))
+
+    def fileName(self, run, param="hhl"):
+        return f"icon-d2_germany_regular-lat-lon_time-invariant_{run}_000_0_{param}.grib2.bz2"
+
+    def target(self, name):
+        return types.SimpleNamespace(fullFilePath=os.path.join(self.directory.name, name), signature=None)
+
+    def testSignatureIsIndependentOfTheRun(self):
+        body = b"BZh9" + bytes(range(64))
+        files = {"/00/" + self.fileName(run): body for run in ("2026101500", "2026101503")}
+        with FileServer(files) as server:
+            first, second = (probeSignature(server.url(path)) for path in sorted(files))
+            self.assertEqual(first, second)
+            self.assertEqual(server.requests[0][1]["Range"], "bytes=-32")
+        self.assertEqual(first, "icon-d2_germany_regular-lat-lon_time-invariant_000_0_hhl.grib2.bz2:68:"
+                         + bytes(range(32, 64)).hex())
+
+    def testLinkStoredObject(self):
+        files = {"/" + self.fileName(run): b"BZh9hhl" for run in ("2026101500", "2026101503")}
+        stored = os.path.join(self.directory.name, "stored.grib2")
+        with open(stored, "wb") as outfile:
+            outfile.write(b"hhl")
+        with FileServer(files) as server:
+            first = self.target("2026101500_hhl.grib2")
+            self.assertFalse(linkStoredObject(server.url("/" + self.fileName("2026101500")), first))
+            opendata_downloader.getObjectStore().add(first.signature, "aa11", stored)
+            second = self.target("2026101503_hhl.grib2")
+            self.assertTrue(linkStoredObject(server.url("/" + self.fileName("2026101503")), second))
+            self.assertTrue(os.path.samefile(second.fullFilePath, stored))
+            # other files are not probed
+            self.assertFalse(linkStoredObject(server.url("/t_2m_2026101500.grib2.bz2"), self.target("t_2m")))
+            self.assertEqual(len(server.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
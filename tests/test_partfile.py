@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+
+from partfile import MemoryPartFile, PartFile, ResumeError
+
+URL = "https://opendata.dwd.de/weather/nwp/icon-d2/grib/00/t_2m/t_2m.grib2.bz2"
+
+
+class PartFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "t_2m.grib2.bz2.part")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def download(self, part, status, headers, data):
+        with part.open(status, headers) as partFile:
+            partFile.write(data)
+
+    def testNewFile(self):
+        part = PartFile(self.path, URL)
+        self.assertEqual((part.offset, part.size, part.requestHeaders()), (0, None, {}))
+        self.assertFalse(part.isComplete())
+
+    def testResume(self):
+        self.download(PartFile(self.path, URL), 200, {"Content-Length": "10", "ETag": '"abc"'}, b"01234")
+
+        part = PartFile(self.path, URL)
+        self.assertEqual((part.offset, part.size), (5, 10))
+        self.assertEqual(part.requestHeaders(), {"Range": "bytes=5-", "If-Range": '"abc"'})
+        self.download(part, 206, {"Content-Range": "bytes 5-9/10"}, b"56789")
+        self.assertTrue(part.isComplete())
+        self.assertEqual(b"".join(part.chunks(3)), b"0123456789")
+
+    def testIfRangeFallsBackToLastModified(self):
+        self.download(PartFile(self.path, URL), 200,
+                      {"Content-Length": "10", "Last-Modified": "Thu, 15 Oct 2026 00:00:00 GMT"}, b"01")
+        self.assertEqual(PartFile(self.path, URL).requestHeaders()["If-Range"], "Thu, 15 Oct 2026 00:00:00 GMT")
+
+    def testFullResponseRestarts(self):
+        self.download(PartFile(self.path, URL), 200, {"Content-Length": "10"}, b"01234")
+        # the file changed on the server, If-Range made it send the whole file
+        part = PartFile(self.path, URL)
+        self.download(part, 200, {"Content-Length": "4"}, b"abcd")
+        self.assertEqual((part.offset, part.size), (4, 4))
+        self.assertEqual(b"".join(part.chunks(100)), b"abcd")
+
+    def testUnexpectedRange(self):
+        self.download(PartFile(self.path, URL), 200, {"Content-Length": "10"}, b"01234")
+        part = PartFile(self.path, URL)
+        with self.assertRaises(ResumeError):
+            part.open(206, {"Content-Range": "bytes 3-9/10"})
+        # the part file is discarded, the next attempt starts over
+        self.assertEqual(PartFile(self.path, URL).offset, 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def testOtherUrl(self):
+        self.download(PartFile(self.path, URL), 200, {"Content-Length": "10"}, b"01234")
+        self.assertEqual(PartFile(self.path, URL.replace("00", "06")).offset, 0)
+
+    def testMetaWithoutData(self):
+        self.download(PartFile(self.path, URL), 200, {"Content-Length": "10"}, b"01234")
+        os.remove(self.path)
+        part = PartFile(self.path, URL)
+        self.assertEqual((part.offset, part.requestHeaders()), (0, {}))
+
+    def testRemove(self):
+        part = PartFile(self.path, URL)
+        self.download(part, 200, {"Content-Length": "10"}, b"01234")
+        part.remove()
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+class MemoryPartFileTest(unittest.TestCase):
+
+    def testResume(self):
+        part = MemoryPartFile(URL)
+        partFile = part.open(200, {"Content-Length": "6", "ETag": '"abc"'})
+        partFile.write(b"012")
+        partFile.close()
+        self.assertEqual(part.requestHeaders(), {"Range": "bytes=3-", "If-Range": '"abc"'})
+        part.open(206, {"Content-Range": "bytes 3-5/6"}).write(b"345")
+        self.assertTrue(part.isComplete())
+        self.assertEqual(list(part.chunks(4)), [b"0123", b"45"])
+
+    def testFullResponseRestarts(self):
+        part = MemoryPartFile(URL)
+        part.open(200, {"Content-Length": "6"}).write(b"012")
+        part.open(200, {"Content-Length": "2"}).write(b"ab")
+        self.assertEqual((part.offset, bytes(part.data)), (2, b"ab"))
+
+    def testRemove(self):
+        part = MemoryPartFile(URL)
+        part.open(200, {"Content-Length": "6"}).write(b"012")
+        part.remove()
+        self.assertEqual((part.offset, part.requestHeaders()), (0, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import io
+import tempfile
+import unittest
+
+try:
+    import numpy
+    import scipy
+except ImportError:
+    numpy = scipy = None
+try:
+    import eccodes
+except ImportError:
+    eccodes = None
+
+import regrid
+
+# a 1 degree lattice from 2 south, 2 west to 4 north, 4 east standing in for the icosahedral cells
+LATS, LONS = (numpy.meshgrid(numpy.arange(-2.0, 5.0), numpy.arange(-2.0, 5.0), indexing="ij")
+              if numpy is not None else (None, None))
+TARGET = (0, 0, 2, 2, 1)
+
+
+def field(lats, lons):
+    return 10 * lats + lons
+
+
+@unittest.skipIf(scipy is None, "needs the numpy and scipy packages")
+class WeightsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lats, self.lons = LATS.ravel(), LONS.ravel()
+        self.addCleanup(regrid.weightsCache.clear)
+
+    def testTargetShape(self):
+        self.assertEqual(regrid.targetShape(TARGET), (3, 3))
+        self.assertEqual(regrid.targetShape((-10, 40, 20, 60, 0.25)), (81, 121))
+
+    def testTargetPointsOnSourcePoints(self):
+        indices, weights = regrid.buildWeights(self.lats, self.lons, TARGET)
+        self.assertEqual((indices.shape, weights.shape), ((9, regrid.NEIGHBOURS), (9, regrid.NEIGHBOURS)))
+        targetLats, targetLons = regrid.targetCoordinates(TARGET)
+        numpy.testing.assert_allclose(regrid.applyWeights(field(self.lats, self.lons), indices, weights),
+                                      field(targetLats, targetLons), atol=1e-4)
+
+    def testInverseDistanceWeights(self):
+        grid = (0.5, 0.5, 0.5, 0.5, 1)
+        indices, weights = regrid.buildWeights(self.lats, self.lons, grid)
+        numpy.testing.assert_allclose(weights.sum(axis=1), 1, rtol=1e-6)
+        self.assertTrue((weights > 0).all())
+        # three of the four source points around the target point at nearly the same distance
+        numpy.testing.assert_allclose(weights, 1 / 3, atol=0.01)
+        value = regrid.applyWeights(field(self.lats, self.lons), indices, weights)[0]
+        self.assertTrue(field(0, 0) <= value <= field(1, 1))
+
+    def testMissingValuesPropagate(self):
+        values = field(self.lats, self.lons)
+        indices, weights = regrid.buildWeights(self.lats, self.lons, TARGET)
+        values[indices[4, 0]] = numpy.nan
+        self.assertEqual(list(numpy.isnan(regrid.applyWeights(values, indices, weights))),
+                         [False] * 4 + [True] + [False] * 4)
+
+    def testWeightsAreCached(self):
+        with tempfile.TemporaryDirectory() as cacheDir:
+            built = regrid.loadWeights(cacheDir, "grid", TARGET, lambda: (self.lats, self.lons))
+            regrid.weightsCache.clear()
+
+            def notNeeded():
+                raise AssertionError("the weights are built again")
+            loaded = regrid.loadWeights(cacheDir, "grid", TARGET, notNeeded)
+            for array, cached in zip(built, loaded):
+                numpy.testing.assert_array_equal(array, cached)
+            del built, loaded
+            regrid.weightsCache.clear()
+
+
+@unittest.skipIf(scipy is None or eccodes is None, "needs the numpy, scipy and eccodes packages")
+class GribRegridderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cacheDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cacheDir.cleanup)
+        self.addCleanup(regrid.weightsCache.clear)
+
+    def makeMessage(self, values):
+        gid = eccodes.codes_grib_new_from_samples("GRIB2")
+        try:
+            eccodes.codes_set(gid, "gridDefinitionTemplateNumber", 101)
+            eccodes.codes_set(gid, "numberOfDataPoints", len(values))
+            eccodes.codes_set_values(gid, values)
+            return eccodes.codes_get_message(gid)
+        finally:
+            eccodes.codes_release(gid)
+
+    def testTransform(self):
+        outfile = io.BytesIO()
+        regridder = regrid.GribRegridder(outfile, TARGET, lambda: (LATS.ravel(), LONS.ravel()), self.cacheDir.name)
+        regridder.write(self.makeMessage(field(LATS, LONS).ravel()))
+        regridder.finish()
+        gid = eccodes.codes_new_from_message(outfile.getvalue())
+        try:
+            get = lambda key: eccodes.codes_get(gid, key)
+            self.assertEqual((get("gridType"), get("Ni"), get("Nj"), get("numberOfDataPoints")),
+                             ("regular_ll", 3, 3, 9))
+            self.assertEqual((get("latitudeOfFirstGridPointInDegrees"), get("latitudeOfLastGridPointInDegrees"),
+                              get("longitudeOfFirstGridPointInDegrees"), get("longitudeOfLastGridPointInDegrees")),
+                             (0, 2, 0, 2))
+            targetLats, targetLons = regrid.targetCoordinates(TARGET)
+            numpy.testing.assert_allclose(eccodes.codes_get_values(gid), field(targetLats, targetLons), atol=0.01)
+        finally:
+            eccodes.codes_release(gid)
+
+
+if __name__ == "__main__":
+    unittest.main()
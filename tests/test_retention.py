@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+from retention import RetentionManager
+
+MODELS = ["icon", "icon-d2", "icon-eu"]
+
+
+def fileName(model, run, param="t_2m", suffix=".grib2"):
+    return f"{model}_germany_regular-lat-lon_single-level_{run}_000_2d_{param}{suffix}"
+
+
+class RetentionManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def create(self, name, size=10, directory="icon-d2/grib/00/t_2m"):
+        path = os.path.join(self.directory.name, directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as outfile:
+            outfile.write(b"\0" * size)
+        return path
+
+    def manager(self, **options):
+        return RetentionManager(self.directory.name, MODELS, **options)
+
+    def testScanGroupsTheFilesOfARun(self):
+        self.create(fileName("icon-d2", "2026101500"))
+        self.create(fileName("icon-d2", "2026101500", suffix=".grib2.bz2.part"), size=5)
+        self.create(fileName("icon-d2", "2026101500", suffix=".grib2.bz2.part.json"), size=1)
+        self.create("." + fileName("icon-d2", "2026101500") + ".0a1b2c.tmp", size=2)
+        self.create(fileName("icon", "2026101500"), directory="icon/grib/00/t_2m")
+        runs = self.manager().scan()
+        self.assertEqual(sorted(runs), [("icon", "2026101500"), ("icon-d2", "2026101500")])
+        self.assertEqual(runs[("icon-d2", "2026101500")][0], 18)
+        self.assertEqual(len(runs[("icon-d2", "2026101500")][1]), 4)
+
+    def testForeignFilesAreLeftAlone(self):
+        foreign = [self.create("db_dump_2020010100_full.sql", directory=""),
+                   self.create(fileName("icon-d2", "2020010100", suffix=".txt")),
+                   self.create(fileName("cosmo-x", "2020010100"))]
+        self.create(fileName("icon-d2", "2026101500"))
+        manager = self.manager(maxRuns=1, maxBytes=1)
+        self.assertEqual(list(manager.scan()), [("icon-d2", "2026101500")])
+        manager.enforce()
+        self.assertTrue(all(os.path.exists(path) for path in foreign))
+
+    def testMaxRunsPerModel(self):
+        for run in ("2026101400", "2026101412", "2026101500"):
+            self.create(fileName("icon-d2", run))
+            self.create(fileName("icon", run), directory="icon/grib/00/t_2m")
+        manager = self.manager(maxRuns=2)
+        self.assertEqual(manager.expiredRuns(manager.scan()), [("icon", "2026101400"), ("icon-d2", "2026101400")])
+
+    def testMaxBytesSparesProtectedRuns(self):
+        for run in ("2026101400", "2026101412", "2026101500"):
+            self.create(fileName("icon-d2", run), size=100)
+        # the oldest run is being downloaded again, the next oldest goes instead
+        manager = self.manager(maxBytes=200, protectedRuns=[("icon-d2", "2026101400")])
+        self.assertEqual(manager.expiredRuns(manager.scan()), [("icon-d2", "2026101412")])
+        manager = self.manager(maxBytes=100, protectedRuns=[("icon-d2", "2026101500")])
+        self.assertEqual(manager.expiredRuns(manager.scan()), [("icon-d2", "2026101400"), ("icon-d2", "2026101412")])
+
+    def testHardLinksCountOnce(self):
+        path = self.create(fileName("icon-d2", "2026101500", param="hhl"), size=100)
+        os.link(path, os.path.join(os.path.dirname(path), fileName("icon-d2", "2026101500", param="hsurf")))
+        size, paths = self.manager().scan()[("icon-d2", "2026101500")]
+        self.assertEqual((size, len(paths)), (100, 2))
+
+    def testEnforceDeletesAndReports(self):
+        evicted = []
+        old = self.create(fileName("icon-d2", "2026101400"))
+        new = self.create(fileName("icon-d2", "2026101500"))
+        freed = self.manager(maxRuns=1, onEvict=lambda *key: evicted.append(key)).enforce()
+        self.assertEqual((freed, evicted), (10, [("icon-d2", "2026101400")]))
+        self.assertEqual((os.path.exists(old), os.path.exists(new)), (False, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import concurrent.futures
+import email.message
+import unittest
+from urllib.error import HTTPError, URLError
+
+import opendata_downloader
+from opendata_downloader import IntegrityError, OutputError, configure, getErrorClass, getRetryDelay
+from tests.httpserver import FileServer
+
+URL = "http://example.com/t_2m.grib2.bz2"
+
+
+def httpError(code, retryAfter=None):
+    headers = email.message.Message()
+    if retryAfter is not None:
+        headers["Retry-After"] = retryAfter
+    return HTTPError(URL, code, "", headers, None)
+
+
+class MemoryTarget(object):
+    """The body of a response, as the asyncio engine writes it to a DownloadTarget"""
+
+    def __init__(self):
+        self.data = b""
+
+    def requestHeaders(self):
+        return {}
+
+    def begin(self, status=None, headers=None):
+        self.data = b""
+
+    def write(self, chunk):
+        self.data += chunk
+
+    def finish(self):
+        return self.data
+
+    def abort(self):
+        pass
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(configure)
+        configure(retryBaseDelay=0.01, retryMaxDelay=0.05)
+
+    def delays(self, error, tries=10, attempts=None):
+        attempts = {} if attempts is None else attempts
+        delays = []
+        for _ in range(tries):
+            delay = getRetryDelay(error, attempts)
+            if delay is None:
+                break
+            delays.append(delay)
+        return delays
+
+    def testErrorClasses(self):
+        errors = [httpError(503), httpError(429), httpError(500), httpError(404), ConnectionResetError(),
+                  TimeoutError(), URLError("refused"), IntegrityError(), OutputError(), KeyError()]
+        self.assertEqual([getErrorClass(e) for e in errors],
+                         ["throttled", "throttled", "server", "client", "connection", "connection", "connection",
+                          "integrity", "output", "other"])
+
+    def testBudgetPerErrorClass(self):
+        configure(retryBudget={"server": 2, "connection": 1})
+        attempts = {}
+        self.assertEqual(len(self.delays(httpError(500), attempts=attempts)), 2)
+        # another class has its own budget
+        self.assertEqual(len(self.delays(ConnectionResetError(), attempts=attempts)), 1)
+        self.assertEqual(attempts, {"server": 2, "connection": 1})
+        self.assertEqual(len(self.delays(httpError(503))), opendata_downloader.retryBudget["throttled"])
+        self.assertEqual(self.delays(httpError(404)), [])
+
+    def testExponentialBackoffIsCapped(self):
+        for delay in self.delays(httpError(503)):
+            self.assertTrue(0 <= delay <= 0.05)
+
+    def testRetryAfter(self):
+        configure(retryBaseDelay=0.01, retryMaxDelay=60)
+        self.assertEqual(self.delays(httpError(503, "30"), tries=1), [30])
+        # never longer than retryMaxDelay
+        self.assertEqual(self.delays(httpError(503, "3600"), tries=1), [60])
+        # an HTTP date is not understood, the backoff applies
+        self.assertLess(self.delays(httpError(503, "Wed, 21 Oct 2026 07:28:00 GMT"), tries=1)[0], 0.02)
+
+    def testCancelledAndOutputErrorsAreNotRetried(self):
+        # not even with a budget
+        configure(retryBudget={"cancelled": 5, "output": 5})
+        self.assertEqual(self.delays(concurrent.futures.CancelledError(URL)), [])
+        self.assertEqual(self.delays(OutputError(URL)), [])
+
+
+class AsyncEngineRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(configure)
+        configure(retryBaseDelay=0.01, retryMaxDelay=0.05)
+
+    def download(self, server, paths):
+        import asyncengine
+        delays, results = [], {}
+
+        def retryDelay(e, attempts):
+            delay = getRetryDelay(e, attempts)
+            delays.append((getErrorClass(e), delay))
+            return delay
+
+        def onResult(job, result, exception):
+            results[job[0]] = exception or result
+        asyncengine.downloadAll([(server.url(path), MemoryTarget()) for path in paths], onResult,
+                                retryDelay=retryDelay)
+        return delays, results
+
+    def testThrottledAndRetried(self):
+        with FileServer({"/t_2m": b"GRIB"}, failures=[(503, {"Retry-After": "0"})] * 2) as server:
+            delays, results = self.download(server, ["/t_2m"])
+            self.assertEqual(results, {server.url("/t_2m"): b"GRIB"})
+        self.assertEqual([errorClass for errorClass, _ in delays], ["throttled", "throttled"])
+        self.assertTrue(all(0 <= delay <= 0.05 for _, delay in delays))
+
+    def testBudgetUsedUp(self):
+        configure(retryBudget={"throttled": 1}, retryBaseDelay=0.01, retryMaxDelay=0.05)
+        with FileServer({"/t_2m": b"GRIB"}, failures=[(429, {})] * 2) as server:
+            delays, results = self.download(server, ["/t_2m"])
+        self.assertEqual([(errorClass, delay is None) for errorClass, delay in delays],
+                         [("throttled", False), ("throttled", True)])
+        self.assertEqual(getErrorClass(results[server.url("/t_2m")]), "throttled")
+
+    def testClientErrorsAreNotRetried(self):
+        with FileServer({}) as server:
+            delays, results = self.download(server, ["/missing"])
+        self.assertEqual(delays, [("client", None)])
+        self.assertEqual(results[server.url("/missing")].code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
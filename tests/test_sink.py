@@ -0,0 +1,169 @@
+import bz2
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import gribindex
+from opendata_downloader import OutputError, SinkTarget, getErrorClass
+from sink import MergedOutput, OutputSink
+from tests.grib2 import makeMessage
+
+URL = "https://opendata.dwd.de/weather/nwp/icon-d2/grib/00/t_2m/t_2m_{}.grib2.bz2"
+
+
+class ClosedPipe(io.RawIOBase):
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        raise BrokenPipeError(32, "Broken pipe")
+
+
+class OutputSinkTest(unittest.TestCase):
+
+    def testPlanOrder(self):
+        stream = io.BytesIO()
+        sink = OutputSink(stream)
+        sink.expect([dict(url=URL.format(i)) for i in range(3)])
+        sink.write(URL.format(2), b"c")
+        sink.write(URL.format(1), b"b")
+        self.assertEqual(stream.getvalue(), b"")
+        sink.write(URL.format(0), b"a")
+        self.assertEqual(stream.getvalue(), b"abc")
+
+    def testSkip(self):
+        stream = io.BytesIO()
+        sink = OutputSink(stream)
+        sink.expect([dict(url=URL.format(i)) for i in range(3)])
+        sink.write(URL.format(1), b"b")
+        sink.skip(URL.format(0))
+        self.assertEqual(stream.getvalue(), b"b")
+        sink.close()
+        self.assertEqual(stream.getvalue(), b"b")
+
+    def testHeldDataSpills(self):
+        stream = io.BytesIO()
+        sink = OutputSink(stream, maxHeldBytes=10)
+        sink.expect([dict(url=URL.format(i)) for i in range(4)])
+        for i in (3, 2, 1):
+            sink.write(URL.format(i), bytes([i]) * 6)
+        # one file fits the limit, the others wait in the temporary file
+        self.assertEqual(sink._heldBytes, 6)
+        self.assertIsNotNone(sink._spill)
+        sink.write(URL.format(0), b"a")
+        self.assertEqual(stream.getvalue(), b"a" + b"\x01" * 6 + b"\x02" * 6 + b"\x03" * 6)
+        self.assertEqual(sink._heldBytes, 0)
+        sink.close()
+        self.assertIsNone(sink._spill)
+
+    def testCompletionOrder(self):
+        stream = io.BytesIO()
+        sink = OutputSink(stream, ordered=False)
+        sink.expect([dict(url=URL.format(i)) for i in range(2)])
+        sink.write(URL.format(1), b"b")
+        sink.write(URL.format(0), b"a")
+        self.assertEqual(stream.getvalue(), b"ba")
+
+
+class MergedOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = MergedOutput(self.directory.name, lambda task: "merged.grib2")
+        self.path = os.path.join(self.directory.name, "merged.grib2")
+        self.messages = [makeMessage(step=step) for step in range(4)]
+
+    def testCompletionOrderAcrossPolls(self):
+        tasks = [dict(url=URL.format(i)) for i in range(4)]
+        self.output.expect(tasks)
+        self.output.write(URL.format(3), self.messages[3])
+        self.output.write(URL.format(1), self.messages[1])
+        # the next --watch poll plans the files still missing
+        self.output.expect(tasks[2:] + tasks[:1])
+        self.output.write(URL.format(2), self.messages[2])
+        self.output.write(URL.format(0), self.messages[0])
+        self.assertFalse(os.path.exists(self.path))
+        self.output.close()
+        with open(self.path, "rb") as mergedFile:
+            data = mergedFile.read()
+        self.assertEqual(data, b"".join(self.messages[i] for i in (3, 1, 2, 0)))
+        index = gribindex.readIndex(self.path)
+        self.assertEqual([message["step"] for message in index], [3, 1, 2, 0])
+        self.assertEqual(data[index[2]["offset"]:index[2]["offset"] + index[2]["length"]], self.messages[2])
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["merged.grib2", "merged.grib2.idx.json"])
+
+    def testFailedFileIsCutOff(self):
+        self.output.expect([dict(url=URL.format(i)) for i in range(2)])
+        self.output.write(URL.format(0), self.messages[0])
+        with self.assertRaises(ValueError):
+            with self.output.appending(URL.format(1)) as outfile:
+                outfile.write(self.messages[1][:20])
+                raise ValueError("bz2 stream ends early")
+        self.output.close()
+        with open(self.path, "rb") as mergedFile:
+            self.assertEqual(mergedFile.read(), self.messages[0])
+        self.assertEqual(len(gribindex.readIndex(self.path)), 1)
+
+    def testSkippedFiles(self):
+        self.output.expect([dict(url=URL.format(i)) for i in range(3)])
+        self.output.skip(URL.format(0))
+        self.output.write(URL.format(2), self.messages[2])
+        self.output.close()
+        with open(self.path, "rb") as mergedFile:
+            self.assertEqual(mergedFile.read(), self.messages[2])
+
+    def testNothingWritten(self):
+        self.output.expect([dict(url=URL.format(0))])
+        self.output.close()
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+class SinkTargetTest(unittest.TestCase):
+
+    def download(self, target, data):
+        target.begin(200, {"Content-Length": str(len(data))})
+        target.write(data)
+        return target.finish()
+
+    def testStreamedIntoTheMergedFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = MergedOutput(directory, lambda task: "merged.grib2")
+            output.expect([dict(url=URL.format(0))])
+            message = makeMessage()
+            self.download(SinkTarget(URL.format(0), output), bz2.compress(message))
+            output.close()
+            with open(os.path.join(directory, "merged.grib2"), "rb") as mergedFile:
+                self.assertEqual(mergedFile.read(), message)
+
+    def testNoPartFileOnDisk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            previous = os.getcwd()
+            os.chdir(directory)
+            try:
+                # a stray sidecar of an earlier download to the working directory
+                with open("t_2m_0.grib2.bz2.part.json", "w") as jsonfile:
+                    json.dump({"url": URL.format(0), "size": 10}, jsonfile)
+                target = SinkTarget(URL.format(0), OutputSink(io.BytesIO(), ordered=False))
+                self.assertEqual((target.part.meta, target.requestHeaders()), ({}, {}))
+                self.download(target, bz2.compress(makeMessage()))
+                self.assertEqual(os.listdir(directory), ["t_2m_0.grib2.bz2.part.json"])
+            finally:
+                os.chdir(previous)
+
+    def testBrokenPipeCancels(self):
+        target = SinkTarget(URL.format(0), OutputSink(ClosedPipe(), ordered=False))
+        target.cancelEvent = threading.Event()
+        with self.assertRaises(OutputError) as raised:
+            self.download(target, bz2.compress(makeMessage()))
+        # not retried, and the downloads still running are stopped
+        self.assertEqual(getErrorClass(raised.exception), "output")
+        self.assertTrue(target.cancelEvent.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import csv
+import os
+import tempfile
+import unittest
+
+try:
+    import numpy
+    import eccodes
+except ImportError:
+    eccodes = None
+try:
+    import scipy
+except ImportError:
+    scipy = None
+
+from gribindex import GribFormatError
+
+STATIONS = [("north", 60.2, 10.1), ("antimeridian", 0, 179.9), ("south", -89.9, 20)]
+
+
+def makeField(step=0):
+    """A global 10 degree regular_ll GRIB2 message scanned from the north, the value of a point is its index"""
+    gid = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+    try:
+        for key, value in (("Ni", 36), ("Nj", 19), ("jScansPositively", 0),
+                           ("iDirectionIncrementInDegrees", 10), ("jDirectionIncrementInDegrees", 10),
+                           ("latitudeOfFirstGridPointInDegrees", 90), ("longitudeOfFirstGridPointInDegrees", 0),
+                           ("latitudeOfLastGridPointInDegrees", -90), ("longitudeOfLastGridPointInDegrees", 350),
+                           ("numberOfDataPoints", 36 * 19), ("stepRange", step)):
+            eccodes.codes_set(gid, key, value)
+        eccodes.codes_set_values(gid, numpy.arange(36 * 19, dtype=float))
+        return eccodes.codes_get_message(gid)
+    finally:
+        eccodes.codes_release(gid)
+
+
+def makeUnstructuredField(values):
+    gid = eccodes.codes_grib_new_from_samples("GRIB2")
+    try:
+        eccodes.codes_set(gid, "gridDefinitionTemplateNumber", 101)
+        eccodes.codes_set(gid, "numberOfDataPoints", len(values))
+        eccodes.codes_set_values(gid, values)
+        return eccodes.codes_get_message(gid)
+    finally:
+        eccodes.codes_release(gid)
+
+
+@unittest.skipIf(eccodes is None, "needs the numpy and eccodes packages")
+class StationSeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "stations.csv")
+
+    def series(self, **options):
+        from stations import StationSeries
+        series = StationSeries(self.path, STATIONS, ordered=False, **options)
+        self.addCleanup(series.close)
+        return series
+
+    def read(self):
+        with open(self.path, "r", newline="", encoding="utf-8") as csvfile:
+            return list(csv.reader(csvfile, delimiter=";"))
+
+    def testNearestPointsOfARegularGrid(self):
+        rows = self.series().extract(makeField(step=3) + makeField(step=6))
+        self.assertEqual([row[4] for row in rows], ["3", "6"])
+        # rows from 90 north, columns from 0 east: the antimeridian wraps to the first column
+        self.assertEqual([float(value) for value in rows[0][6:]], [3 * 36 + 1, 9 * 36 + 18, 18 * 36 + 2])
+
+    @unittest.skipIf(scipy is None, "needs the scipy package")
+    def testNearestPointsOfTheIcosahedralGrid(self):
+        lats = numpy.array([60.0, 0.0, -89.0, 45.0])
+        lons = numpy.array([10.0, -179.5, 0.0, 90.0])
+        rows = self.series(gridCoordinates=(lats, lons)).extract(makeUnstructuredField(numpy.arange(4.0)))
+        self.assertEqual([float(value) for value in rows[0][6:]], [0, 1, 2])
+
+    def testInvalidData(self):
+        series = self.series()
+        message = makeField()
+        for data in (b"GRIB" + bytes(12), message[:-4], b"7777" + message):
+            with self.assertRaises(GribFormatError):
+                series.extract(data)
+
+    def testDownloadedAgain(self):
+        series = self.series()
+        series.write("first", makeField(step=3))
+        series.close()
+        series = self.series()
+        series.write("again", makeField(step=3) + makeField(step=6))
+        series.close()
+        rows = self.read()
+        self.assertEqual(rows[0][:7], ["param", "levelType", "level", "run", "step", "validTime", "north"])
+        self.assertEqual([row[4] for row in rows[1:]], ["3", "6"])
+
+
+if __name__ == "__main__":
+    unittest.main()
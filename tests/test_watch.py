@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import opendata_downloader
+from opendata_downloader import configure, getTaskUrl, makeResult, planGribDataSequence, watchPlan
+
+
+class Clock(object):
+    """time.time() and time.sleep() of the watch loop, sleeping only advances the time"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        self.now += seconds
+
+
+class WatchPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(configure)
+        self.addCleanup(opendata_downloader.failedFiles.clear)
+        configure(useListing=True, maxWorkers=2)
+        self.clock = Clock()
+        self.listings = {}
+        self.fetched = []
+        for target, replacement in (("getDirectoryListing", lambda url: self.listings.get(url, frozenset())),
+                                    ("fetchFile", self.fetchFile),
+                                    ("time", mock.Mock(time=lambda: self.clock.time(),
+                                                       sleep=lambda seconds: self.clock.sleep(seconds),
+                                                       monotonic=lambda: self.clock.time()))):
+            patcher = mock.patch.object(opendata_downloader, target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.plan = planGribDataSequence(model="icon-d2", grid="regular-lat-lon", param="t_2m", timeSteps=[0, 1],
+                                         levelRange=[0], levtype="single-level", timestamp=datetime(2026, 10, 15),
+                                         destFilePath=self.directory.name)
+        self.urls = [getTaskUrl(task) for task in self.plan]
+
+    def fetchFile(self, url, destFilePath=None, destFileName=None, cancelEvent=None):
+        self.fetched.append(url)
+        return makeResult(url, status="downloaded")
+
+    def publish(self, url):
+        directory, name = url.rsplit('/', 1)
+        self.listings[directory + '/'] = self.listings.get(directory + '/', frozenset()) | {name}
+
+    def testFilePublishedLate(self):
+        self.publish(self.urls[0])
+        sleep = self.clock.sleep
+
+        def publishWhileSleeping(seconds):
+            sleep(seconds)
+            self.publish(self.urls[1])
+        self.clock.sleep = publishWhileSleeping
+        with self.assertLogs(level="WARNING"):
+            results = watchPlan(self.plan, pollInterval=60, timeout=600)
+        self.assertEqual(self.fetched, self.urls)
+        # one final result per file, not one per poll
+        self.assertEqual(sorted((result["url"], result["status"]) for result in results),
+                         [(url, "downloaded") for url in sorted(self.urls)])
+        self.assertEqual(self.clock.now, 1060)
+
+    def testDeadline(self):
+        self.publish(self.urls[0])
+        with self.assertLogs(level="WARNING") as logs:
+            results = watchPlan(self.plan, pollInterval=60, timeout=150)
+        self.assertIn("Watch timeout reached", logs.output[-1])
+        self.assertEqual(self.fetched, self.urls[:1])
+        # polls at 0, 60 and 120 seconds, the next one would be past the deadline
+        self.assertEqual(self.clock.sleeps, 2)
+        self.assertEqual({result["url"]: result["status"] for result in results},
+                         {self.urls[0]: "downloaded", self.urls[1]: "unpublished"})
+
+
+if __name__ == "__main__":
+    unittest.main()